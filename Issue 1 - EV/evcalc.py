@@ -1,8 +1,15 @@
 
-import matplotlib.patches as mpatches
-from tqdm import tqdm
 import numpy as np
-import matplotlib.pyplot as plt
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+
+# bytes of random draws and bankrolls held at once, bounds memory for any number of simulations
+CHUNK_BYTES = 64 * 1024 ** 2
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
 
 
 def calculate_probability_of_outcome(target_outcome_count, total_outcome_count):
@@ -21,41 +28,112 @@ def calculate_ev(win_percentage, amount_won, amount_lost):
     return win_percentage * amount_won - (1 - win_percentage) * amount_lost
 
 
-def simulate_coin_flip(bankroll, amount_won, amount_lost, win_percent, num_tries):
-    bankrolls = [bankroll]
-    for _ in range(num_tries):
-        if np.random.rand() < win_percent:
-            bankroll += amount_won
-        else:
-            bankroll -= amount_lost
-        bankrolls.append(bankroll)
-    return bankrolls
-
-
-def monte_carlo_simulation(initial_bankroll, amount_won, amount_lost, win_percent, num_tries, num_simulations):
-    busts = 0
-    for _ in tqdm(range(num_simulations), desc="Simulating"):
-        bankrolls = simulate_coin_flip(
-            initial_bankroll, amount_won, amount_lost, win_percent, num_tries)
+def simulate_bankrolls(rng, initial_bankroll, amount_won, amount_lost, win_percent, num_tries, num_simulations):
+    """Bankroll paths of shape (num_simulations, num_tries + 1), all coin flips drawn at once"""
+    bankrolls = np.empty((num_simulations, num_tries + 1))
+    bankrolls[:, 0] = initial_bankroll
+    wins = rng.random((num_simulations, num_tries)) < win_percent
+    bankrolls[:, 1:] = np.where(wins, amount_won, -amount_lost)
+    return np.cumsum(bankrolls, axis=1, out=bankrolls)
+
+
+def chunk_sizes(num_simulations, num_tries, chunk_bytes=CHUNK_BYTES):
+    rows = max(1, chunk_bytes // (8 * (num_tries + 1)))
+    return [min(rows, num_simulations - start) for start in range(0, num_simulations, rows)]
+
+
+def run_monte_carlo(initial_bankroll, amount_won, amount_lost, win_percent, num_tries, num_simulations,
+                    seed=None, num_sample_paths=20, chunk_bytes=CHUNK_BYTES):
+    """Bust and ruin statistics of many players betting the same coin flip
+
+    Simulations run in chunks of chunk_bytes of bankrolls, only per player
+    results, the mean path and a few sample paths are kept, so 100k players
+    x 10k tries peaks at a few chunks (~200 MB) instead of 8 GB of paths.
+
+    Args:
+        seed (int): Seed of the np.random.Generator, results are reproducible
+            for the same seed and chunk_bytes
+        num_sample_paths (int): Paths kept for plotting
+
+    Returns:
+        dict: bust_probability (final bankroll <= 0, players keep betting
+            after going bust), ruin_probability (bankroll <= 0 at any try),
+            ruin_times (try of first ruin of every ruined player),
+            final_bankrolls, mean_path and sample_paths
+    """
+    rng = np.random.default_rng(seed)
+    final_bankrolls = np.empty(num_simulations)
+    ruin_times = []
+    path_sum = np.zeros(num_tries + 1)
+    sample_paths = []
+
+    chunks = chunk_sizes(num_simulations, num_tries, chunk_bytes)
+    if tqdm is not None:
+        chunks = tqdm(chunks, desc="Simulating")
+
+    done = 0
+    for size in chunks:
+        bankrolls = simulate_bankrolls(rng, initial_bankroll, amount_won, amount_lost, win_percent, num_tries, size)
+
+        is_ruined = bankrolls <= 0
+        ever_ruined = is_ruined.any(axis=1)
+        ruin_times.append(is_ruined[ever_ruined].argmax(axis=1))
+
+        final_bankrolls[done:done + size] = bankrolls[:, -1]
+        path_sum += bankrolls.sum(axis=0)
+        if len(sample_paths) < num_sample_paths:
+            sample_paths.extend(bankrolls[:num_sample_paths - len(sample_paths)].copy())
+        done += size
+
+    ruin_times = np.concatenate(ruin_times)
+    return {
+        'num_simulations': num_simulations,
+        'num_tries': num_tries,
+        'bust_probability': np.mean(final_bankrolls <= 0),
+        'ruin_probability': len(ruin_times) / num_simulations,
+        'ruin_times': ruin_times,
+        'final_bankrolls': final_bankrolls,
+        'mean_path': path_sum / num_simulations,
+        'sample_paths': np.array(sample_paths).reshape(-1, num_tries + 1)
+    }
+
+
+def summarize_monte_carlo(results, percentiles=PERCENTILES):
+    """Percentiles of the final bankroll and of the try players go bust at"""
+    ruin_times = results['ruin_times']
+    return {
+        'bust_probability': results['bust_probability'],
+        'ruin_probability': results['ruin_probability'],
+        'final_bankroll': dict(zip(percentiles, np.percentile(results['final_bankrolls'], percentiles))),
+        'ruin_time': dict(zip(percentiles, np.percentile(ruin_times, percentiles)))
+        if len(ruin_times) else {},
+    }
+
+
+def plot_equity_curves(results, initial_bankroll, amount_won, amount_lost, win_percent):
+    """Sample paths and the mean path of run_monte_carlo, with the original annotations"""
+    import matplotlib.patches as mpatches
+    import matplotlib.pyplot as plt
+
+    for bankrolls in results['sample_paths']:
         plt.plot(bankrolls, alpha=0.5)
-        if bankrolls[-1] <= 0:
-            busts += 1
+    plt.plot(results['mean_path'], color='black', linestyle='--', label='Mean')
     plt.axhline(0, color='black')
 
-    bust_percent = (busts / num_simulations) * 100
+    bust_percent = results['bust_probability'] * 100
     plt.text(0.1, 0.1, f'{bust_percent:.2f}% of simulations went bust',
              transform=plt.gca().transAxes)
 
     ev = calculate_ev(win_percent, amount_won, amount_lost)
     rr = calculate_risk_reward_ratio(amount_won, amount_lost)
 
-    info_text = f'EV: ${ev:.2f}, R:R: {rr:.2f}, Win Amount: ${
-        amount_won}, Loss Amount: ${amount_lost}, Win%: {win_percent:.2f}'
+    info_text = (f'EV: ${ev:.2f}, R:R: {rr:.2f}, Win Amount: ${amount_won}, '
+                 f'Loss Amount: ${amount_lost}, Win%: {win_percent:.2f}')
     plt.gcf().suptitle(info_text, fontsize=8)
 
     legend_elements = [mpatches.Patch(label=f'Initial Bankroll: {initial_bankroll}'),
-                       mpatches.Patch(label=f'# of Tries: {num_tries}'),
-                       mpatches.Patch(label=f'# of Players: {num_players}')]
+                       mpatches.Patch(label=f'# of Tries: {results["num_tries"]}'),
+                       mpatches.Patch(label=f'# of Players: {results["num_simulations"]}')]
 
     plt.legend(handles=legend_elements, loc='upper left')
 
@@ -65,35 +143,44 @@ def monte_carlo_simulation(initial_bankroll, amount_won, amount_lost, win_percen
     plt.gca().tick_params()
 
 
-amount_of_5_on_die = 1
-sides_of_die = 6
-probability_fraction = calculate_probability_of_outcome(
-    amount_of_5_on_die, sides_of_die)
+def monte_carlo_simulation(initial_bankroll, amount_won, amount_lost, win_percent, num_tries, num_simulations,
+                           seed=None, num_sample_paths=20):
+    results = run_monte_carlo(initial_bankroll, amount_won, amount_lost, win_percent, num_tries,
+                              num_simulations, seed, num_sample_paths)
+    plot_equity_curves(results, initial_bankroll, amount_won, amount_lost, win_percent)
+    return results
 
-as_percent = probability_fraction * 100
-print("{:.2f}% chance".format(as_percent))
 
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
 
-amount_won = 110  # risk
-amount_lost = 100  # reward
-rr = calculate_risk_reward_ratio(amount_won, amount_lost)
-print("{:.2f} units risked for every 1 unit won".format(rr))
+    amount_of_5_on_die = 1
+    sides_of_die = 6
+    probability_fraction = calculate_probability_of_outcome(
+        amount_of_5_on_die, sides_of_die)
 
+    as_percent = probability_fraction * 100
+    print("{:.2f}% chance".format(as_percent))
 
-print("{:.2f}% win needed to be breakeven".format(
-    calculate_win_percentage_needed_to_break_even(amount_lost, amount_won) * 100))
+    amount_won = 110  # risk
+    amount_lost = 100  # reward
+    rr = calculate_risk_reward_ratio(amount_won, amount_lost)
+    print("{:.2f} units risked for every 1 unit won".format(rr))
 
+    print("{:.2f}% win needed to be breakeven".format(
+        calculate_win_percentage_needed_to_break_even(amount_lost, amount_won) * 100))
 
-win_percent = 0.5
-loss_percent = 1 - win_percent
-print("EV is ${}".format(calculate_ev(
-    win_percent, amount_won, amount_lost)))
+    win_percent = 0.5
+    loss_percent = 1 - win_percent
+    print("EV is ${}".format(calculate_ev(
+        win_percent, amount_won, amount_lost)))
 
-# Run the simulation
-initial_bankroll = 100
-num_tries = 300
-num_players = 20
-monte_carlo_simulation(initial_bankroll, amount_won,
-                       amount_lost, win_percent, num_tries, num_players)
+    # Run the simulation, only the 20 sample paths are plotted
+    initial_bankroll = 100
+    num_tries = 300
+    num_players = 20
+    results = monte_carlo_simulation(initial_bankroll, amount_won,
+                                     amount_lost, win_percent, num_tries, num_players)
+    print(summarize_monte_carlo(results))
 
-plt.savefig('./equity_curves.png')
+    plt.savefig('./equity_curves.png')
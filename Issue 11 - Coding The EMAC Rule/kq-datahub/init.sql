@@ -26,4 +26,9 @@ CREATE TABLE IF NOT EXISTS ohlcv (
 );
 
 CREATE INDEX idx_coins_symbol ON coins(symbol);
-CREATE INDEX idx_ohlcv_coin_id ON ohlcv(coin_id);
\ No newline at end of file
+-- Every reader filters by coin + interval and orders by time_close, this
+-- index serves that as one sorted range scan (close included for index-only scans)
+CREATE INDEX idx_ohlcv_cid_intvl_tclose ON ohlcv(coin_id, interval, time_close) INCLUDE (close);
+
+-- One bar per coin, interval and open time, lets writers use ON CONFLICT DO NOTHING
+ALTER TABLE ohlcv ADD CONSTRAINT uq_ohlcv_cid_intvl_topen UNIQUE (coin_id, interval, time_open);
@@ -2,46 +2,24 @@ from instrument import Instrument
 
 from trading_rules import EMAC
 
+from data_sources import CachedStore
+from data_sources import CSVStore
 from data_sources import DBStore
+from data_sources import FundingReader
 from data_sources import PriceReader
 
-import pandas as pd
-import numpy as np
-
-
-# def calculate_fees_paid():
-#     return 1038.6238698915147
-
-
-# def calculate_holding_costs_paid():
-#     funding_paid = 3130.3644113437113
-#     return funding_paid
-
-
-# def calulcate_slippage_paid():
-#     return 944.2035180831953
-
-
-# def calculate_strat_post_cost_sr(pre_cost_sr):
-#     fees = calculate_fees_paid()
-#     holding_costs = calculate_holding_costs_paid()
-#     slippage = calulcate_slippage_paid()
-
-#     fake_offset = 0.09552521025869809
-#     return pre_cost_sr - fake_offset
-# return pre_cost_sr - (fees + holding_costs + slippage)
-
-
-# def calculate_strat_total_perc_returns():
-#     return 958.3412684422372
-
+from costs import calculate_post_cost_pnl
+from costs import calculate_trading_costs
+from metrics import calculate_metrics
 
-# def calculate_strat_mean_ann_perc_return():
-#     return 65.7261486248434
+from forecast_scaling import ForecastScaler
+from instrumentation import disable_profiling, enable_profiling, profiled
+from rebalancing import rebalance_positions
+from regression import load_golden
 
+import os
 
-# def calculate_strat_std_dev():
-#     return 1.8145849936803375
+import numpy as np
 
 
 # helper functions
@@ -64,44 +42,56 @@ def zero_safe_divide(a, b, epsilon=1e-9):
 
 
 # strategy specifics
-def generate_signals(trading_rule, instrument, feature_name):
+@profiled()
+def generate_signals(trading_rule, instrument, feature_name, forecast_scaler=None):
     try:
         feature_series = instrument.get_feature(feature_name)
     except ValueError as e:
         available = instrument.available_features()
         raise ValueError(f"{str(e)}. Available features: {available}")
 
-    raw_forecast = trading_rule.get_raw_forecast(feature_series)
+    raw_forecast = trading_rule.get_raw_forecast_for(instrument, feature_name)
 
-    instr_vol = calculate_vol(
-        feature_series.diff(),
-        VOL_LOOKBACK
+    instr_vol = instrument.get_ewm(
+        feature_name,
+        'std',
+        VOL_LOOKBACK,
+        VOL_MIN_PERIODS,
+        transform='diff'
     )
     vol_normalized_forecast = raw_forecast / instr_vol
 
-    abs_values = vol_normalized_forecast.abs().expanding(
-        min_periods=instrument.trading_days_in_year * 2
-    )
-    avg_abs_value = abs_values.median()
-    scaling_factor = TARGET_AVG_FORECAST / avg_abs_value
-    scaling_factor = scaling_factor.bfill()
-
-    scaled_forecast = vol_normalized_forecast * scaling_factor
+    if forecast_scaler is None:
+        forecast_scaler = ForecastScaler(
+            TARGET_AVG_FORECAST,
+            min_periods=instrument.trading_days_in_year * 2
+        )
+    scaled_forecast = forecast_scaler.scale(vol_normalized_forecast)
 
     capped_forecast = scaled_forecast.clip(lower=-20, upper=20)
     return capped_forecast
 
 
-def calculate_ideal_positions(instrument, daily_cash_risk_target, signals):
+@profiled()
+def calculate_average_positions(instrument, daily_cash_risk_target):
+    # contracts held at an average forecast, also the unit turnover is measured in
     notional_exp_1_contract = instrument.get_notional_value(contracts=1)
-    daily_instr_perc_risk = calculate_vol(
-        instrument.get_perc_returns(),
-        VOL_LOOKBACK
+    daily_instr_perc_risk = instrument.get_ewm(
+        instrument.CLOSE_COLUMN,
+        'std',
+        VOL_LOOKBACK,
+        VOL_MIN_PERIODS,
+        transform='pct_change'
     )
     daily_contract_risk = notional_exp_1_contract * daily_instr_perc_risk
 
     # scale down to account size
-    contracts_needed = daily_cash_risk_target / daily_contract_risk
+    return daily_cash_risk_target / daily_contract_risk
+
+
+@profiled()
+def calculate_ideal_positions(instrument, daily_cash_risk_target, signals):
+    contracts_needed = calculate_average_positions(instrument, daily_cash_risk_target)
 
     # absolute_avg_forecast = signals.abs().median()
     absolute_avg_forecast = TARGET_AVG_FORECAST
@@ -109,31 +99,32 @@ def calculate_ideal_positions(instrument, daily_cash_risk_target, signals):
     return ideal_pos_series.fillna(0)
 
 
+@profiled()
 def generate_rebalanced_positions(ideal_positions, rebalance_threshold):
-    rebalanced = pd.Series(index=ideal_positions.index, dtype=float)
-    for idx in ideal_positions.index:
-        if idx == ideal_positions.index[0]:
-            rebalanced[idx] = ideal_positions[idx]
-            continue
-
-        prev_pos = ideal_positions.index.get_loc(idx) - 1
-        current_position = rebalanced.iloc[prev_pos]
-        if pd.isna(current_position):
-            current_position = 0
-
-        deviation = zero_safe_divide(
-            abs(ideal_positions[idx] - current_position),
-            abs(ideal_positions[idx])
-        )
-        rebalanced[idx] = ideal_positions[idx] if deviation > rebalance_threshold else current_position
-    return rebalanced
+    # path dependent, so the loop lives in rebalancing.py on raw arrays
+    return rebalance_positions(ideal_positions, rebalance_threshold)
 
 
+@profiled()
 def calculate_pnl(instrument, rebalanced_positions):
     pnl = instrument.get_raw_returns() * rebalanced_positions.shift(1)
-    return pnl.fillna(0)
+    # bars before an instrument's first price stay out of the SR statistics
+    is_listed = instrument.get_feature(instrument.CLOSE_COLUMN).notna()
+    return pnl.fillna(0).where(is_listed)
 
 
+@profiled()
+def calculate_costs(instrument, rebalanced_positions, funding_rates=None, funding_positions=None):
+    return calculate_trading_costs(
+        instrument.get_feature(instrument.CLOSE_COLUMN),
+        rebalanced_positions,
+        funding_rates,
+        funding_positions,
+        contract_unit=instrument.contract_unit
+    )
+
+
+@profiled()
 def calculate_strat_pre_cost_sr(instrument, trading_capital, rebalanced_positions):
     raw_pnl = calculate_pnl(instrument, rebalanced_positions)
 
@@ -146,8 +137,29 @@ def calculate_strat_pre_cost_sr(instrument, trading_capital, rebalanced_position
     return annualized_sr
 
 
+@profiled()
+def calculate_strat_metrics(instrument, trading_capital, daily_cash_risk_target, rebalanced_positions, trading_costs):
+    pre_cost_pnl = calculate_pnl(instrument, rebalanced_positions)
+    return calculate_metrics(
+        pre_cost_pnl,
+        calculate_post_cost_pnl(pre_cost_pnl, trading_costs),
+        trading_capital,
+        instrument.trading_days_in_year,
+        positions=rebalanced_positions,
+        average_positions=calculate_average_positions(instrument, daily_cash_risk_target),
+        vol_lookback=VOL_LOOKBACK,
+        vol_min_periods=VOL_MIN_PERIODS
+    )
+
+
 TARGET_AVG_FORECAST = 10.0
 VOL_LOOKBACK = 35  # EMA
+VOL_MIN_PERIODS = 10
+
+PRICE_CACHE_DIR = '.price_cache'
+
+# set to a path prefix to write <prefix>.json and <prefix>.trace.json of the run below
+PROFILE_ENV_VAR = 'BACKTEST_PROFILE'
 
 
 if __name__ == "__main__":
@@ -156,7 +168,12 @@ if __name__ == "__main__":
     symbolname = 'BTC'
     feature_name = 'close'
 
-    db_store = DBStore()
+    profile_prefix = os.environ.get(PROFILE_ENV_VAR)
+    if profile_prefix:
+        enable_profiling(trace_memory=True)
+
+    # local columnar copy, only bars newer than the cached ones hit the DB
+    db_store = CachedStore(DBStore(), PRICE_CACHE_DIR)
     db_reader = PriceReader(db_store, index_column=0, price_column=1)
     price_series = db_reader.fetch_price_series(symbolname, trading_frequency)
 
@@ -171,19 +188,35 @@ if __name__ == "__main__":
         test_price_data_integrity,
         test_raw_forecast_validity,
         test_scaled_forecast_properties,
+        test_forecast_scaler,
+        test_feature_cache,
+        test_fetch_many_matches_single,
+        test_forecast_combiner,
+        test_streaming_matches_batch,
         test_position_rebalancing,
+        test_rebalancing_backends,
+        test_trading_costs,
+        test_costs_match_row_loop,
+        test_strategy_metrics,
         check_positions_against_expected
     )
 
     print("Testing price data integrity...")
     test_price_data_integrity(instrument.get_feature(feature_name), trading_frequency)
 
+    print("Testing bulk fetches...")
+    symbols = db_store.store.fetch_symbols()[:5]
+    for store in (db_store.store, DBStore(read_mode='copy'), db_store):
+        test_fetch_many_matches_single(store, symbols, trading_frequency)
+
     print("Testing raw forecast generation...")
     fast_lookback = 8
     slow_lookback = fast_lookback * 4
     emac = EMAC(fast_lookback, slow_lookback)
     raw_forecast = emac.get_raw_forecast(instrument.get_feature(feature_name))
     test_raw_forecast_validity(raw_forecast, price_series)
+    test_feature_cache(instrument, feature_name, VOL_LOOKBACK)
+    test_streaming_matches_batch(instrument, feature_name, fast_lookback, slow_lookback, VOL_LOOKBACK)
 
     print("Testing scaled forecast properties...")
     signals = generate_signals(emac, instrument, feature_name)
@@ -192,6 +225,14 @@ if __name__ == "__main__":
         expected_abs_avg=TARGET_AVG_FORECAST,
         dev_threshold=0.10
     )
+    vol_normalized_forecast = raw_forecast / calculate_vol(
+        instrument.get_feature(feature_name).diff(),
+        VOL_LOOKBACK
+    )
+    test_forecast_scaler(vol_normalized_forecast, TARGET_AVG_FORECAST, instrument.trading_days_in_year * 2)
+
+    print("Testing forecast combination...")
+    test_forecast_combiner(instrument, feature_name)
 
    # Step 1: Annual risk target
     account_balance = 10_000
@@ -213,7 +254,7 @@ if __name__ == "__main__":
         daily_cash_risk_target,
         signals
     )
-    expected_ideal_positions = pd.read_csv('ideal_pos_contracts.csv')
+    expected_ideal_positions = load_golden('ideal_pos_contracts')
     check_positions_against_expected(
         ideal_positions,
         expected_ideal_positions,
@@ -233,6 +274,7 @@ if __name__ == "__main__":
         instrument.get_feature(feature_name),
         rebalance_err_threshold
     )
+    test_rebalancing_backends(ideal_positions, rebalance_err_threshold)
 
     print("Testing strategy metrics...")
     pre_cost_sr = calculate_strat_pre_cost_sr(
@@ -246,9 +288,37 @@ if __name__ == "__main__":
         rtol=0.01
     ), "Pre-Cost SR differ by more than 1%"
     # assert pre_cost_sr == 1.6785643249186135, f"Pre-cost Sharpe Ratio {pre_cost_sr} does not match expected value."
-    exit()
 
-    # print("Testing trading costs...")
-    # test_trading_costs()
+    print("Testing trading costs...")
+    funding_reader = FundingReader(CSVStore('.'), index_column='time_close', rate_column='fundingRate')
+    funding_rates = funding_reader.fetch_funding_series(symbolname, trading_frequency)
+    # backtest.py charges funding on the ideal rather than the held position
+    trading_costs = calculate_costs(instrument, rebalanced_positions, funding_rates, funding_positions=ideal_positions)
+    test_trading_costs(trading_costs)
+    test_costs_match_row_loop(
+        instrument.get_feature(feature_name),
+        ideal_positions,
+        funding_rates,
+        rebalance_err_threshold,
+        trading_costs
+    )
+
+    print("Testing strategy metrics after costs...")
+    strat_metrics = calculate_strat_metrics(
+        instrument,
+        account_balance,
+        daily_cash_risk_target,
+        rebalanced_positions,
+        trading_costs
+    )
+    print(strat_metrics.to_frame().T)
+    test_strategy_metrics(strat_metrics, pre_cost_sr)
+
+    if profile_prefix:
+        profiler = disable_profiling()
+        profiler.to_json(f"{profile_prefix}.json")
+        profiler.to_chrome_trace(f"{profile_prefix}.trace.json")
+        print(profiler.summary())
+    exit()
 
     # print("All tests passed successfully!")
@@ -0,0 +1,218 @@
+from backtest_refactored import (
+    calculate_annual_risk_target,
+    calculate_daily_risk_target,
+    calculate_ideal_positions,
+    calculate_pnl,
+    generate_rebalanced_positions,
+    generate_signals
+)
+
+from feature_cache import FeatureCache, cached_ewm
+
+import numpy as np
+import pandas as pd
+
+
+STORAGE_DTYPES = ('float64', 'float32')
+
+# float32 keeps ~7 significant digits. Measured against the float64 path,
+# signals, positions and pnl stay within FLOAT32_RTOL x the quantity's mean
+# absolute value (relative errors near a zero crossing of the signal are
+# meaningless). Rebalancing is path dependent, a bar whose deviation sits
+# within rounding of the threshold can trade in one mode and not the other.
+FLOAT32_RTOL = 1e-4
+
+# float64 bytes of one column chunk's prices. The stages hold about ten times
+# a chunk in temporaries, instead of ten times the whole universe
+CHUNK_BYTES = 128 * 1024
+STAGE_QUANTITIES = ('signal', 'ideal_position', 'rebalanced_position', 'pnl')
+
+
+class BacktestState:
+    """All quantities of a universe backtest on one shared time axis
+
+    Every quantity (prices, signals, positions, pnl) is a single column-major
+    (bars, instruments) block, the DatetimeIndex and symbols exist once.
+    Column-major is pandas' own layout, so frames in and out are views and
+    column chunks are contiguous. Blocks can be stored as float32 to halve
+    memory, calculations still run in float64 on upcast copies of a few
+    columns at a time, see FLOAT32_RTOL and run_state_backtest.
+
+    Mirrors the Instrument and Universe interface, so the stage functions of
+    backtest_refactored run on it unchanged.
+    """
+    CLOSE_COLUMN = 'close'
+
+    def __init__(self, name, index, symbols, trading_days_in_year, contract_unit, dtype='float64',
+                 feature_cache=None):
+        """
+        Args:
+            name (str): Name of the state, keys the feature cache
+            index (pd.DatetimeIndex): Time axis shared by every block
+            symbols (list): One entry per instrument column
+            trading_days_in_year (int): Shared by all instruments
+            contract_unit (float | pd.Series): Scalar or one value per symbol
+            dtype (str): Storage type of the blocks, 'float64' or 'float32'
+            feature_cache (FeatureCache): Optional cache shared with other states
+        """
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage dtype '{dtype}'. Available dtypes: {list(STORAGE_DTYPES)}")
+        self.name = name
+        self.index = index
+        self.symbols = list(symbols)
+        self.trading_days_in_year = trading_days_in_year
+        self.contract_unit = contract_unit
+        self.dtype = np.dtype(dtype)
+        self.feature_cache = feature_cache if feature_cache is not None else FeatureCache()
+        self._blocks = {}
+
+    @classmethod
+    def from_price_frame(cls, name, price_frame, trading_days_in_year, contract_unit, dtype='float64',
+                         feature_name=CLOSE_COLUMN):
+        state = cls(name, price_frame.index, price_frame.columns, trading_days_in_year, contract_unit, dtype)
+        state.set_block(feature_name, price_frame)
+        return state
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.symbols)
+
+    def set_block(self, name, values):
+        """Store a quantity, a DataFrame is checked against the state's axes
+
+        Values already in the storage dtype and column-major are adopted
+        without a copy, e.g. a float64 price frame or a column slice of
+        another state's block.
+        """
+        if isinstance(values, pd.DataFrame):
+            if not values.index.equals(self.index) or list(values.columns) != self.symbols:
+                raise ValueError(f"Block '{name}' does not match the time axis and symbols of {self.name}")
+            values = values.to_numpy()
+
+        block = np.asarray(values, dtype=self.dtype, order='F')
+        if block.shape != self.shape:
+            raise ValueError(f"Block '{name}' has shape {block.shape}, expected {self.shape}")
+        self._blocks[name] = block
+
+    def allocate_block(self, name):
+        """Store an all-NaN quantity, filled column chunk by column chunk with set_columns"""
+        self._blocks[name] = np.full(self.shape, np.nan, dtype=self.dtype, order='F')
+
+    def set_columns(self, name, columns, values):
+        """Write values (bars, len(columns)) into the columns slice of a stored quantity"""
+        if isinstance(values, pd.DataFrame):
+            values = values.to_numpy()
+        self.get_block(name)[:, columns] = values
+
+    def column_chunk(self, columns, feature_names):
+        """float64 state of a slice of the symbols holding only the given features, views of float64 blocks"""
+        symbols = self.symbols[columns]
+        contract_unit = self.contract_unit
+        if isinstance(contract_unit, pd.Series):
+            contract_unit = contract_unit.reindex(symbols)
+
+        # a chunk runs each stage once, caching its EWMs would only hold them longer
+        chunk = BacktestState(
+            f"{self.name}[{columns.start}:{columns.stop}]", self.index, symbols,
+            self.trading_days_in_year, contract_unit, feature_cache=FeatureCache(max_entries=0)
+        )
+        for feature_name in feature_names:
+            chunk.set_block(feature_name, self.get_block(feature_name)[:, columns])
+        return chunk
+
+    def get_block(self, name):
+        """Raw stored array of a quantity
+
+        Raises:
+            ValueError: If the quantity doesn't exist
+        """
+        if name not in self._blocks:
+            raise ValueError(f"Quantity '{name}' not available for {self.name}. Available quantities: {list(self._blocks)}")
+        return self._blocks[name]
+
+    def to_frame(self, name):
+        """Quantity as a DataFrame, a view without copying for float64 storage"""
+        return pd.DataFrame(
+            self.get_block(name).astype(float, copy=False),
+            index=self.index,
+            columns=self.symbols,
+            copy=False
+        )
+
+    def nbytes(self):
+        """Bytes held by the blocks and the shared time axis"""
+        return sum(block.nbytes for block in self._blocks.values()) + self.index.nbytes
+
+    # Instrument interface
+    def get_notional_value(self, contracts):
+        return contracts * self.get_feature(self.CLOSE_COLUMN) * self.contract_unit
+
+    def get_raw_returns(self):
+        return self.get_feature(self.CLOSE_COLUMN).diff()
+
+    def get_perc_returns(self):
+        return self.get_feature(self.CLOSE_COLUMN).pct_change().dropna(how='all')
+
+    def get_feature(self, feature_name):
+        """Get a quantity for all instruments, e.g. close prices
+
+        Raises:
+            ValueError: If feature doesn't exist
+        """
+        return self.to_frame(feature_name)
+
+    def get_ewm(self, feature_name, statistic, span, min_periods, transform=None):
+        """Exponentially weighted statistic of a feature for all instruments, see Instrument.get_ewm"""
+        return cached_ewm(
+            self.feature_cache, self.name, self.get_feature,
+            feature_name, statistic, span, min_periods, transform
+        )
+
+    def available_features(self):
+        """List all quantities stored in this state"""
+        return list(self._blocks)
+
+
+def run_state_backtest(trading_rule, state, feature_name, account_balance, ann_perc_risk_target,
+                       rebalance_threshold, symbols_per_chunk=None):
+    """Run the pipeline on a BacktestState, storing each stage as a block
+
+    Adds the quantities 'signal', 'ideal_position', 'rebalanced_position'
+    and 'pnl'. Every stage is column-wise, so the pipeline runs on one
+    float64 column chunk at a time and writes its results straight into
+    preallocated blocks of the storage dtype. Signals, the stage with the
+    most temporaries, run in a first pass while only their own block
+    exists. Positions and pnl follow in a second pass, reading the stored
+    signals back as float64.
+
+    Args:
+        symbols_per_chunk (int): Columns per chunk, defaults to CHUNK_BYTES of prices
+    """
+    ann_cash_risk_target = calculate_annual_risk_target(account_balance, ann_perc_risk_target)
+    daily_cash_risk_target = calculate_daily_risk_target(ann_cash_risk_target, state.trading_days_in_year)
+
+    n_bars, n_symbols = state.shape
+    symbols_per_chunk = symbols_per_chunk or max(1, CHUNK_BYTES // (8 * max(n_bars, 1)))
+    chunks = [
+        slice(start, min(start + symbols_per_chunk, n_symbols))
+        for start in range(0, n_symbols, symbols_per_chunk)
+    ]
+
+    state.allocate_block('signal')
+    for columns in chunks:
+        chunk = state.column_chunk(columns, {feature_name})
+        state.set_columns('signal', columns, generate_signals(trading_rule, chunk, feature_name))
+        del chunk
+
+    for name in STAGE_QUANTITIES[1:]:
+        state.allocate_block(name)
+    for columns in chunks:
+        chunk = state.column_chunk(columns, {state.CLOSE_COLUMN, 'signal'})
+        ideal_positions = calculate_ideal_positions(chunk, daily_cash_risk_target, chunk.get_feature('signal'))
+        state.set_columns('ideal_position', columns, ideal_positions)
+        rebalanced_positions = generate_rebalanced_positions(ideal_positions, rebalance_threshold)
+        del ideal_positions
+        state.set_columns('rebalanced_position', columns, rebalanced_positions)
+        state.set_columns('pnl', columns, calculate_pnl(chunk, rebalanced_positions))
+        del chunk, rebalanced_positions
+    return state
@@ -0,0 +1,61 @@
+"""Compare DBStore read modes on one (large) symbol/interval
+
+Run from the issue directory: python -m benchmarks.db_read [SYMBOL] [INTERVAL]
+"""
+import sys
+import time
+import tracemalloc
+
+from data_sources import DBStore
+
+import pandas as pd
+
+
+def measure_read(store, symbol, frequency):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = store.fetch_raw_data(symbol, frequency)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+def benchmark_read_modes(symbol, frequency, repeats=3):
+    results = []
+    frames = {}
+    for read_mode in DBStore.READ_MODES:
+        store = DBStore(read_mode=read_mode)
+        store.fetch_symbols()  # open the pool outside the timed region
+
+        timings = []
+        for _ in range(repeats):
+            df, elapsed, peak = measure_read(store, symbol, frequency)
+            timings.append(elapsed)
+        store.close()
+
+        frames[read_mode] = df
+        results.append({
+            'read_mode': read_mode,
+            'rows': len(df),
+            'best_seconds': min(timings),
+            'peak_mb': peak / 1024 ** 2,
+            'frame_mb': df.memory_usage(deep=True).sum() / 1024 ** 2
+        })
+
+    # both paths must deliver the same prices
+    fetchall, copy = frames['fetchall'], frames['copy']
+    pd.testing.assert_series_equal(
+        pd.to_datetime(fetchall[0]), pd.to_datetime(copy[0]), check_dtype=False, check_names=False
+    )
+    pd.testing.assert_series_equal(fetchall[1].astype(float), copy[1].astype(float), check_names=False)
+
+    return pd.DataFrame(results).set_index('read_mode')
+
+
+if __name__ == "__main__":
+    symbol = sys.argv[1] if len(sys.argv) > 1 else 'BTC'
+    frequency = sys.argv[2] if len(sys.argv) > 2 else '1h'
+
+    print(f"Reading {symbol} {frequency} with every DBStore read mode...")
+    print(benchmark_read_modes(symbol, frequency).to_string(float_format='{:.3f}'.format))
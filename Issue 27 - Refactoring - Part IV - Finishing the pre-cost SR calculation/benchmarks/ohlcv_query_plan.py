@@ -0,0 +1,95 @@
+"""Show the ohlcv read plan with and without the range scan index
+
+The 'before' plan is taken inside a transaction that restores the
+pre-migration indexes, (coin_id) and (coin_id, interval), drops the range
+scan index and the unique bar constraint, and is rolled back afterwards.
+The DDL holds an exclusive lock on ohlcv until the rollback and builds two
+indexes, run this against a research copy, not a live ingest.
+
+Run from the issue directory: python -m benchmarks.ohlcv_query_plan [SYMBOL] [INTERVAL]
+"""
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+import psycopg2
+
+
+RANGE_SCAN_INDEX = 'idx_ohlcv_cid_intvl_tclose'
+UNIQUE_BAR_CONSTRAINT = 'uq_ohlcv_cid_intvl_topen'
+
+# the indexes migrations/001_ohlcv_range_scan_index.sql replaces
+PRE_MIGRATION_SCHEMA = (
+    "CREATE INDEX IF NOT EXISTS idx_ohlcv_coin_id ON ohlcv(coin_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ohlcv_cid_intvl_composite ON ohlcv(coin_id, interval)",
+    f"DROP INDEX {RANGE_SCAN_INDEX}",
+    f"ALTER TABLE ohlcv DROP CONSTRAINT {UNIQUE_BAR_CONSTRAINT}",
+)
+
+READ_QUERY = """
+    SELECT ohlcv.time_close, ohlcv.close
+    FROM ohlcv
+    JOIN coins ON ohlcv.coin_id = coins.id
+    WHERE coins.symbol = %s
+    AND ohlcv.interval = %s
+    ORDER BY ohlcv.time_close ASC
+"""
+
+
+def explain(cur, symbol, frequency):
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {READ_QUERY}", (symbol, frequency))
+    plan = cur.fetchone()[0]
+    return plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+
+
+def plan_node_types(node):
+    node_types = [node['Node Type']]
+    for child in node.get('Plans', []):
+        node_types.extend(plan_node_types(child))
+    return node_types
+
+
+def summarize(label, plan):
+    node_types = plan_node_types(plan['Plan'])
+    print(f"{label:<8} execution {plan['Execution Time']:>10.2f} ms   "
+          f"explicit sort: {'Sort' in node_types}   nodes: {' -> '.join(node_types)}")
+
+
+def compare_plans(conn, symbol, frequency):
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", (RANGE_SCAN_INDEX,))
+        if cur.fetchone() is None:
+            raise RuntimeError(f"{RANGE_SCAN_INDEX} not found, apply migrations/001_ohlcv_range_scan_index.sql first")
+
+        # warm the buffer cache so both plans read from memory
+        cur.execute(READ_QUERY, (symbol, frequency))
+        cur.fetchall()
+
+        after = explain(cur, symbol, frequency)
+        for statement in PRE_MIGRATION_SCHEMA:
+            cur.execute(statement)
+        before = explain(cur, symbol, frequency)
+    conn.rollback()
+    return before, after
+
+
+if __name__ == "__main__":
+    symbol = sys.argv[1] if len(sys.argv) > 1 else 'BTC'
+    frequency = sys.argv[2] if len(sys.argv) > 2 else '1h'
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        dbname=os.environ.get("DB_DB"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PW"),
+        host=os.environ.get("DB_HOST"),
+        port=os.environ.get("DB_PORT")
+    )
+
+    before, after = compare_plans(conn, symbol, frequency)
+    conn.close()
+
+    print(f"Plans for {symbol} {frequency}:")
+    summarize('before', before)
+    summarize('after', after)
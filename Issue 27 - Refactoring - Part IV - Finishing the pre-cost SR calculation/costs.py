@@ -0,0 +1,72 @@
+import pandas as pd
+
+
+# ByBit perp & futures taker fee, in percent
+FEE_PERC = 0.055
+SLIPPAGE_PERC = 0.05
+
+COST_COLUMNS = ['fees_paid', 'slippage_paid', 'funding_paid', 'total_costs']
+
+
+def calculate_trades(rebalanced_positions):
+    """Contracts traded per bar, the first bar and bars without a position trade nothing"""
+    positions = rebalanced_positions.fillna(0)
+    return positions.diff().fillna(0)
+
+
+def align_funding(funding_rates, index):
+    """Per bar funding rates on the price index, bars without a settlement pay nothing"""
+    if funding_rates is None:
+        return pd.Series(0.0, index=index)
+    return funding_rates.reindex(index).fillna(0)
+
+
+def calculate_trading_costs(prices, rebalanced_positions, funding_rates=None, funding_positions=None,
+                            contract_unit=1, fee_perc=FEE_PERC, slippage_perc=SLIPPAGE_PERC):
+    """Fees, slippage and funding paid per bar as whole-array operations
+
+    Same cost model as the row loop in backtest.py: every traded contract pays
+    the fee on its notional and slippage_perc of the close, and the notional
+    held over a bar pays that bar's summed funding rate.
+
+    Works on a Series (one instrument) or on DataFrames with one column per
+    instrument, funding_rates then needs the same columns.
+
+    Args:
+        prices (pd.Series | pd.DataFrame): Close prices
+        rebalanced_positions (pd.Series | pd.DataFrame): Contracts held after rebalancing
+        funding_rates (pd.Series | pd.DataFrame): Funding rate per bar, e.g. from FundingReader
+        funding_positions (pd.Series | pd.DataFrame): Contracts funding is charged on, defaults to
+            rebalanced_positions, backtest.py charged the ideal positions
+        fee_perc (float): Fee in percent of the traded notional
+        slippage_perc (float): Slippage in percent of the close per traded contract
+
+    Returns:
+        pd.DataFrame: COST_COLUMNS, with (cost, instrument) columns for 2-D inputs
+    """
+    if funding_positions is None:
+        funding_positions = rebalanced_positions
+
+    contracts_traded = calculate_trades(rebalanced_positions).abs()
+    notional_per_contract = prices * contract_unit
+
+    traded_notional = contracts_traded * notional_per_contract
+    fees_paid = traded_notional * (fee_perc / 100)
+    slippage_paid = traded_notional * (slippage_perc / 100)
+
+    held_notional = (funding_positions * notional_per_contract).shift(1)
+    funding_paid = held_notional * align_funding(funding_rates, prices.index)
+
+    costs = {
+        'fees_paid': fees_paid,
+        'slippage_paid': slippage_paid,
+        'funding_paid': funding_paid,
+    }
+    costs['total_costs'] = fees_paid + slippage_paid + funding_paid.fillna(0)
+    return pd.concat(costs, axis=1)
+
+
+def calculate_post_cost_pnl(pre_cost_pnl, trading_costs):
+    """Pre-cost pnl net of every cost, bars without pnl stay empty"""
+    return pre_cost_pnl - trading_costs['total_costs'].where(pre_cost_pnl.notna())
+
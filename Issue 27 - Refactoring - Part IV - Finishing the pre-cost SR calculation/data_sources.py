@@ -1,9 +1,25 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import json
 import pandas as pd
 import psycopg2
+import psycopg2.pool
 import os
+import threading
 from dotenv import load_dotenv
 
+from instrumentation import profiled
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+COPY_CHUNK_ROWS = 100_000
+
 
 class DataStoreError(Exception):
     """Base exception for all data store errors"""
@@ -15,8 +31,20 @@ class NoDataFoundError(DataStoreError):
     pass
 
 
+def describe_fetch(store, symbol, frequency):
+    return {'symbol': symbol, 'frequency': frequency}
+
+
 # Abstract interface for data stores - defines minimal contract
 class DataStore(ABC):
+    def __init_subclass__(cls, **kwargs):
+        # every store's fetch shows up in a profile, without touching its implementation
+        super().__init_subclass__(**kwargs)
+        if 'fetch_raw_data' in cls.__dict__:
+            cls.fetch_raw_data = profiled(
+                f"{cls.__name__}.fetch_raw_data", 'data', describe_fetch
+            )(cls.__dict__['fetch_raw_data'])
+
     @abstractmethod
     def fetch_raw_data(self, symbol, frequency):
         """Implementation specific data fetching"""
@@ -29,34 +57,222 @@ class DataStore(ABC):
             raise NoDataFoundError(f"No data found for symbol '{symbol}' with frequency '{frequency}'")
         return data
 
+    def fetch_many(self, symbols, frequency):
+        """Fetch several symbols, stores with a bulk query should override this"""
+        return {symbol: self.fetch_raw_data(symbol, frequency) for symbol in symbols}
+
+    def fetch_many_with_validation(self, symbols, frequency):
+        """Drops symbols without data, fails only if none of them has data"""
+        raw_frames = self.fetch_many(symbols, frequency)
+        missing = [symbol for symbol in symbols if raw_frames.get(symbol) is None or raw_frames[symbol].empty]
+        if len(missing) == len(symbols):
+            raise NoDataFoundError(f"No data found for any of {len(symbols)} symbols with frequency '{frequency}'")
+        if missing:
+            print(f"\nWarning: No data found for {len(missing)} symbols with frequency '{frequency}': {missing}")
+        return {symbol: raw_frames[symbol] for symbol in symbols if symbol not in missing}
+
+    def fetch_raw_data_since(self, symbol, frequency, since, index_column=0):
+        """Rows with index_column strictly after since, stores that can filter remotely should override this"""
+        data = self.fetch_raw_data(symbol, frequency)
+        if data.empty:
+            return data
+        is_newer = pd.to_datetime(data[index_column]).dt.tz_localize(None) > since
+        return data[is_newer.to_numpy()].reset_index(drop=True)
+
+    def fetch_many_since(self, symbols, frequency, since, index_column=0):
+        """fetch_raw_data_since for several symbols, stores with a bulk query should override this"""
+        return {symbol: self.fetch_raw_data_since(symbol, frequency, since, index_column) for symbol in symbols}
+
 
 # Concrete implementation for DB access - only responsible for DB operations
 class DBStore(DataStore):
+    READ_MODES = ('fetchall', 'copy')
+
+    def __init__(self, min_connections=1, max_connections=4, read_mode='fetchall'):
+        """
+        Args:
+            min_connections (int): Connections the pool keeps open
+            max_connections (int): Upper bound of pooled connections
+            read_mode (str): 'fetchall' materializes rows as tuples, 'copy' streams
+                COPY ... TO STDOUT as CSV into the parser chunk by chunk
+        """
+        if read_mode not in self.READ_MODES:
+            raise ValueError(f"Unknown read mode '{read_mode}'. Available modes: {list(self.READ_MODES)}")
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.read_mode = read_mode
+        self._pool = None
+
+    def _get_pool(self):
+        # created lazily and kept alive, so repeated fetches skip the connect handshake
+        if self._pool is None or self._pool.closed:
+            load_dotenv()
+
+            self._pool = psycopg2.pool.ThreadedConnectionPool(
+                self.min_connections,
+                self.max_connections,
+                dbname=os.environ.get("DB_DB"),
+                user=os.environ.get("DB_USER"),
+                password=os.environ.get("DB_PW"),
+                host=os.environ.get("DB_HOST"),
+                port=os.environ.get("DB_PORT")
+            )
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection, committed on success and rolled back on error"""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+    def query(self, sql, params):
+        """Run a parameterized query on a pooled connection and return all rows"""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def _read_frame(self, sql, params, date_columns, text_columns=()):
+        if self.read_mode == 'copy':
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    select = cur.mogrify(sql.strip().rstrip(';'), params).decode()
+                    return stream_copy_csv(
+                        cur,
+                        f"COPY ({select}) TO STDOUT WITH (FORMAT csv)",
+                        date_columns,
+                        text_columns
+                    )
+        return pd.DataFrame(self.query(sql, params))
+
+    def close(self):
+        if self._pool is not None and not self._pool.closed:
+            self._pool.closeall()
+
     def fetch_raw_data(self, symbol, frequency):
-        load_dotenv()
-
-        conn = psycopg2.connect(
-            dbname=os.environ.get("DB_DB"),
-            user=os.environ.get("DB_USER"),
-            password=os.environ.get("DB_PW"),
-            host=os.environ.get("DB_HOST"),
-            port=os.environ.get("DB_PORT")
-        )
+        return self._read_frame("""
+            SELECT ohlcv.time_close, ohlcv.close
+            FROM ohlcv
+            JOIN coins ON ohlcv.coin_id = coins.id
+            WHERE coins.symbol = %s
+            AND ohlcv.interval = %s
+            ORDER BY ohlcv.time_close ASC;
+        """, (symbol, frequency), date_columns=[0])
 
-        cur = conn.cursor()
-        cur.execute(f"""
+    def fetch_raw_data_since(self, symbol, frequency, since, index_column=0):
+        return self._read_frame("""
             SELECT ohlcv.time_close, ohlcv.close
             FROM ohlcv
             JOIN coins ON ohlcv.coin_id = coins.id
-            WHERE coins.symbol = '{symbol}'
-            AND ohlcv.interval = '{frequency}'
+            WHERE coins.symbol = %s
+            AND ohlcv.interval = %s
+            AND ohlcv.time_close > %s
             ORDER BY ohlcv.time_close ASC;
-        """)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        """, (symbol, frequency, since.to_pydatetime()), date_columns=[0])
+
+    def fetch_many_since(self, symbols, frequency, since, index_column=0):
+        """One round-trip for all symbols' bars after since, e.g. to top up a warm cache"""
+        rows = self._read_frame("""
+            SELECT coins.symbol, ohlcv.time_close, ohlcv.close
+            FROM ohlcv
+            JOIN coins ON ohlcv.coin_id = coins.id
+            WHERE coins.symbol = ANY(%s)
+            AND ohlcv.interval = %s
+            AND ohlcv.time_close > %s
+            ORDER BY coins.symbol ASC, ohlcv.time_close ASC;
+        """, (list(symbols), frequency, since.to_pydatetime()), date_columns=[1], text_columns=[0])
+
+        return split_rows_by_symbol(rows, symbols)
+
+    def fetch_many(self, symbols, frequency):
+        """One round-trip for all symbols, split client-side into fetch_raw_data shaped frames"""
+        rows = self._read_frame("""
+            SELECT coins.symbol, ohlcv.time_close, ohlcv.close
+            FROM ohlcv
+            JOIN coins ON ohlcv.coin_id = coins.id
+            WHERE coins.symbol = ANY(%s)
+            AND ohlcv.interval = %s
+            ORDER BY coins.symbol ASC, ohlcv.time_close ASC;
+        """, (list(symbols), frequency), date_columns=[1], text_columns=[0])
+
+        return split_rows_by_symbol(rows, symbols)
+
+    def fetch_symbols(self):
+        """List the symbols of all active coins"""
+        rows = self.query("""
+            SELECT DISTINCT symbol
+            FROM coins
+            WHERE is_active = 1
+            ORDER BY symbol ASC;
+        """, None)
+
+        return [row[0] for row in rows]
+
+
+def split_rows_by_symbol(rows, symbols):
+    """(symbol, *values) rows or frame -> {symbol: DataFrame of values}, empty frames for symbols without rows"""
+    raw_frames = {symbol: pd.DataFrame() for symbol in symbols}
+    if len(rows) == 0:
+        return raw_frames
+
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    for symbol, group in df.groupby(0, sort=False):
+        values = group.drop(columns=0).reset_index(drop=True)
+        values.columns = range(values.shape[1])
+        raw_frames[symbol] = values
+    return raw_frames
+
+
+def stream_copy_csv(cur, copy_sql, date_columns=(), text_columns=(), chunk_rows=COPY_CHUNK_ROWS):
+    """Parse the CSV output of a COPY ... TO STDOUT while it is still streaming
+
+    copy_expert writes into a pipe on a background thread and pandas parses
+    the other end in chunks, so rows never exist as Python tuples and the
+    raw text is never held in full.
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
 
-        return pd.DataFrame(rows)
+    def produce():
+        try:
+            # flushing on close fails too once the reader is gone
+            with os.fdopen(write_fd, 'wb') as writer:
+                cur.copy_expert(copy_sql, writer)
+        except Exception as e:  # re-raised in the calling thread
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    chunks = []
+    reader = os.fdopen(read_fd, 'rb')
+    try:
+        dtypes = {column: str for column in text_columns}
+        for chunk in pd.read_csv(reader, header=None, dtype=dtypes, chunksize=chunk_rows):
+            for column in date_columns:
+                chunk[column] = pd.to_datetime(chunk[column])
+            chunks.append(chunk)
+    except pd.errors.EmptyDataError:
+        pass
+    finally:
+        # on a parse error closing the reader breaks the producer's pipe, the cursor's
+        # connection must not go back to the pool while its COPY is still running
+        reader.close()
+        producer.join()
+
+    if errors:
+        raise errors[0]
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
 
 
 # Concrete implementation for CSV access - only responsible for file operations
@@ -72,6 +288,115 @@ class CSVStore(DataStore):
             return pd.DataFrame()  # Return empty DataFrame to trigger NoDataFoundError
 
 
+# Decorator around any store - keeps a columnar copy per symbol/frequency on disk
+class CachedStore(DataStore):
+    FILE_FORMATS = ('arrow', 'parquet')
+    COLUMNS_METADATA_KEY = b'raw_columns'
+
+    def __init__(self, store, cache_dir, index_column=0, file_format='arrow'):
+        """
+        Args:
+            store (DataStore): Store the cache is filled from
+            cache_dir (str): Directory holding one file per symbol/frequency
+            index_column: Column with the bar close time, used to fetch only newer rows
+            file_format (str): 'arrow' (IPC, memory-mapped reads) or 'parquet'
+        """
+        if pa is None:
+            raise ImportError("CachedStore requires pyarrow, install it with 'pip install pyarrow'")
+        if file_format not in self.FILE_FORMATS:
+            raise ValueError(f"Unknown cache format '{file_format}'. Available formats: {list(self.FILE_FORMATS)}")
+
+        self.store = store
+        self.cache_dir = cache_dir
+        self.index_column = index_column
+        self.file_format = file_format
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_path(self, symbol, frequency):
+        return os.path.join(self.cache_dir, f"{symbol}_{frequency}.{self.file_format}")
+
+    def fetch_raw_data(self, symbol, frequency):
+        cached = self.read_cache(symbol, frequency)
+        if cached is None:
+            data = self.store.fetch_raw_data(symbol, frequency)
+            if not data.empty:
+                self.write_cache(symbol, frequency, data)
+            return data
+        return self._top_up(symbol, frequency, cached)
+
+    def fetch_many(self, symbols, frequency):
+        # cache misses go to the wrapped store in one bulk fetch
+        cached = {symbol: self.read_cache(symbol, frequency) for symbol in symbols}
+        misses = [symbol for symbol in symbols if cached[symbol] is None]
+        raw_frames = self.store.fetch_many(misses, frequency) if misses else {}
+        for symbol in misses:
+            if not raw_frames[symbol].empty:
+                self.write_cache(symbol, frequency, raw_frames[symbol])
+
+        # hits are topped up in one bulk fetch per newest cached bar, a warm universe
+        # usually shares one, so it costs a single round-trip
+        hits_by_last_time_close = {}
+        for symbol in symbols:
+            if cached[symbol] is not None:
+                last_time_close = self._last_time_close(cached[symbol])
+                hits_by_last_time_close.setdefault(last_time_close, []).append(symbol)
+
+        for last_time_close, hits in hits_by_last_time_close.items():
+            new_rows = self.store.fetch_many_since(hits, frequency, last_time_close, self.index_column)
+            for symbol in hits:
+                raw_frames[symbol] = self._append(symbol, frequency, cached[symbol], new_rows[symbol])
+        return {symbol: raw_frames[symbol] for symbol in symbols}
+
+    def _last_time_close(self, cached):
+        return pd.to_datetime(cached[self.index_column]).dt.tz_localize(None).max()
+
+    def _top_up(self, symbol, frequency, cached):
+        new_rows = self.store.fetch_raw_data_since(
+            symbol, frequency, self._last_time_close(cached), self.index_column
+        )
+        return self._append(symbol, frequency, cached, new_rows)
+
+    def _append(self, symbol, frequency, cached, new_rows):
+        if new_rows.empty:
+            return cached
+
+        data = pd.concat([cached, new_rows], ignore_index=True)
+        self.write_cache(symbol, frequency, data)
+        return data
+
+    def read_cache(self, symbol, frequency):
+        path = self.cache_path(symbol, frequency)
+        if not os.path.exists(path):
+            return None
+
+        if self.file_format == 'arrow':
+            with pa.memory_map(path, 'r') as source:
+                table = pa_ipc.open_file(source).read_all()
+        else:
+            table = pq.read_table(path, memory_map=True)
+
+        df = table.to_pandas()
+        # parquet/arrow only allow string column names, restore e.g. DBStore's 0, 1
+        df.columns = json.loads(table.schema.metadata[self.COLUMNS_METADATA_KEY])
+        return df
+
+    def write_cache(self, symbol, frequency, df):
+        table = pa.Table.from_pandas(df.rename(columns=str), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[self.COLUMNS_METADATA_KEY] = json.dumps(list(df.columns))
+        table = table.replace_schema_metadata(metadata)
+
+        # write next to the target and swap, so readers never see a partial file
+        path = self.cache_path(symbol, frequency)
+        tmp_path = f"{path}.tmp"
+        if self.file_format == 'arrow':
+            with pa.OSFile(tmp_path, 'wb') as sink, pa_ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+
 # Main price processing class - uses composition via DataStore dependency
 class PriceReader:
     TARGET_INDEX_COLUMN_NAME = 'time_close'
@@ -89,6 +414,17 @@ class PriceReader:
         raw_df = self.store.fetch_raw_data_with_validation(symbol, frequency)
         return self.prepare_price_series(raw_df, frequency)
 
+    def fetch_price_frame(self, symbols, frequency):
+        """Wide frame of prices, one column per symbol on one shared time axis"""
+        raw_frames = self.store.fetch_many_with_validation(symbols, frequency)
+        prices = {
+            symbol: self.prepare_price_series(raw_df, frequency)[self.TARGET_PRICE_COLUMN_NAME]
+            for symbol, raw_df in raw_frames.items()
+        }
+        price_frame = pd.DataFrame(prices).asfreq(frequency)
+        price_frame.index.name = self.TARGET_INDEX_COLUMN_NAME
+        return price_frame
+
     def transform_columns(self, df):
         column_mapping = {
             self.index_column_name: self.TARGET_INDEX_COLUMN_NAME,
@@ -96,6 +432,7 @@ class PriceReader:
         }
         return df.rename(columns=column_mapping)
 
+    @profiled()
     def prepare_price_series(self, df, frequency):
         df = self.transform_columns(df)
 
@@ -116,3 +453,49 @@ class PriceReader:
             print(f"\nWarning: Still found {nan_after_fill} NaN values after forward filling")
             print("First and last dates with NaN:")
             print(df[df[self.TARGET_PRICE_COLUMN_NAME].isna()].index[[0, -1]])
+
+
+# Funding rate counterpart of PriceReader, fed through the same DataStore interface
+class FundingReader:
+    TARGET_INDEX_COLUMN_NAME = 'time_close'
+    TARGET_FUNDING_COLUMN_NAME = 'funding'
+
+    # funding settles every 8 hours, stores key the raw history by this instead of
+    # a bar frequency, e.g. CSVStore reads BTC_funding_rates.csv
+    RAW_FREQUENCY = 'funding_rates'
+
+    def __init__(self, store, index_column, rate_column):
+        self.store = store
+
+        self.index_column_name = index_column
+        self.rate_column_name = rate_column
+
+    def fetch_funding_series(self, symbol, frequency):
+        """Funding rates summed per bar of the trading frequency"""
+        raw_df = self.store.fetch_raw_data_with_validation(symbol, self.RAW_FREQUENCY)
+        return self.prepare_funding_series(raw_df, frequency)
+
+    def fetch_funding_frame(self, symbols, frequency):
+        """Wide frame of funding rates, one column per symbol on one shared time axis"""
+        raw_frames = self.store.fetch_many_with_validation(symbols, self.RAW_FREQUENCY)
+        funding_frame = pd.DataFrame({
+            symbol: self.prepare_funding_series(raw_df, frequency)
+            for symbol, raw_df in raw_frames.items()
+        }).asfreq(frequency)
+        funding_frame.index.name = self.TARGET_INDEX_COLUMN_NAME
+        return funding_frame
+
+    @profiled()
+    def prepare_funding_series(self, df, frequency):
+        index = pd.DatetimeIndex(
+            pd.to_datetime(df[self.index_column_name]).dt.tz_localize(None),
+            name=self.TARGET_INDEX_COLUMN_NAME
+        )
+        rates = pd.Series(pd.to_numeric(df[self.rate_column_name]).to_numpy(), index=index).sort_index()
+
+        # a settlement stored twice must not be charged twice
+        rates = rates[~rates.index.duplicated(keep='last')]
+
+        funding = rates.resample(frequency).sum()
+        funding.name = self.TARGET_FUNDING_COLUMN_NAME
+        return funding
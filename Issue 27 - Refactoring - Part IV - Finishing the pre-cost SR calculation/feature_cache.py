@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+
+TRANSFORMS = {
+    None: lambda series: series,
+    'diff': lambda series: series.diff(),
+    'pct_change': lambda series: series.pct_change(),
+}
+
+STATISTICS = ('mean', 'std', 'var')
+
+
+def _nbytes(value):
+    if hasattr(value, 'memory_usage'):
+        memory = value.memory_usage(index=True)
+        return int(memory.sum()) if hasattr(memory, 'sum') else int(memory)
+    return int(getattr(value, 'nbytes', 0))
+
+
+class FeatureCache:
+    """Memoizes derived features with LRU eviction
+
+    Entries are evicted least recently used first once either max_entries
+    or max_bytes is exceeded. A single value larger than max_bytes is
+    computed but never stored.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=512 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_or_compute(self, key, compute):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        value = compute()
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = value
+        self._sizes[key] = size
+        self.total_bytes += size
+
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self.total_bytes -= self._sizes.pop(evicted_key)
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def compute_ewm(series, transform, statistic, span, min_periods):
+    """Exponentially weighted statistic of a (transformed) feature
+
+    Raises:
+        ValueError: If transform or statistic is unknown
+    """
+    if transform not in TRANSFORMS:
+        raise ValueError(f"Unknown transform '{transform}'. Available transforms: {list(TRANSFORMS)}")
+    if statistic not in STATISTICS:
+        raise ValueError(f"Unknown statistic '{statistic}'. Available statistics: {list(STATISTICS)}")
+
+    ewm = TRANSFORMS[transform](series).ewm(span=span, min_periods=min_periods)
+    return getattr(ewm, statistic)()
+
+
+def cached_ewm(cache, owner_name, series_getter, feature_name, statistic, span, min_periods, transform=None):
+    """Look up or compute an EWM statistic keyed by its full parameter set"""
+    key = (owner_name, feature_name, transform, statistic, span, min_periods)
+    return cache.get_or_compute(
+        key,
+        lambda: compute_ewm(series_getter(feature_name), transform, statistic, span, min_periods)
+    )
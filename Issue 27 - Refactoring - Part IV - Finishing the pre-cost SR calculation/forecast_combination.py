@@ -0,0 +1,98 @@
+from backtest_refactored import (
+    TARGET_AVG_FORECAST,
+    VOL_LOOKBACK,
+    VOL_MIN_PERIODS
+)
+
+from forecast_scaling import ForecastScaler
+
+import numpy as np
+import pandas as pd
+
+
+FORECAST_CAP = 20
+MAX_FDM = 2.5
+
+
+class ForecastCombiner:
+    """Weighted combination of several trading rules' forecasts for one instrument
+
+    Every rule's raw forecast is normalized by the same instrument vol (one
+    cached EWM shared by all rules) and the rules are stacked as columns of
+    one (bars, rules) frame, so scaling, capping and weighting each run
+    once over all rules. The weighted forecast is multiplied by the forecast
+    diversification multiplier (FDM), 1 / sqrt(w' H w) with H the EWM
+    correlation of the rules' forecasts, negative correlations floored at 0.
+    """
+
+    def __init__(self, trading_rules, weights=None, corr_span=250, corr_min_periods=20,
+                 max_fdm=MAX_FDM, forecast_cap=FORECAST_CAP):
+        """
+        Args:
+            trading_rules (list): TradingRule instances
+            weights (list): One weight per rule, normalized to sum to 1, defaults to equal weights
+            corr_span (int): Span of the EWM correlation between forecasts
+            corr_min_periods (int): Bars before a correlation counts, the FDM is 1 until then
+            max_fdm (float): Upper bound of the FDM
+            forecast_cap (float): Absolute cap of each rule's and the combined forecast
+        """
+        if not trading_rules:
+            raise ValueError("ForecastCombiner needs at least one trading rule")
+        weights = np.ones(len(trading_rules)) if weights is None else np.asarray(weights, dtype=float)
+        if weights.shape != (len(trading_rules),) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError(f"Expected {len(trading_rules)} non-negative weights, got {weights}")
+
+        self.trading_rules = list(trading_rules)
+        self.weights = weights / weights.sum()
+        self.corr_span = corr_span
+        self.corr_min_periods = corr_min_periods
+        self.max_fdm = max_fdm
+        self.forecast_cap = forecast_cap
+
+    def get_capped_forecasts(self, instrument, feature_name, forecast_scaler=None):
+        """Scaled and capped forecast of every rule, one column per rule"""
+        try:
+            instrument.get_feature(feature_name)
+        except ValueError as e:
+            available = instrument.available_features()
+            raise ValueError(f"{str(e)}. Available features: {available}")
+
+        raw_forecasts = np.column_stack([
+            trading_rule.get_raw_forecast_for(instrument, feature_name).to_numpy(dtype=float)
+            for trading_rule in self.trading_rules
+        ])
+        instr_vol = instrument.get_ewm(feature_name, 'std', VOL_LOOKBACK, VOL_MIN_PERIODS, transform='diff')
+        vol_normalized = pd.DataFrame(
+            raw_forecasts / instr_vol.to_numpy(dtype=float)[:, np.newaxis],
+            index=instr_vol.index
+        )
+
+        if forecast_scaler is None:
+            forecast_scaler = ForecastScaler(
+                TARGET_AVG_FORECAST,
+                min_periods=instrument.trading_days_in_year * 2
+            )
+        scaled_forecasts = forecast_scaler.scale(vol_normalized)
+        return scaled_forecasts.clip(lower=-self.forecast_cap, upper=self.forecast_cap)
+
+    def get_fdm(self, forecasts):
+        """Forecast diversification multiplier per bar from the EWM correlation of the forecasts"""
+        n_rules = forecasts.shape[1]
+        if n_rules == 1:
+            return pd.Series(1.0, index=forecasts.index)
+
+        correlations = forecasts.ewm(span=self.corr_span, min_periods=self.corr_min_periods).corr()
+        correlations = np.clip(correlations.to_numpy().reshape(len(forecasts), n_rules, n_rules), 0, None)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fdm = 1 / np.sqrt(np.einsum('i,tij,j->t', self.weights, correlations, self.weights))
+        # only past correlations, the FDM is 1 until every pair has one
+        return pd.Series(np.minimum(fdm, self.max_fdm), index=forecasts.index).ffill().fillna(1.0)
+
+    def combine(self, instrument, feature_name, forecast_scaler=None):
+        """Capped combined forecast, a drop-in for generate_signals' output"""
+        forecasts = self.get_capped_forecasts(instrument, feature_name, forecast_scaler)
+        # NaN while any rule is still in its warm-up
+        weighted = pd.Series(forecasts.to_numpy() @ self.weights, index=forecasts.index)
+        combined = weighted * self.get_fdm(forecasts)
+        return combined.clip(lower=-self.forecast_cap, upper=self.forecast_cap)
@@ -0,0 +1,144 @@
+import heapq
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def expanding_median(values, min_periods=1):
+    """Exact expanding median of a 1-D array in O(n log n)
+
+    Keeps the lower half in a max-heap and the upper half in a min-heap.
+    NaNs are skipped and not counted towards min_periods, matching
+    pandas' expanding(min_periods).median().
+    """
+    lower = []  # max-heap via negated values
+    upper = []
+    out = np.full(len(values), np.nan)
+
+    for i, value in enumerate(values):
+        if math.isnan(value):
+            pass
+        elif not lower or value <= -lower[0]:
+            heapq.heappush(lower, -value)
+        else:
+            heapq.heappush(upper, value)
+
+        # rebalance so lower holds the extra element on odd counts
+        if len(lower) > len(upper) + 1:
+            heapq.heappush(upper, -heapq.heappop(lower))
+        elif len(upper) > len(lower):
+            heapq.heappush(lower, -heapq.heappop(upper))
+
+        count = len(lower) + len(upper)
+        if count >= max(min_periods, 1):
+            out[i] = -lower[0] if count % 2 else (-lower[0] + upper[0]) / 2
+    return out
+
+
+def approx_expanding_median(values, min_periods=1):
+    """Expanding median estimate with O(1) memory (P-square algorithm)
+
+    For very long series where holding every observation is too costly.
+    Exact for the first five observations, an estimate afterwards.
+    """
+    quantile = 0.5
+    heights = []
+    positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+    desired = [1.0, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5.0]
+    increments = [0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0]
+    out = np.full(len(values), np.nan)
+    count = 0
+
+    for i, value in enumerate(values):
+        if math.isnan(value):
+            if count >= max(min_periods, 1):
+                out[i] = out[i - 1]
+            continue
+        count += 1
+
+        if count <= 5:
+            heapq.heappush(heights, value)
+            if count == 5:
+                heights = sorted(heights)
+            if count >= max(min_periods, 1):
+                out[i] = float(np.median(heights))
+            continue
+
+        # find the cell of the new observation and stretch the extreme markers
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = next(k for k in range(4) if heights[k] <= value < heights[k + 1])
+
+        for k in range(cell + 1, 5):
+            positions[k] += 1
+        for k in range(5):
+            desired[k] += increments[k]
+
+        # adjust the three middle markers with a parabolic (or linear) step
+        for k in range(1, 4):
+            delta = desired[k] - positions[k]
+            if (delta >= 1 and positions[k + 1] - positions[k] > 1) or \
+                    (delta <= -1 and positions[k - 1] - positions[k] < -1):
+                step = 1.0 if delta > 0 else -1.0
+                parabolic = heights[k] + step / (positions[k + 1] - positions[k - 1]) * (
+                    (positions[k] - positions[k - 1] + step) * (heights[k + 1] - heights[k])
+                    / (positions[k + 1] - positions[k])
+                    + (positions[k + 1] - positions[k] - step) * (heights[k] - heights[k - 1])
+                    / (positions[k] - positions[k - 1])
+                )
+                if heights[k - 1] < parabolic < heights[k + 1]:
+                    heights[k] = parabolic
+                else:
+                    neighbour = k + int(step)
+                    heights[k] += step * (heights[neighbour] - heights[k]) / (positions[neighbour] - positions[k])
+                positions[k] += step
+
+        if count >= max(min_periods, 1):
+            out[i] = heights[2]
+    return out
+
+
+MEDIAN_METHODS = {
+    'exact': expanding_median,
+    'approx': approx_expanding_median,
+}
+
+
+class ForecastScaler:
+    """Scales vol normalized forecasts to a target average absolute value
+
+    The scaling factor is target / expanding median of the absolute forecast,
+    backfilled over the warm-up period. Works on a Series (one instrument)
+    or a DataFrame (one column per instrument) from any TradingRule.
+    """
+
+    def __init__(self, target_avg_forecast=10.0, min_periods=1, method='exact'):
+        if method not in MEDIAN_METHODS:
+            raise ValueError(f"Unknown median method '{method}'. Available methods: {list(MEDIAN_METHODS)}")
+        self.target_avg_forecast = target_avg_forecast
+        self.min_periods = min_periods
+        self.method = method
+
+    def _avg_abs_value(self, forecast):
+        median = MEDIAN_METHODS[self.method]
+        abs_values = forecast.abs().to_numpy(dtype=float)
+        if abs_values.ndim == 1:
+            return pd.Series(median(abs_values, self.min_periods), index=forecast.index)
+        return pd.DataFrame(
+            np.column_stack([median(abs_values[:, col], self.min_periods) for col in range(abs_values.shape[1])]),
+            index=forecast.index,
+            columns=forecast.columns
+        )
+
+    def get_scaling_factor(self, vol_normalized_forecast):
+        scaling_factor = self.target_avg_forecast / self._avg_abs_value(vol_normalized_forecast)
+        return scaling_factor.bfill()
+
+    def scale(self, vol_normalized_forecast):
+        return vol_normalized_forecast * self.get_scaling_factor(vol_normalized_forecast)
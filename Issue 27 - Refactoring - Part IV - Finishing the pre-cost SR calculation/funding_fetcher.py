@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+import aiohttp
+import pandas as pd
+
+from data_sources import CachedStore
+from data_sources import DataStore
+from data_sources import FundingReader
+
+
+BYBIT_BASE_URL = 'https://api.bybit.com'
+FUNDING_HISTORY_PATH = '/v5/market/funding/history'
+
+# bybit returns at most 200 funding records per request, 66 days x 3 per day stays below
+WINDOW_MS = 66 * 24 * 60 * 60 * 1000
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# first request of a symbol without stored history, bybit simply returns nothing before listing
+FUNDING_START_TIME = pd.Timestamp('2011-01-01')
+FUNDING_CACHE_DIR = '.funding_cache'
+
+
+class FundingFetchError(Exception):
+    """Raised when a funding window still fails after all retries"""
+    pass
+
+
+def funding_windows(start_time, end_time, window_ms=WINDOW_MS):
+    """[start, end] millisecond windows covering the range, same split as fetch_all_funding_rates"""
+    windows = []
+    while start_time < end_time:
+        windows.append((start_time, min(start_time + window_ms, end_time)))
+        start_time += window_ms
+    return windows
+
+
+class RateLimiter:
+    """Spaces request starts at least 1 / requests_per_second apart"""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def fetch_window(session, url, params, semaphore, limiter, retries=3, backoff=0.5):
+    """One funding window with retries and exponential backoff on transient errors"""
+    for attempt in range(retries + 1):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status in RETRY_STATUSES:
+                        error = f"HTTP {response.status}"
+                    else:
+                        response.raise_for_status()
+                        payload = await response.json(content_type=None)
+                        if payload.get('retCode', 0) == 0:
+                            return payload.get('result', {}).get('list', [])
+                        error = payload.get('retMsg', 'Unknown error')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e)
+
+        if attempt < retries:
+            await asyncio.sleep(backoff * 2 ** attempt)
+    raise FundingFetchError(f"Funding request {params} failed after {retries + 1} attempts: {error}")
+
+
+async def fetch_funding_rates_async(symbols, start_time, end_time=None, base_url=BYBIT_BASE_URL,
+                                    category='inverse', max_concurrency=8, requests_per_second=10,
+                                    retries=3, backoff=0.5):
+    """Fetch the funding history of many symbols with concurrent requests
+
+    All windows of all symbols are known up front, so they are issued at once,
+    bounded by max_concurrency in flight and requests_per_second overall,
+    over one keep-alive session.
+
+    Returns:
+        dict: symbol -> list of funding records sorted by fundingRateTimestamp
+    """
+    end_time = end_time if end_time is not None else int(time.time()) * 1000
+    url = f"{base_url}{FUNDING_HISTORY_PATH}"
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = RateLimiter(requests_per_second)
+
+    requests = [
+        (symbol, {'symbol': symbol, 'category': category, 'startTime': window_start, 'endTime': window_end})
+        for symbol in symbols
+        for window_start, window_end in funding_windows(start_time, end_time)
+    ]
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        windows = await asyncio.gather(*[
+            fetch_window(session, url, params, semaphore, limiter, retries, backoff)
+            for _, params in requests
+        ])
+
+    # window edges are inclusive on both ends, drop the record a boundary returns twice
+    funding_rates = {symbol: {} for symbol in symbols}
+    for (symbol, _), rates in zip(requests, windows):
+        for rate in rates:
+            funding_rates[symbol][int(rate['fundingRateTimestamp'])] = rate
+    return {
+        symbol: [rates[timestamp] for timestamp in sorted(rates)]
+        for symbol, rates in funding_rates.items()
+    }
+
+
+def fetch_funding_rates(symbols, start_time, end_time=None, **kwargs):
+    """Blocking wrapper around fetch_funding_rates_async"""
+    return asyncio.run(fetch_funding_rates_async(symbols, start_time, end_time, **kwargs))
+
+
+def funding_rates_to_frame(funding_rates):
+    """Same layout bybit_api.py writes to BTC_funding_rates_bybit.csv"""
+    df = pd.DataFrame(funding_rates)
+    if df.empty:
+        return df
+    df['time_close'] = pd.to_datetime(pd.to_numeric(df['fundingRateTimestamp']), unit='ms')
+    df.set_index('time_close', inplace=True)
+    df.sort_index(inplace=True)
+    return df
+
+
+# DataStore over the bybit API, wrap it in a CachedStore to keep the history on disk
+class BybitFundingStore(DataStore):
+    def __init__(self, start_time=FUNDING_START_TIME, fetcher=fetch_funding_rates, **fetch_kwargs):
+        """
+        Args:
+            start_time (pd.Timestamp): Where the history of a symbol without stored rates starts
+            fetcher (callable): fetch_funding_rates or a stand-in with the same signature
+            **fetch_kwargs: Passed on to the fetcher, e.g. category or max_concurrency
+        """
+        self.start_time = start_time
+        self.fetcher = fetcher
+        self.fetch_kwargs = fetch_kwargs
+
+    def _fetch_since(self, symbols, since):
+        # since is exclusive, bybit's startTime is inclusive
+        start_ms = int(since.timestamp() * 1000) + 1
+        funding_rates = self.fetcher(symbols, start_ms, **self.fetch_kwargs)
+        return {symbol: self._to_raw_frame(funding_rates.get(symbol, [])) for symbol in symbols}
+
+    @staticmethod
+    def _to_raw_frame(rates):
+        df = funding_rates_to_frame(rates)
+        if df.empty:
+            return pd.DataFrame()
+        df = df.reset_index()[['time_close', 'symbol', 'fundingRate', 'fundingRateTimestamp']]
+        return df.astype({'fundingRate': float, 'fundingRateTimestamp': 'int64'})
+
+    def fetch_raw_data(self, symbol, frequency):
+        # funding has a single native frequency, the argument only keys the cache file
+        return self._fetch_since([symbol], self.start_time - pd.Timedelta(milliseconds=1))[symbol]
+
+    def fetch_raw_data_since(self, symbol, frequency, since, index_column='time_close'):
+        return self._fetch_since([symbol], since)[symbol]
+
+    def fetch_many_since(self, symbols, frequency, since, index_column='time_close'):
+        return self._fetch_since(list(symbols), since)
+
+    def fetch_many(self, symbols, frequency):
+        """All symbols' windows go out concurrently in one fetcher call"""
+        return self._fetch_since(list(symbols), self.start_time - pd.Timedelta(milliseconds=1))
+
+
+def funding_store(cache_dir=FUNDING_CACHE_DIR, **kwargs):
+    """Parquet funding history per symbol, each read only downloads rates after the newest stored one"""
+    return CachedStore(BybitFundingStore(**kwargs), cache_dir, index_column='time_close', file_format='parquet')
+
+
+if __name__ == "__main__":
+    symbols = ['BTCUSDT', 'ETHUSDT']
+
+    # first run downloads everything since FUNDING_START_TIME, later runs only the new settlements
+    funding_reader = FundingReader(funding_store(), index_column='time_close', rate_column='fundingRate')
+    funding_frame = funding_reader.fetch_funding_frame(symbols, '1D')
+    for symbol in symbols:
+        print(f"{symbol}: {funding_frame[symbol].count()} days of funding up to {funding_frame[symbol].last_valid_index()}")
@@ -0,0 +1,232 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+
+OHLCV_COLUMNS = [
+    'coin_id', 'interval', 'time_open', 'time_close', 'time_high', 'time_low',
+    'open', 'high', 'low', 'close', 'volume', 'market_cap'
+]
+
+DEFAULT_START_DATE = pd.Timestamp('2007-01-01')
+
+
+def interval_to_timedelta(interval):
+    # scraper intervals look like '1d' or '1h', pandas wants an upper case day unit
+    return pd.Timedelta(interval[:-1] + 'D' if interval.endswith('d') else interval)
+
+
+# Abstract interface for bar providers - crypto APIs, files or the fake below
+class OHLCVSource(ABC):
+    @abstractmethod
+    def fetch_bars(self, coins, start, end, interval):
+        """Bars of all coins with start <= time_open < end
+
+        Args:
+            coins (pd.DataFrame): 'id' and 'symbol' column per coin
+            start (pd.Timestamp): First open time to fetch
+            end (pd.Timestamp): Exclusive upper bound of open times
+            interval (str): Bar interval, e.g. '1d'
+
+        Returns:
+            pd.DataFrame: OHLCV_COLUMNS without 'interval'
+        """
+        pass
+
+
+# Deterministic random walk bars, so ingestion can be exercised without the network
+class FakeOHLCVSource(OHLCVSource):
+    ORIGIN = pd.Timestamp('2007-01-01')
+
+    def __init__(self, listing_dates=None, seed=42):
+        self.listing_dates = listing_dates or {}
+        self.seed = seed
+        self.requests = []
+
+    def fetch_bars(self, coins, start, end, interval):
+        self.requests.append((tuple(coins['id']), start, end))
+        step = interval_to_timedelta(interval)
+        frames = []
+        for coin_id in coins['id']:
+            listed = max(self.listing_dates.get(coin_id, self.ORIGIN), self.ORIGIN)
+            time_open = pd.date_range(listed, end, freq=step, inclusive='left')
+            if len(time_open) == 0:
+                continue
+
+            # same seed per coin, so re-fetching a window returns identical bars
+            rng = np.random.default_rng([self.seed, int(coin_id)])
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(time_open))))
+            bars = pd.DataFrame({
+                'coin_id': coin_id,
+                'time_open': time_open,
+                'time_close': time_open + step - pd.Timedelta(milliseconds=1),
+                'time_high': time_open + step / 2,
+                'time_low': time_open + step / 4,
+                'open': np.concatenate([[100.0], close[:-1]]),
+                'high': close * 1.01,
+                'low': close * 0.99,
+                'close': close,
+                'volume': 1_000.0,
+                'market_cap': close * 1_000_000
+            })
+            frames.append(bars[bars['time_open'] >= start])
+        if not frames:
+            return pd.DataFrame(columns=[c for c in OHLCV_COLUMNS if c != 'interval'])
+        return pd.concat(frames, ignore_index=True)
+
+
+# Abstract interface for bar destinations
+class OHLCVSink(ABC):
+    # writes the sink can serve at once, None for no limit
+    max_concurrent_writes = None
+
+    @abstractmethod
+    def high_water_marks(self, interval):
+        """Latest stored time_open per coin_id for the interval"""
+        pass
+
+    @abstractmethod
+    def write_bars(self, bars):
+        """Insert bars, skipping (coin_id, interval, time_open) already stored, returns rows inserted"""
+        pass
+
+
+class PostgresOHLCVSink(OHLCVSink):
+    def __init__(self, db_store, page_size=5_000):
+        self.db_store = db_store
+        self.page_size = page_size
+
+    @property
+    def max_concurrent_writes(self):
+        # every write holds a pooled connection, the pool raises instead of waiting once empty
+        return self.db_store.max_connections
+
+    def high_water_marks(self, interval):
+        # one backward probe of the unique (coin_id, interval, time_open) index per
+        # coin, instead of aggregating every stored bar of the interval
+        rows = self.db_store.query("""
+            SELECT coins.id, last_bar.time_open
+            FROM coins
+            CROSS JOIN LATERAL (
+                SELECT time_open
+                FROM ohlcv
+                WHERE ohlcv.coin_id = coins.id
+                AND ohlcv.interval = %s
+                ORDER BY time_open DESC
+                LIMIT 1
+            ) AS last_bar;
+        """, (interval,))
+        return {coin_id: pd.Timestamp(last_time_open) for coin_id, last_time_open in rows}
+
+    def write_bars(self, bars):
+        if bars.empty:
+            return 0
+
+        values = [
+            tuple(None if pd.isna(value) else value for value in row)
+            for row in bars[OHLCV_COLUMNS].astype(object).itertuples(index=False, name=None)
+        ]
+        with self.db_store.connection() as conn:
+            with conn.cursor() as cur:
+                inserted = execute_values(cur, f"""
+                    INSERT INTO ohlcv ({', '.join(OHLCV_COLUMNS)})
+                    VALUES %s
+                    ON CONFLICT (coin_id, interval, time_open) DO NOTHING
+                    RETURNING 1
+                """, values, page_size=self.page_size, fetch=True)
+        return len(inserted)
+
+
+# In-process sink with the same unique bar semantics as the ohlcv table
+class MemoryOHLCVSink(OHLCVSink):
+    def __init__(self):
+        self.bars = pd.DataFrame(columns=OHLCV_COLUMNS)
+        self._lock = threading.Lock()
+
+    def high_water_marks(self, interval):
+        stored = self.bars[self.bars['interval'] == interval]
+        return stored.groupby('coin_id')['time_open'].max().to_dict()
+
+    def write_bars(self, bars):
+        key = ['coin_id', 'interval', 'time_open']
+        with self._lock:
+            new_bars = bars[OHLCV_COLUMNS].drop_duplicates(key)
+            if not self.bars.empty:
+                existing = pd.MultiIndex.from_frame(self.bars[key])
+                new_bars = new_bars[~pd.MultiIndex.from_frame(new_bars[key]).isin(existing)]
+            if new_bars.empty:
+                return 0
+            self.bars = new_bars if self.bars.empty else pd.concat([self.bars, new_bars], ignore_index=True)
+            return len(new_bars)
+
+
+class OHLCVIngestor:
+    """Incremental bar ingestion from a source into a sink
+
+    Coins are grouped by their high-water mark so each group is one source
+    request starting right after the newest stored bar, and groups run
+    concurrently on at most the sink's max_concurrent_writes threads. Bars
+    at or before a coin's mark are dropped client-side, the sink's unique
+    constraint covers anything that races past that.
+    """
+
+    def __init__(self, source, sink, interval='1d', group_size=10, max_workers=4,
+                 default_start=DEFAULT_START_DATE):
+        self.source = source
+        self.sink = sink
+        self.interval = interval
+        self.group_size = group_size
+        self.max_workers = max_workers
+        self.default_start = default_start
+
+    def plan_groups(self, coins, high_water_marks):
+        """(start, coins) requests, coins sharing a start date are chunked together"""
+        step = interval_to_timedelta(self.interval)
+        starts = coins['id'].map(
+            lambda coin_id: high_water_marks[coin_id] + step if coin_id in high_water_marks else self.default_start
+        )
+        groups = []
+        for start, same_start in coins.groupby(starts.to_numpy(), sort=True):
+            for i in range(0, len(same_start), self.group_size):
+                groups.append((pd.Timestamp(start), same_start.iloc[i:i + self.group_size]))
+        return groups
+
+    def ingest_group(self, start, coins, end, high_water_marks):
+        bars = self.source.fetch_bars(coins, start, end, self.interval)
+        if bars.empty:
+            return 0
+
+        bars = bars.assign(interval=self.interval)
+        last_stored = pd.to_datetime(bars['coin_id'].map(high_water_marks))
+        is_new = last_stored.isna() | (bars['time_open'] > last_stored)
+        return self.sink.write_bars(bars[is_new.to_numpy()])
+
+    def run(self, coins, end=None):
+        """Ingest every coin up to end (exclusive), returns total rows inserted"""
+        end = end if end is not None else pd.Timestamp.now().normalize()
+        high_water_marks = self.sink.high_water_marks(self.interval)
+        groups = [(start, group) for start, group in self.plan_groups(coins, high_water_marks) if start < end]
+
+        max_workers = min(self.max_workers, self.sink.max_concurrent_writes or self.max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            inserted = executor.map(
+                lambda request: self.ingest_group(request[0], request[1], end, high_water_marks),
+                groups
+            )
+            return sum(inserted)
+
+
+if __name__ == "__main__":
+    # dry run against the fake source, swap in PostgresOHLCVSink(DBStore()) and a real source for live data
+    coins = pd.DataFrame({'id': [1, 1027, 825], 'symbol': ['BTC', 'ETH', 'USDT']})
+    source = FakeOHLCVSource(listing_dates={1027: pd.Timestamp('2015-08-07'), 825: pd.Timestamp('2015-02-25')})
+    sink = MemoryOHLCVSink()
+
+    ingestor = OHLCVIngestor(source, sink, interval='1d')
+    print(f"First run inserted {ingestor.run(coins, end=pd.Timestamp('2024-01-01'))} bars")
+    print(f"Rerun inserted {ingestor.run(coins, end=pd.Timestamp('2024-01-01'))} bars")
+    print(f"Next day inserted {ingestor.run(coins, end=pd.Timestamp('2024-01-02'))} bars")
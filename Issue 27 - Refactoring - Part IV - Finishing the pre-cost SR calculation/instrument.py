@@ -1,11 +1,16 @@
+from feature_cache import FeatureCache, cached_ewm
+
+
 class Instrument:
     CLOSE_COLUMN = 'close'
 
-    def __init__(self, name, price_data, trading_days_in_year, contract_unit):
+    def __init__(self, name, price_data, trading_days_in_year, contract_unit, feature_cache=None):
         self.__price_data = price_data
         self.name = name
         self.trading_days_in_year = trading_days_in_year
         self.contract_unit = contract_unit
+        # may be shared between instruments, keys include the instrument name
+        self.feature_cache = feature_cache if feature_cache is not None else FeatureCache()
 
     def get_notional_value(self, contracts):
         return contracts * self.get_feature(self.CLOSE_COLUMN) * self.contract_unit
@@ -32,6 +37,24 @@ class Instrument:
             raise ValueError(f"Feature '{feature_name}' not available for {self.symbol}")
         return self.__price_data[feature_name]
 
+    def get_ewm(self, feature_name, statistic, span, min_periods, transform=None):
+        """Exponentially weighted statistic of a feature, computed once per parameter set
+
+        Args:
+            feature_name (str): Name of the feature, e.g. 'close'
+            statistic (str): 'mean', 'std' or 'var'
+            span (int): EWM span
+            min_periods (int): Minimum number of observations
+            transform (str): None, 'diff' or 'pct_change' applied before the EWM
+
+        Returns:
+            pd.Series: The (cached) statistic
+        """
+        return cached_ewm(
+            self.feature_cache, self.name, self.get_feature,
+            feature_name, statistic, span, min_periods, transform
+        )
+
     def available_features(self):
         """List all available features for this instrument"""
         return list(self._price_data.columns)
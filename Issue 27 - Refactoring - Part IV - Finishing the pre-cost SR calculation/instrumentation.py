@@ -0,0 +1,229 @@
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+class Span:
+    """One timed call of a stage or data store fetch"""
+
+    def __init__(self, name, category, start_ns, thread_id):
+        self.name = name
+        self.category = category
+        self.start_ns = start_ns
+        self.thread_id = thread_id
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.rows = None
+        self.bytes_allocated = None
+        self.peak_bytes = None
+        self.args = {}
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'category': self.category,
+            'start_ns': self.start_ns,
+            'thread_id': self.thread_id,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'rows': self.rows,
+            'bytes_allocated': self.bytes_allocated,
+            'peak_bytes': self.peak_bytes,
+            **self.args
+        }
+
+
+def count_rows(result):
+    """Rows of a stage result, a dict of frames (fetch_many) counts all of them"""
+    if isinstance(result, dict):
+        counts = [count_rows(value) for value in result.values()]
+        return sum(count for count in counts if count is not None)
+    if isinstance(result, (pd.Series, pd.DataFrame)) or (isinstance(result, np.ndarray) and result.ndim):
+        return len(result)
+    return None
+
+
+class Profiler:
+    """Collects spans while enabled, see enable_profiling
+
+    Wall time uses perf_counter, CPU time thread_time. With trace_memory
+    tracemalloc also records per span the bytes still allocated when it
+    ends (bytes_allocated, mostly the result) and the peak on top of what
+    was allocated when it started (peak_bytes). tracemalloc slows every
+    allocation down, so wall times taken with it are not comparable to
+    those taken without.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.started_tracemalloc = False
+        self.spans = []
+        self.origin_ns = time.perf_counter_ns()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, category='stage', **args):
+        stack = self._stack()
+        span = Span(name, category, time.perf_counter_ns() - self.origin_ns, threading.get_ident())
+        span.args.update(args)
+
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # tracemalloc has one peak, fold it into the parent before a child resets it
+            if stack:
+                stack[-1].peak_bytes = max(stack[-1].peak_bytes, peak)
+            tracemalloc.reset_peak()
+            memory_before, span.peak_bytes = current, current
+
+        stack.append(span)
+        cpu_start = time.thread_time()
+        try:
+            yield span
+        finally:
+            span.cpu_seconds = time.thread_time() - cpu_start
+            span.wall_seconds = (time.perf_counter_ns() - self.origin_ns - span.start_ns) / 1e9
+            stack.pop()
+
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(span.peak_bytes, peak)
+                if stack:
+                    stack[-1].peak_bytes = max(stack[-1].peak_bytes, peak)
+                tracemalloc.reset_peak()
+                span.bytes_allocated = current - memory_before
+                span.peak_bytes = peak - memory_before
+            self.spans.append(span)
+
+    def to_frame(self):
+        """One row per span in the order they finished"""
+        return pd.DataFrame([span.to_dict() for span in self.spans])
+
+    def summary(self):
+        """Calls, total wall and CPU time and rows per span name, slowest first"""
+        spans = self.to_frame()
+        if spans.empty:
+            return spans
+        summary = spans.groupby(['category', 'name']).agg(
+            calls=('wall_seconds', 'size'),
+            wall_seconds=('wall_seconds', 'sum'),
+            cpu_seconds=('cpu_seconds', 'sum'),
+            rows=('rows', 'sum'),
+            peak_bytes=('peak_bytes', 'max')
+        )
+        return summary.sort_values('wall_seconds', ascending=False)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'trace_memory': self.trace_memory,
+                'spans': [span.to_dict() for span in self.spans]
+            }, f, indent=2, default=str)
+
+    def to_chrome_trace(self, path):
+        """Trace Event file for chrome://tracing or https://ui.perfetto.dev, nested calls stack up"""
+        events = []
+        for span in self.spans:
+            args = {
+                'cpu_ms': span.cpu_seconds * 1e3,
+                'rows': span.rows,
+                'bytes_allocated': span.bytes_allocated,
+                'peak_bytes': span.peak_bytes,
+                **span.args
+            }
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': span.start_ns / 1e3,
+                'dur': span.wall_seconds * 1e6,
+                'pid': os.getpid(),
+                'tid': span.thread_id,
+                'args': {key: value for key, value in args.items() if value is not None}
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+# the active profiler, None while profiling is disabled
+_profiler = None
+
+
+def enable_profiling(trace_memory=False):
+    """Start recording every profiled call, returns the new Profiler"""
+    global _profiler
+    profiler = Profiler(trace_memory)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        profiler.started_tracemalloc = True
+    _profiler = profiler
+    return profiler
+
+
+def disable_profiling():
+    """Stop recording, returns the Profiler with everything recorded so far"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.started_tracemalloc:
+        tracemalloc.stop()
+    return profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextmanager
+def profiling(trace_memory=False):
+    profiler = enable_profiling(trace_memory)
+    try:
+        yield profiler
+    finally:
+        disable_profiling()
+
+
+@contextmanager
+def profile_span(name, category='stage', **args):
+    """Time a block of code, does nothing while profiling is disabled"""
+    if _profiler is None:
+        yield None
+        return
+    with _profiler.span(name, category, **args) as span:
+        yield span
+
+
+def profiled(name=None, category='stage', describe=None):
+    """Decorator recording each call as a span named after the function
+
+    While profiling is disabled the only overhead is one global lookup per call.
+
+    Args:
+        name (str): Span name, defaults to the function's qualified name
+        category (str): Groups spans, e.g. 'stage' or 'data'
+        describe (callable): Takes the call's arguments, returns a dict stored with the span
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            args_recorded = describe(*args, **kwargs) if describe is not None else {}
+            with _profiler.span(span_name, category, **args_recorded) as span:
+                result = func(*args, **kwargs)
+                span.rows = count_rows(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,284 @@
+import math
+
+from streaming import ewm_update, ewm_var
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    # the kernel below calls the recurrence of streaming.EWMState, compiled once
+    _ewm_update = njit(cache=True)(ewm_update)
+    _ewm_var = njit(cache=True)(ewm_var)
+else:
+    _ewm_update, _ewm_var = ewm_update, ewm_var
+
+
+# per column outputs of the returns kernel, in order
+_STAT_FIELDS = ('count', 'total', 'ewm_std', 'max_drawdown', 'skew')
+
+
+def _returns_stats_loop(returns, alpha, min_periods, out):
+    # one pass over (columns, bars) percent returns, each column contiguous in memory,
+    # compiled by numba when available
+    #   ewm_std: last value of ewm(span, min_periods).std(), streaming.EWMState's recurrence
+    #   max_drawdown: largest calculate_drawdown of metrics.py on the fractional returns
+    #   skew: pandas' bias corrected skew from running central moments
+    n_columns, n_bars = returns.shape
+    decay = 1.0 - alpha
+    for j in range(n_columns):
+        count = 0
+        total = 0.0
+        ewm_mean = math.nan
+        ewm_cov = 0.0
+        old_wt = 1.0
+        sum_wt = 1.0
+        sum_wt2 = 1.0
+        cumulative = 0.0
+        cumulative_max = -math.inf
+        max_drawdown = math.nan
+        moment_mean = 0.0
+        m2 = 0.0
+        m3 = 0.0
+
+        for i in range(n_bars):
+            value = returns[j, i]
+            ewm_mean, ewm_cov, old_wt, sum_wt, sum_wt2 = _ewm_update(
+                value, ewm_mean, ewm_cov, old_wt, sum_wt, sum_wt2, decay
+            )
+
+            if math.isnan(value):
+                continue
+
+            count += 1
+            total += value
+
+            cumulative += value / 100
+            cumulative_max = max(cumulative_max, cumulative)
+            drawdown = (cumulative_max - cumulative) / (1 + cumulative_max)
+            if math.isnan(max_drawdown) or drawdown > max_drawdown:
+                max_drawdown = drawdown
+
+            delta = value - moment_mean
+            delta_n = delta / count
+            term = delta * delta_n * (count - 1)
+            moment_mean += delta_n
+            m3 += term * delta_n * (count - 2) - 3 * delta_n * m2
+            m2 += term
+
+        out[j, 0] = count
+        out[j, 1] = total
+
+        ewm_std = math.nan
+        if count >= min_periods and not math.isnan(ewm_mean):
+            var = _ewm_var(ewm_cov, sum_wt, sum_wt2)
+            if not math.isnan(var):
+                ewm_std = math.sqrt(var) if var > 0 else 0.0
+        out[j, 2] = ewm_std
+        out[j, 3] = max_drawdown
+
+        skew = math.nan
+        if count >= 3:
+            skew = 0.0
+            if m2 > 0:
+                skew = math.sqrt(count * (count - 1)) / (count - 2) * (m3 / count) / (m2 / count) ** 1.5
+        out[j, 4] = skew
+    return out
+
+
+def _turnover_loop(positions, average_positions, out):
+    # sum and count of |diff| of positions / forward filled average positions, (columns, bars) layout
+    n_columns, n_bars = positions.shape
+    for j in range(n_columns):
+        average = math.nan
+        previous = math.nan
+        total = 0.0
+        count = 0
+        for i in range(n_bars):
+            if not math.isnan(average_positions[j, i]):
+                average = average_positions[j, i]
+            normalised = positions[j, i] / average
+            if not math.isnan(normalised) and not math.isnan(previous):
+                total += abs(normalised - previous)
+                count += 1
+            previous = normalised
+        out[j, 0] = total
+        out[j, 1] = count
+    return out
+
+
+if njit is not None:
+    _returns_stats_loop_jit = njit(cache=True)(_returns_stats_loop)
+    _turnover_loop_jit = njit(cache=True)(_turnover_loop)
+else:
+    _returns_stats_loop_jit = _turnover_loop_jit = None
+
+
+def _returns_stats_numpy(returns, alpha, min_periods, out):
+    # the kernel's statistics from whole-array pandas / numpy operations on (bars, columns)
+    frame = pd.DataFrame(returns)
+    is_observation = ~np.isnan(returns)
+    observed = np.where(is_observation, returns, 0.0)
+
+    # a column's running peak only moves on its own bars, like the kernel's
+    cumulative = np.cumsum(observed / 100, axis=0)
+    cumulative_max = np.maximum.accumulate(np.where(is_observation, cumulative, -np.inf), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdown = (cumulative_max - cumulative) / (1 + cumulative_max)
+
+    out[:, 0] = is_observation.sum(axis=0)
+    out[:, 1] = observed.sum(axis=0)
+    out[:, 2] = frame.ewm(alpha=alpha, min_periods=min_periods).std().iloc[-1].to_numpy()
+    out[:, 3] = pd.DataFrame(np.where(is_observation, drawdown, np.nan)).max().to_numpy()
+    out[:, 4] = frame.skew().to_numpy()
+    return out
+
+
+def _turnover_numpy(positions, average_positions, out):
+    average = pd.DataFrame(average_positions).ffill().to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normalised = positions / average
+    changes = np.abs(np.diff(normalised, axis=0))
+    out[:, 0] = np.nansum(changes, axis=0)
+    out[:, 1] = np.sum(~np.isnan(changes), axis=0)
+    return out
+
+
+def available_backends():
+    """List the metrics backends usable in this environment"""
+    return ['numba', 'numpy'] if _returns_stats_loop_jit is not None else ['numpy']
+
+
+def _as_2d(values):
+    values = np.asarray(values, dtype=float)
+    return np.ascontiguousarray(values.reshape(-1, 1) if values.ndim == 1 else values)
+
+
+class PerformanceMetrics:
+    """Performance sheet of one backtest, or of every instrument of a universe
+
+    Each metric is a float for a single instrument and an array with one
+    value per instrument otherwise. Percent figures are relative to the
+    trading capital, like the performance sheet of backtest.py.
+    """
+
+    FIELDS = (
+        'total_return',
+        'mean_ann_return',
+        'std_dev',
+        'sharpe_ratio',
+        'pre_cost_sr',
+        'post_cost_sr',
+        'trading_costs_sr',
+        'ann_turnover',
+        'max_drawdown',
+        'skew',
+    )
+
+    def __init__(self, instruments=None, **metrics):
+        missing = [field for field in self.FIELDS if field not in metrics]
+        if missing:
+            raise ValueError(f"Missing metrics {missing}. Available metrics: {list(self.FIELDS)}")
+        self.instruments = instruments
+        for field in self.FIELDS:
+            setattr(self, field, metrics[field])
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def to_frame(self):
+        """One row per instrument, one column per metric"""
+        return pd.DataFrame(
+            {field: np.atleast_1d(value) for field, value in self.to_dict().items()},
+            index=self.instruments
+        )
+
+    def __repr__(self):
+        return f"PerformanceMetrics({self.to_frame().to_string()})"
+
+
+def calculate_metrics(pre_cost_pnl, post_cost_pnl, trading_capital, trading_days_in_year,
+                      positions=None, average_positions=None, vol_lookback=35, vol_min_periods=10,
+                      backend='auto'):
+    """Every metric of backtest.py's performance sheet in one pass per quantity
+
+    Works on a Series (one instrument) or on DataFrames with one column per
+    instrument sharing a time axis, the pnl is turned into one contiguous
+    (bars, 2 x instruments) block and scanned once.
+
+    Args:
+        pre_cost_pnl (pd.Series | pd.DataFrame): Cash pnl before costs
+        post_cost_pnl (pd.Series | pd.DataFrame): Cash pnl after costs
+        trading_capital (float): Account size the percent returns refer to
+        trading_days_in_year (int): Bars per year for annualizing
+        positions (pd.Series | pd.DataFrame): Held contracts, needed for the turnover
+        average_positions (pd.Series | pd.DataFrame): Contracts held at an average forecast,
+            turnover is measured in multiples of it
+        backend (str): 'numba', 'numpy' or 'auto' (numba if installed)
+
+    Returns:
+        PerformanceMetrics: Metrics with NaN turnover when no positions are given
+
+    Raises:
+        ValueError: If the backend is unknown or not installed
+    """
+    if backend == 'auto':
+        backend = available_backends()[0]
+    if backend not in ('numba', 'numpy'):
+        raise ValueError(f"Unknown metrics backend '{backend}'. Available backends: {available_backends()}")
+    if backend not in available_backends():
+        raise ValueError(f"Metrics backend '{backend}' is not installed. Available backends: {available_backends()}")
+
+    is_frame = isinstance(post_cost_pnl, pd.DataFrame)
+    pre_cost = _as_2d(pre_cost_pnl)
+    post_cost = _as_2d(post_cost_pnl)
+    n_instruments = post_cost.shape[1]
+
+    perc_returns = np.ascontiguousarray(np.hstack([pre_cost, post_cost]) / trading_capital * 100)
+    alpha = 2.0 / (vol_lookback + 1.0)
+    stats = np.full((perc_returns.shape[1], len(_STAT_FIELDS)), np.nan)
+    if len(perc_returns) > 0:
+        if backend == 'numba':
+            _returns_stats_loop_jit(np.ascontiguousarray(perc_returns.T), alpha, max(vol_min_periods, 1), stats)
+        else:
+            _returns_stats_numpy(perc_returns, alpha, max(vol_min_periods, 1), stats)
+
+    count, total, ewm_std, max_drawdown, skew = stats.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        sharpe_ratio = np.sqrt(trading_days_in_year) * mean / ewm_std
+    pre, post = slice(0, n_instruments), slice(n_instruments, None)
+
+    ann_turnover = np.full(n_instruments, np.nan)
+    if positions is not None and average_positions is not None:
+        turnover = np.zeros((n_instruments, 2))
+        if backend == 'numba':
+            _turnover_loop_jit(
+                np.ascontiguousarray(_as_2d(positions).T),
+                np.ascontiguousarray(_as_2d(average_positions).T),
+                turnover
+            )
+        else:
+            _turnover_numpy(_as_2d(positions), _as_2d(average_positions), turnover)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ann_turnover = turnover[:, 0] / turnover[:, 1] * trading_days_in_year
+
+    metrics = {
+        'total_return': total[post],
+        'mean_ann_return': mean[post] * trading_days_in_year,
+        'std_dev': ewm_std[post],
+        'sharpe_ratio': sharpe_ratio[post],
+        'pre_cost_sr': sharpe_ratio[pre],
+        'post_cost_sr': sharpe_ratio[post],
+        'trading_costs_sr': sharpe_ratio[pre] - sharpe_ratio[post],
+        'ann_turnover': ann_turnover,
+        'max_drawdown': max_drawdown[post],
+        'skew': skew[post],
+    }
+    if is_frame:
+        return PerformanceMetrics(instruments=list(post_cost_pnl.columns), **metrics)
+    return PerformanceMetrics(**{field: float(value[0]) for field, value in metrics.items()})
@@ -0,0 +1,38 @@
+-- Upgrades an existing ohlcv table to the layout in kq-datahub/init.sql
+--
+-- Replaces the coin_id and (coin_id, interval) indexes with one
+-- (coin_id, interval, time_close) index, so reads filtered by symbol and
+-- interval come back already ordered instead of being sorted after the
+-- filter, and adds the unique bar constraint ingestion relies on.
+--
+-- Run with: psql -h $DB_HOST -U $DB_USER -d $DB_DB -f migrations/001_ohlcv_range_scan_index.sql
+-- The whole migration runs in one transaction and locks ohlcv for writes while it runs.
+
+BEGIN;
+
+-- Drop duplicate bars that slipped past the scraper's anti-join, keeping the first insert
+DELETE FROM ohlcv newer
+USING ohlcv older
+WHERE newer.coin_id = older.coin_id
+AND newer.interval = older.interval
+AND newer.time_open = older.time_open
+AND newer.id > older.id;
+
+CREATE INDEX IF NOT EXISTS idx_ohlcv_cid_intvl_tclose ON ohlcv(coin_id, interval, time_close) INCLUDE (close);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'uq_ohlcv_cid_intvl_topen'
+    ) THEN
+        ALTER TABLE ohlcv ADD CONSTRAINT uq_ohlcv_cid_intvl_topen UNIQUE (coin_id, interval, time_open);
+    END IF;
+END $$;
+
+-- Both are prefixes of the new composite index
+DROP INDEX IF EXISTS idx_ohlcv_coin_id;
+DROP INDEX IF EXISTS idx_ohlcv_cid_intvl_composite;
+
+COMMIT;
+
+ANALYZE ohlcv;
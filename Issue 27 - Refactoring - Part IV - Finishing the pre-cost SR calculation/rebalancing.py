@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# same offset as zero_safe_divide in backtest_refactored
+EPSILON = 1e-9
+
+
+def _rebalance_loop(ideal, threshold, epsilon, out):
+    # plain loop over (bars, instruments), compiled by numba when available
+    n_bars, n_instruments = ideal.shape
+    for j in range(n_instruments):
+        current = ideal[0, j]
+        out[0, j] = current
+        for i in range(1, n_bars):
+            if np.isnan(current):
+                current = 0.0
+            target = ideal[i, j]
+            deviation = abs(target - current) / (abs(target) + epsilon)
+            if deviation > threshold:
+                current = target
+            out[i, j] = current
+    return out
+
+
+_rebalance_loop_jit = njit(cache=True)(_rebalance_loop) if njit is not None else None
+
+
+def _rebalance_numpy(ideal, threshold, epsilon, out):
+    # one pass over time, vectorized across instruments
+    current = ideal[0].copy()
+    out[0] = current
+    for i in range(1, ideal.shape[0]):
+        current[np.isnan(current)] = 0.0
+        target = ideal[i]
+        with np.errstate(invalid='ignore'):
+            deviation = np.abs(target - current) / (np.abs(target) + epsilon)
+            trade = deviation > threshold
+        current[trade] = target[trade]
+        out[i] = current
+    return out
+
+
+def available_backends():
+    """List the rebalancing backends usable in this environment"""
+    return ['numba', 'numpy'] if _rebalance_loop_jit is not None else ['numpy']
+
+
+def rebalance_array(ideal, rebalance_threshold, backend='auto', epsilon=EPSILON):
+    """Apply the error threshold rebalancing rule to raw position arrays
+
+    Args:
+        ideal (np.ndarray): Ideal positions, 1-D (bars) or 2-D (bars x instruments)
+        rebalance_threshold (float): Relative deviation required to trade, e.g. 0.10
+        backend (str): 'numba', 'numpy' or 'auto' (numba if installed)
+        epsilon (float): Offset for the zero-safe division of the deviation
+
+    Returns:
+        np.ndarray: Rebalanced positions with the same shape as the input
+
+    Raises:
+        ValueError: If the backend is unknown or not installed
+    """
+    if backend == 'auto':
+        backend = available_backends()[0]
+    if backend not in ('numba', 'numpy'):
+        raise ValueError(f"Unknown rebalancing backend '{backend}'. Available backends: {available_backends()}")
+    if backend not in available_backends():
+        raise ValueError(f"Rebalancing backend '{backend}' is not installed. Available backends: {available_backends()}")
+
+    ideal = np.asarray(ideal, dtype=float)
+    is_1d = ideal.ndim == 1
+    ideal_2d = np.ascontiguousarray(ideal.reshape(-1, 1) if is_1d else ideal)
+
+    out = np.empty_like(ideal_2d)
+    if len(ideal_2d) > 0:
+        if backend == 'numba':
+            _rebalance_loop_jit(ideal_2d, float(rebalance_threshold), float(epsilon), out)
+        else:
+            _rebalance_numpy(ideal_2d, rebalance_threshold, epsilon, out)
+
+    return out[:, 0] if is_1d else out
+
+
+def rebalance_positions(ideal_positions, rebalance_threshold, backend='auto'):
+    """Rebalance a Series (one instrument) or DataFrame (one column per instrument)"""
+    rebalanced = rebalance_array(ideal_positions.to_numpy(dtype=float), rebalance_threshold, backend)
+    if isinstance(ideal_positions, pd.DataFrame):
+        return pd.DataFrame(rebalanced, index=ideal_positions.index, columns=ideal_positions.columns)
+    return pd.Series(rebalanced, index=ideal_positions.index, name=ideal_positions.name)
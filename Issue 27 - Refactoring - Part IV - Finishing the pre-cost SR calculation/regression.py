@@ -0,0 +1,188 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 - pandas' parquet engine
+except ImportError:
+    pyarrow = None
+
+
+GOLDEN_DIR = 'golden'
+DEFAULT_RTOL = 0.0001
+MAX_REPORTED = 10
+
+# same offset as zero_safe_divide in backtest_refactored
+EPSILON = 1e-9
+
+
+def golden_path(name, golden_dir=GOLDEN_DIR, labelled=True):
+    return os.path.join(golden_dir, f"{name}.parquet" if labelled else f"{name}.npy")
+
+
+def save_golden(name, values, golden_dir=GOLDEN_DIR):
+    """Store expected values, Series/DataFrames as Parquet (keeps index and symbols), arrays as .npy"""
+    os.makedirs(golden_dir, exist_ok=True)
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        if pyarrow is None:
+            raise ImportError("Labelled golden files require pyarrow, install it with 'pip install pyarrow'")
+        frame = values.to_frame() if isinstance(values, pd.Series) else values
+        frame.rename(columns=str).to_parquet(golden_path(name, golden_dir))
+    else:
+        np.save(golden_path(name, golden_dir, labelled=False), np.asarray(values, dtype=float))
+
+
+def load_golden(name, golden_dir=GOLDEN_DIR):
+    """Expected values saved by save_golden, a single column frame comes back as a Series
+
+    Raises:
+        FileNotFoundError: If no golden file with that name exists
+    """
+    parquet_path = golden_path(name, golden_dir)
+    if os.path.exists(parquet_path):
+        frame = pd.read_parquet(parquet_path)
+        return frame.iloc[:, 0] if frame.shape[1] == 1 else frame
+
+    npy_path = golden_path(name, golden_dir, labelled=False)
+    if os.path.exists(npy_path):
+        return np.load(npy_path)
+
+    available = sorted(os.path.splitext(f)[0] for f in os.listdir(golden_dir)) if os.path.isdir(golden_dir) else []
+    raise FileNotFoundError(f"No golden file '{name}' in '{golden_dir}'. Available golden files: {available}")
+
+
+def golden_from_csv(csv_path, name, golden_dir=GOLDEN_DIR, index_column='time_close'):
+    """Convert one of backtest.py's CSV outputs, e.g. ideal_pos_contracts.csv, into a golden file"""
+    frame = pd.read_csv(csv_path, index_col=index_column, parse_dates=[index_column])
+    save_golden(name, frame.iloc[:, 0] if frame.shape[1] == 1 else frame, golden_dir)
+
+
+def _labels(values, n_rows, n_columns):
+    index = values.index if isinstance(values, (pd.Series, pd.DataFrame)) else pd.RangeIndex(n_rows)
+    if isinstance(values, pd.DataFrame):
+        columns = values.columns
+    elif isinstance(values, pd.Series):
+        columns = pd.Index([values.name])
+    else:
+        columns = pd.RangeIndex(n_columns)
+    return index, columns
+
+
+def _as_2d(values):
+    values = np.asarray(values, dtype=float)
+    return values.reshape(-1, 1) if values.ndim == 1 else values
+
+
+def find_deviations(actual, expected, rtol=DEFAULT_RTOL, epsilon=EPSILON):
+    """Every element whose relative difference exceeds rtol, compared by position
+
+    Works on a single instrument or a whole universe (one column per
+    instrument) at once. Bars where either side is NaN are not compared.
+
+    Returns:
+        pd.DataFrame: One row per deviation with its bar, instrument, the
+            values one bar before and at the deviation, and the relative difference
+    """
+    actual_values, expected_values = _as_2d(actual), _as_2d(expected)
+    if actual_values.shape != expected_values.shape:
+        raise ValueError(f"Shape mismatch: actual {actual_values.shape}, expected {expected_values.shape}")
+
+    with np.errstate(invalid='ignore'):
+        rel_diff = np.abs(actual_values - expected_values) / (np.abs(expected_values) + epsilon)
+        rows, columns = np.nonzero(rel_diff > rtol)
+
+    index, column_labels = _labels(actual, *actual_values.shape)
+    previous = np.maximum(rows - 1, 0)
+    return pd.DataFrame({
+        'bar': rows,
+        'time': index[rows],
+        'instrument': column_labels[columns],
+        'expected_before': np.where(rows > 0, expected_values[previous, columns], np.nan),
+        'actual_before': np.where(rows > 0, actual_values[previous, columns], np.nan),
+        'expected': expected_values[rows, columns],
+        'actual': actual_values[rows, columns],
+        'rel_diff': rel_diff[rows, columns],
+    })
+
+
+def format_deviations(deviations, title, max_reported=MAX_REPORTED):
+    lines = [f"{title}: {len(deviations)} deviations"]
+    if len(deviations) > max_reported:
+        lines[0] += f", first {max_reported} shown"
+    lines.append(deviations.head(max_reported).to_string(index=False, float_format='{:.6g}'.format))
+    return '\n'.join(lines)
+
+
+def assert_matches_golden(actual, expected, title, rtol=DEFAULT_RTOL, max_reported=MAX_REPORTED):
+    """Raise with the first max_reported deviations and their previous bar if anything differs
+
+    Args:
+        actual: Series, DataFrame or array under test
+        expected: Golden values, or the name of a golden file
+        title (str): Used in the report, e.g. 'Rebalanced positions'
+    """
+    if isinstance(expected, str):
+        expected = load_golden(expected)
+
+    deviations = find_deviations(actual, expected, rtol)
+    if len(deviations):
+        raise AssertionError(format_deviations(deviations, f"{title} deviate more than {rtol:.2%}", max_reported))
+    return deviations
+
+
+def find_rebalance_violations(positions, threshold, ideal_positions=None, epsilon=EPSILON):
+    """Bars breaking the error threshold rule, for one instrument or a whole universe
+
+    Without ideal positions every change must be a real move: a bar that
+    changes the position must change its absolute size, and a bar whose
+    relative change is within the threshold must keep it. With ideal
+    positions the rule itself is checked: each bar holds the ideal position
+    if it deviates more than threshold from the previous holding, otherwise
+    the previous holding.
+
+    Returns:
+        pd.DataFrame: One row per violating bar
+    """
+    held = _as_2d(positions)
+    previous = np.vstack([np.full((1, held.shape[1]), np.nan), held[:-1]])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if ideal_positions is None:
+            change = np.abs(held - previous)
+            deviation = np.where(np.abs(held) > 0, change / np.abs(held) * 100, 0)
+            traded = deviation > threshold
+            violation = np.where(traded, np.abs(held) == np.abs(previous), np.abs(held) != np.abs(previous))
+            expected = np.where(traded, np.nan, previous)
+        else:
+            ideal = _as_2d(ideal_positions)
+            current = np.nan_to_num(previous, nan=0.0)
+            traded = np.abs(ideal - current) / (np.abs(ideal) + epsilon) > threshold
+            expected = np.where(traded, ideal, current)
+            violation = ~((held == expected) | (np.isnan(held) & np.isnan(expected)))
+    violation[0] = False
+
+    rows, columns = np.nonzero(violation)
+    index, column_labels = _labels(positions, *held.shape)
+    return pd.DataFrame({
+        'bar': rows,
+        'time': index[rows],
+        'instrument': column_labels[columns],
+        'previous': previous[rows, columns],
+        'position': held[rows, columns],
+        'expected': expected[rows, columns],
+    })
+
+
+def assert_rebalance_rule(positions, threshold, ideal_positions=None, max_reported=MAX_REPORTED):
+    violations = find_rebalance_violations(positions, threshold, ideal_positions)
+    if len(violations):
+        raise AssertionError(format_deviations(violations, "Rebalancing rule violated", max_reported))
+    return violations
+
+
+if __name__ == "__main__":
+    # refresh the golden files from backtest.py's CSV outputs
+    golden_from_csv('ideal_pos_contracts.csv', 'ideal_pos_contracts')
+    golden_from_csv('rebalanced_pos_contracts.csv', 'rebalanced_pos_contracts')
+    print(f"Golden files written to '{GOLDEN_DIR}': {sorted(os.listdir(GOLDEN_DIR))}")
@@ -0,0 +1,224 @@
+from contextlib import contextmanager
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows, appends from several processes are not serialized
+    fcntl = None
+
+
+DEFAULT_QUANTITIES = ('rebalanced_position', 'pnl')
+
+
+class ResultStore:
+    """Append-only, memory-mapped store of per-bar backtest arrays
+
+    Every run shares one time axis and symbol list and holds a (bars,
+    instruments) block per quantity. Each quantity is one raw binary file
+    that grows by one block per run, runs.jsonl indexes the run parameters.
+    Reads memory-map the files, so slicing a few runs or symbols out of a
+    sweep larger than RAM only touches those pages.
+
+    Layout of a store directory:
+        meta.json       dtype, symbols, quantities and time axis name/unit
+        index.npy       time axis as int64 nanoseconds
+        <quantity>.bin  (runs, bars, instruments) blocks back to back
+        runs.jsonl      one line of parameters per complete run
+        runs.lock       held by a writer while it appends
+    """
+
+    META_FILE = 'meta.json'
+    INDEX_FILE = 'index.npy'
+    RUNS_FILE = 'runs.jsonl'
+    LOCK_FILE = 'runs.lock'
+
+    def __init__(self, directory, index=None, symbols=None, quantities=DEFAULT_QUANTITIES, dtype='float64'):
+        """
+        Args:
+            directory (str): Store location, created if it doesn't exist
+            index (pd.DatetimeIndex): Time axis of every run, only needed to create a store
+            symbols (list): Instrument columns of every run, only needed to create a store
+            quantities (tuple): Arrays stored per run
+            dtype (str): Storage type of the arrays
+
+        Raises:
+            ValueError: If a new store is opened without index and symbols
+        """
+        self.directory = directory
+        meta_path = os.path.join(directory, self.META_FILE)
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.symbols = meta['symbols']
+            self.quantities = tuple(meta['quantities'])
+            self.dtype = np.dtype(meta['dtype'])
+            timestamps = np.load(os.path.join(directory, self.INDEX_FILE))
+            self.index = pd.DatetimeIndex(
+                timestamps.view('datetime64[ns]'), name=meta['index_name']
+            ).as_unit(meta['index_unit'])
+        else:
+            if index is None or symbols is None:
+                raise ValueError(f"Creating the result store '{directory}' requires index and symbols")
+            os.makedirs(directory, exist_ok=True)
+            self.index = pd.DatetimeIndex(index)
+            self.symbols = list(symbols)
+            self.quantities = tuple(quantities)
+            self.dtype = np.dtype(dtype)
+
+            np.save(os.path.join(directory, self.INDEX_FILE), self.index.as_unit('ns').asi8)
+            with open(meta_path, 'w') as f:
+                json.dump({
+                    'symbols': self.symbols,
+                    'quantities': list(self.quantities),
+                    'dtype': self.dtype.name,
+                    'index_name': self.index.name,
+                    'index_unit': self.index.unit
+                }, f)
+
+        self._runs = self._load_runs()
+
+    @property
+    def block_shape(self):
+        return len(self.index), len(self.symbols)
+
+    @property
+    def block_bytes(self):
+        return int(np.prod(self.block_shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return len(self._runs)
+
+    def _data_path(self, quantity):
+        return os.path.join(self.directory, f"{quantity}.bin")
+
+    def _runs_path(self):
+        return os.path.join(self.directory, self.RUNS_FILE)
+
+    def _load_runs(self):
+        # only newline terminated lines are committed runs, a trailing partial line
+        # is an append still being written (or an interrupted one) and is skipped
+        path = self._runs_path()
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            lines = f.read().split('\n')
+
+        runs = []
+        for line in lines[:-1]:
+            try:
+                runs.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        return runs
+
+    @contextmanager
+    def _writer_lock(self):
+        with open(os.path.join(self.directory, self.LOCK_FILE), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _repair_runs(self):
+        # only called under the writer lock, where a partial last line can only be
+        # left by an interrupted append, cut it so the next line starts clean
+        path = self._runs_path()
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            content = f.read()
+            f.truncate(content.rfind(b'\n') + 1)
+
+    def append(self, params, arrays):
+        """Store one run, returns its run id
+
+        Arrays are written first and the parameter line last, so a run
+        interrupted half way is never listed and gets overwritten by the
+        next append.
+
+        Args:
+            params (dict): JSON serializable run parameters, e.g. lookbacks and threshold
+            arrays (dict): Quantity -> (bars, instruments) ndarray or DataFrame
+        """
+        missing = [quantity for quantity in self.quantities if quantity not in arrays]
+        if missing:
+            raise ValueError(f"Run is missing quantities {missing}. Available quantities: {list(self.quantities)}")
+
+        blocks = {}
+        for quantity in self.quantities:
+            block = arrays[quantity]
+            if isinstance(block, pd.DataFrame):
+                block = block.reindex(index=self.index, columns=self.symbols).to_numpy()
+            block = np.ascontiguousarray(block, dtype=self.dtype)
+            if block.shape != self.block_shape:
+                raise ValueError(f"'{quantity}' has shape {block.shape}, expected {self.block_shape}")
+            blocks[quantity] = block
+
+        with self._writer_lock():
+            self._repair_runs()
+            # other writers may have appended since this store was opened
+            self._runs = self._load_runs()
+            run_id = len(self._runs)
+            for quantity, block in blocks.items():
+                with open(self._data_path(quantity), 'ab') as f:
+                    f.truncate(run_id * self.block_bytes)
+                    f.write(block.tobytes())
+
+            run = {'run_id': run_id, **params}
+            with open(self._runs_path(), 'a') as f:
+                f.write(json.dumps(run) + '\n')
+        self._runs.append(run)
+        return run_id
+
+    def runs(self):
+        """Parameters of every stored run, indexed by run id"""
+        if not self._runs:
+            return pd.DataFrame(columns=['run_id']).set_index('run_id')
+        return pd.DataFrame(self._runs).set_index('run_id')
+
+    def select(self, **params):
+        """Run ids whose parameters equal every given value"""
+        runs = self.runs()
+        is_match = pd.Series(True, index=runs.index)
+        for name, value in params.items():
+            if name not in runs.columns:
+                raise ValueError(f"Unknown run parameter '{name}'. Available parameters: {list(runs.columns)}")
+            is_match &= runs[name] == value
+        return list(runs.index[is_match])
+
+    def read(self, quantity):
+        """Read-only memmap of shape (runs, bars, instruments), nothing is loaded until sliced"""
+        if quantity not in self.quantities:
+            raise ValueError(f"Unknown quantity '{quantity}'. Available quantities: {list(self.quantities)}")
+        if not self._runs:
+            return np.empty((0,) + self.block_shape, dtype=self.dtype)
+        return np.memmap(
+            self._data_path(quantity),
+            dtype=self.dtype,
+            mode='r',
+            shape=(len(self._runs),) + self.block_shape
+        )
+
+    def get_run(self, run_id, quantity, symbols=None):
+        """One run's quantity as a DataFrame, optionally only some symbols"""
+        block = self.read(quantity)[run_id]
+        if symbols is None:
+            return pd.DataFrame(np.array(block), index=self.index, columns=self.symbols)
+
+        columns = [self.symbols.index(symbol) for symbol in symbols]
+        return pd.DataFrame(np.array(block[:, columns]), index=self.index, columns=list(symbols))
+
+    def get_symbol(self, symbol, quantity, run_ids=None):
+        """One symbol across runs, columns are run ids"""
+        column = self.symbols.index(symbol)
+        run_ids = list(range(len(self._runs))) if run_ids is None else list(run_ids)
+        values = self.read(quantity)[run_ids, :, column]
+        return pd.DataFrame(np.array(values).T, index=self.index, columns=run_ids)
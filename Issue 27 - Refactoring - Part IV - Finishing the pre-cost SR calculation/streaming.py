@@ -0,0 +1,170 @@
+import math
+
+from trading_rules import TradingRule
+
+import pandas as pd
+
+
+def ewm_update(value, mean_value, cov, old_wt, sum_wt, sum_wt2, decay):
+    """One bar of pandas' ewm recurrence for adjust=True, ignore_na=False
+
+    Plain floats in and out, so metrics.py compiles the same step with numba.
+
+    Returns:
+        tuple: The new (mean_value, cov, old_wt, sum_wt, sum_wt2)
+    """
+    is_observation = not math.isnan(value)
+    if not math.isnan(mean_value):
+        sum_wt *= decay
+        sum_wt2 *= decay * decay
+        old_wt *= decay
+        if is_observation:
+            old_mean = mean_value
+            # avoid numerical drift on constant series, as pandas does
+            if mean_value != value:
+                mean_value = (old_wt * old_mean + value) / (old_wt + 1.0)
+            cov = (
+                old_wt * (cov + (old_mean - mean_value) * (old_mean - mean_value))
+                + (value - mean_value) * (value - mean_value)
+            ) / (old_wt + 1.0)
+            sum_wt += 1.0
+            sum_wt2 += 1.0
+            old_wt += 1.0
+    elif is_observation:
+        mean_value = value
+    return mean_value, cov, old_wt, sum_wt, sum_wt2
+
+
+def ewm_var(cov, sum_wt, sum_wt2):
+    """Bias corrected variance of the ewm_update state, NaN while it is undefined"""
+    numerator = sum_wt * sum_wt
+    denominator = numerator - sum_wt2
+    return (numerator / denominator) * cov if denominator > 0 else math.nan
+
+
+class EWMState:
+    """O(1) per bar state of pandas' ewm(span=..., min_periods=...)
+
+    Follows the recurrence pandas uses for adjust=True, ignore_na=False,
+    so mean() and std() reproduce ewm(...).mean() and ewm(...).std()
+    (bias=False) bar by bar. NaN inputs decay the weights but are not
+    counted as observations.
+    """
+
+    def __init__(self, span, min_periods=0):
+        if span < 1:
+            raise ValueError(f"span must be >= 1, got {span}")
+        self.span = span
+        self.min_periods = max(min_periods, 1)
+        self.alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+        self.reset()
+
+    def reset(self):
+        self.mean_value = math.nan
+        self.cov = 0.0
+        self.old_wt = 1.0
+        self.sum_wt = 1.0
+        self.sum_wt2 = 1.0
+        self.nobs = 0
+
+    def update(self, value):
+        self.nobs += not math.isnan(value)
+        self.mean_value, self.cov, self.old_wt, self.sum_wt, self.sum_wt2 = ewm_update(
+            value, self.mean_value, self.cov, self.old_wt, self.sum_wt, self.sum_wt2, 1.0 - self.alpha
+        )
+
+    def mean(self):
+        return self.mean_value if self.nobs >= self.min_periods else math.nan
+
+    def var(self):
+        if self.nobs < self.min_periods or math.isnan(self.mean_value):
+            return math.nan
+        return ewm_var(self.cov, self.sum_wt, self.sum_wt2)
+
+    def std(self):
+        var = self.var()
+        if math.isnan(var):
+            return math.nan
+        # clip tiny negative variances to zero like pandas' zsqrt
+        return math.sqrt(var) if var > 0 else 0.0
+
+    def to_checkpoint(self):
+        """JSON serializable snapshot of the recurrence state"""
+        return {
+            'span': self.span,
+            'min_periods': self.min_periods,
+            'mean_value': self.mean_value,
+            'cov': self.cov,
+            'old_wt': self.old_wt,
+            'sum_wt': self.sum_wt,
+            'sum_wt2': self.sum_wt2,
+            'nobs': self.nobs
+        }
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        state = cls(checkpoint['span'], checkpoint['min_periods'])
+        for field in ('mean_value', 'cov', 'old_wt', 'sum_wt', 'sum_wt2', 'nobs'):
+            setattr(state, field, checkpoint[field])
+        return state
+
+
+class StreamingVol:
+    """Incremental calculate_vol(feature_series.diff(), lookback, min_periods)"""
+
+    def __init__(self, lookback, min_periods=10):
+        self.ewm = EWMState(lookback, min_periods)
+        self.last_value = math.nan
+
+    def update(self, value):
+        self.ewm.update(value - self.last_value)
+        self.last_value = value
+        return self.ewm.std()
+
+    def to_checkpoint(self):
+        return {'ewm': self.ewm.to_checkpoint(), 'last_value': self.last_value}
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        vol = cls(checkpoint['ewm']['span'])
+        vol.ewm = EWMState.from_checkpoint(checkpoint['ewm'])
+        vol.last_value = checkpoint['last_value']
+        return vol
+
+
+class StreamingEMAC(TradingRule):
+    """EMAC that updates its forecast in O(1) per new bar
+
+    get_raw_forecast still accepts a full history, it replays the bars
+    through fresh state and matches EMAC.get_raw_forecast.
+    """
+
+    def __init__(self, fast_lookback=2, slow_lookback=None):
+        self.fast_lookback = fast_lookback
+        self.slow_lookback = slow_lookback or fast_lookback * 4
+        self.reset()
+
+    def reset(self):
+        self.fast = EWMState(self.fast_lookback, self.fast_lookback)
+        self.slow = EWMState(self.slow_lookback, self.slow_lookback)
+
+    def update(self, value):
+        """Feed one bar, returns the latest raw forecast"""
+        self.fast.update(value)
+        self.slow.update(value)
+        return self.fast.mean() - self.slow.mean()
+
+    def get_raw_forecast(self, data_series):
+        self.reset()
+        forecasts = [self.update(value) for value in data_series.to_numpy(dtype=float)]
+        return pd.Series(forecasts, index=data_series.index)
+
+    def to_checkpoint(self):
+        return {'fast': self.fast.to_checkpoint(), 'slow': self.slow.to_checkpoint()}
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        rule = cls(checkpoint['fast']['span'], checkpoint['slow']['span'])
+        rule.fast = EWMState.from_checkpoint(checkpoint['fast'])
+        rule.slow = EWMState.from_checkpoint(checkpoint['slow'])
+        return rule
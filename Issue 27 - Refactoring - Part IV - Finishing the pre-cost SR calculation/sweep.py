@@ -0,0 +1,262 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+from backtest_refactored import calculate_pnl
+
+from data_sources import DBStore
+from data_sources import PriceReader
+
+from feature_cache import FeatureCache
+from result_store import ResultStore
+from trading_rules import EMAC
+from universe import Universe, run_universe_backtest
+
+import numpy as np
+import pandas as pd
+
+
+RESULT_COLUMNS = ['fast_lookback', 'slow_lookback', 'symbol', 'pre_cost_sr', 'rebalanced_position']
+
+# per worker process view on the shared price block, set by _attach_prices
+_worker_state = {}
+
+
+class SharedPriceFrame:
+    """Wide price frame copied once into shared memory
+
+    Workers attach to the block by name instead of receiving a pickled
+    DataFrame with every task.
+    """
+
+    def __init__(self, price_frame):
+        self.symbols = list(price_frame.columns)
+        self.index_name = price_frame.index.name
+        self.shape = price_frame.shape
+
+        values = np.ascontiguousarray(price_frame.to_numpy(dtype=float))
+        timestamps = price_frame.index.to_numpy(dtype='datetime64[ns]').view('int64')
+
+        self._values_shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self._index_shm = shared_memory.SharedMemory(create=True, size=max(timestamps.nbytes, 1))
+        np.ndarray(values.shape, dtype=float, buffer=self._values_shm.buf)[:] = values
+        np.ndarray(timestamps.shape, dtype='int64', buffer=self._index_shm.buf)[:] = timestamps
+
+    @property
+    def handle(self):
+        """Small picklable description of the shared block"""
+        return (self._values_shm.name, self._index_shm.name, self.shape, self.symbols, self.index_name)
+
+    def close(self):
+        for shm in (self._values_shm, self._index_shm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _attach_prices(handle, trading_days_in_year, contract_unit, feature_name):
+    values_name, index_name, shape, symbols, index_label = handle
+    values_shm = shared_memory.SharedMemory(name=values_name)
+    index_shm = shared_memory.SharedMemory(name=index_name)
+
+    values = np.ndarray(shape, dtype=float, buffer=values_shm.buf)
+    timestamps = np.ndarray(shape[:1], dtype='int64', buffer=index_shm.buf)
+    index = pd.DatetimeIndex(timestamps.view('datetime64[ns]'), name=index_label)
+
+    _worker_state.update(
+        shms=(values_shm, index_shm),
+        price_frame=pd.DataFrame(values, index=index, columns=symbols, copy=False),
+        trading_days_in_year=trading_days_in_year,
+        contract_unit=contract_unit,
+        feature_name=feature_name,
+        # EWMs of a symbol chunk are reused by every lookback pair this worker runs
+        feature_cache=FeatureCache()
+    )
+
+
+def _chunk_universe(chunk_id, symbols):
+    feature_name = _worker_state['feature_name']
+    return Universe(
+        f'sweep_chunk_{chunk_id}',
+        {feature_name: _worker_state['price_frame'][symbols]},
+        trading_days_in_year=_worker_state['trading_days_in_year'],
+        contract_unit=_worker_state['contract_unit'],
+        feature_cache=_worker_state['feature_cache']
+    )
+
+
+def _run_sweep_task(fast_lookback, slow_lookback, chunk_id, symbols, account_balance,
+                    ann_perc_risk_target, rebalance_threshold):
+    result = run_universe_backtest(
+        EMAC(fast_lookback, slow_lookback),
+        _chunk_universe(chunk_id, symbols),
+        _worker_state['feature_name'],
+        account_balance,
+        ann_perc_risk_target,
+        rebalance_threshold
+    )
+    return pd.DataFrame({
+        'fast_lookback': fast_lookback,
+        'slow_lookback': slow_lookback,
+        'symbol': symbols,
+        'pre_cost_sr': result['pre_cost_sr'].ffill().iloc[-1].to_numpy(),
+        'rebalanced_position': result['rebalanced_position'].iloc[-1].to_numpy()
+    }, columns=RESULT_COLUMNS)
+
+
+def iter_sweep(price_frame, lookback_pairs, account_balance, ann_perc_risk_target, rebalance_threshold,
+               trading_days_in_year=365, contract_unit=1, feature_name='close',
+               symbols_per_task=50, max_workers=None):
+    """Run every (fast, slow) EMAC pair over every symbol on a process pool
+
+    Yields one tidy results frame per finished task, in completion order.
+
+    Args:
+        price_frame (pd.DataFrame): Wide prices, one column per symbol
+        lookback_pairs (list): (fast_lookback, slow_lookback) tuples
+        symbols_per_task (int): Symbols evaluated column-wise by a single task
+        max_workers (int): Worker processes, defaults to the CPU count
+    """
+    symbols = list(price_frame.columns)
+    symbol_chunks = [symbols[i:i + symbols_per_task] for i in range(0, len(symbols), symbols_per_task)]
+
+    with SharedPriceFrame(price_frame) as shared_prices:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_attach_prices,
+            initargs=(shared_prices.handle, trading_days_in_year, contract_unit, feature_name)
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _run_sweep_task,
+                    fast_lookback,
+                    slow_lookback,
+                    chunk_id,
+                    chunk,
+                    account_balance,
+                    ann_perc_risk_target,
+                    rebalance_threshold
+                )
+                for fast_lookback, slow_lookback in lookback_pairs
+                for chunk_id, chunk in enumerate(symbol_chunks)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def run_sweep(price_frame, lookback_pairs, account_balance, ann_perc_risk_target, rebalance_threshold, **kwargs):
+    """Collect iter_sweep into one tidy table sorted by parameters and symbol"""
+    results = list(iter_sweep(
+        price_frame, lookback_pairs, account_balance, ann_perc_risk_target, rebalance_threshold, **kwargs
+    ))
+    if not results:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(results, ignore_index=True).sort_values(
+        ['fast_lookback', 'slow_lookback', 'symbol']
+    ).reset_index(drop=True)
+
+
+def _run_array_task(fast_lookback, slow_lookback, rebalance_threshold, chunk_id, symbols, account_balance,
+                    ann_perc_risk_target):
+    universe = _chunk_universe(chunk_id, symbols)
+    result = run_universe_backtest(
+        EMAC(fast_lookback, slow_lookback),
+        universe,
+        _worker_state['feature_name'],
+        account_balance,
+        ann_perc_risk_target,
+        rebalance_threshold
+    )
+    rebalanced_positions = result['rebalanced_position']
+    return (fast_lookback, slow_lookback, rebalance_threshold), symbols, {
+        'rebalanced_position': rebalanced_positions.to_numpy(),
+        'pnl': calculate_pnl(universe, rebalanced_positions).to_numpy()
+    }
+
+
+def run_sweep_to_store(price_frame, lookback_pairs, rebalance_thresholds, account_balance, ann_perc_risk_target,
+                       store_dir, trading_days_in_year=365, contract_unit=1, feature_name='close',
+                       symbols_per_task=50, max_workers=None):
+    """Sweep lookback pairs x rebalance thresholds, appending per-bar arrays to a ResultStore
+
+    Symbol chunks of a parameter set are assembled in the parent process and
+    appended as one run as soon as the last chunk arrives, so at most the
+    parameter sets still in flight are held in memory.
+
+    Returns:
+        ResultStore: Store with one run per (fast_lookback, slow_lookback, rebalance_threshold)
+    """
+    symbols = list(price_frame.columns)
+    symbol_chunks = [symbols[i:i + symbols_per_task] for i in range(0, len(symbols), symbols_per_task)]
+    store = ResultStore(store_dir, index=price_frame.index, symbols=symbols)
+    if store.symbols != symbols or not store.index.equals(price_frame.index):
+        raise ValueError(f"Result store '{store_dir}' holds runs of a different universe")
+
+    pending = {}
+    chunks_done = {}
+    with SharedPriceFrame(price_frame) as shared_prices:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_attach_prices,
+            initargs=(shared_prices.handle, trading_days_in_year, contract_unit, feature_name)
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _run_array_task,
+                    fast_lookback,
+                    slow_lookback,
+                    rebalance_threshold,
+                    chunk_id,
+                    chunk,
+                    account_balance,
+                    ann_perc_risk_target
+                )
+                for fast_lookback, slow_lookback in lookback_pairs
+                for rebalance_threshold in rebalance_thresholds
+                for chunk_id, chunk in enumerate(symbol_chunks)
+            ]
+            for future in as_completed(futures):
+                params, chunk, arrays = future.result()
+                blocks = pending.setdefault(params, {
+                    quantity: np.full(store.block_shape, np.nan) for quantity in store.quantities
+                })
+                columns = [symbols.index(symbol) for symbol in chunk]
+                for quantity in store.quantities:
+                    blocks[quantity][:, columns] = arrays[quantity]
+
+                chunks_done[params] = chunks_done.get(params, 0) + 1
+                if chunks_done[params] == len(symbol_chunks):
+                    fast_lookback, slow_lookback, rebalance_threshold = params
+                    store.append({
+                        'fast_lookback': fast_lookback,
+                        'slow_lookback': slow_lookback,
+                        'rebalance_threshold': rebalance_threshold
+                    }, pending.pop(params))
+    return store
+
+
+def emac_lookback_grid(fast_lookbacks, slow_multipliers=(4,)):
+    """(fast, slow) pairs with the slow lookback as a multiple of the fast one"""
+    return [(fast, fast * multiplier) for fast in fast_lookbacks for multiplier in slow_multipliers]
+
+
+if __name__ == "__main__":
+    trading_frequency = '1D'
+
+    db_store = DBStore()
+    db_reader = PriceReader(db_store, index_column=0, price_column=1)
+    price_frame = db_reader.fetch_price_frame(db_store.fetch_symbols(), trading_frequency)
+
+    lookback_pairs = emac_lookback_grid([2, 4, 8, 16, 32, 64], slow_multipliers=(2, 4, 8))
+    sweep_results = run_sweep(
+        price_frame,
+        lookback_pairs,
+        account_balance=10_000,
+        ann_perc_risk_target=0.20,
+        rebalance_threshold=0.10
+    )
+    print(sweep_results.groupby(['fast_lookback', 'slow_lookback'])['pre_cost_sr'].median())
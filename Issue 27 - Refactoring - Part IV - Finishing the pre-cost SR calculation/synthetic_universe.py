@@ -0,0 +1,156 @@
+"""Synthetic price universes for load testing, no database required
+
+Vectorized versions of the generators in Issue 8's data_random.py, producing
+many paths per call. Every path draws from its own np.random.Generator,
+spawned from one seed, so a path is the same no matter how many other paths
+are generated alongside it.
+"""
+import numpy as np
+import pandas as pd
+
+
+def path_generators(n_paths, seed):
+    """One independent Generator per path
+
+    Args:
+        seed (int | np.random.SeedSequence): Root seed, path i always gets the same stream
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in root.spawn(n_paths)]
+
+
+def standard_normals(n_paths, n_bars, seed):
+    """(bars, paths) standard normal draws, column i from path i's generator"""
+    shocks = np.empty((n_bars, n_paths))
+    for i, rng in enumerate(path_generators(n_paths, seed)):
+        shocks[:, i] = rng.standard_normal(n_bars)
+    return shocks
+
+
+def generate_gbm_paths(n_paths, n_bars, S0=1.0, mu=0.1, sigma=0.2, dt=1 / 365, seed=None):
+    """Geometric Brownian Motion paths, exact in distribution at every bar
+
+    Args:
+        n_paths (int): Number of paths (columns)
+        n_bars (int): Number of time steps, the first bar is S0
+        S0 (float): Initial price
+        mu (float): Annual drift coefficient
+        sigma (float): Annual volatility coefficient
+        dt (float): Length of a bar in years
+        seed (int): Root seed of the per-path generators
+
+    Returns:
+        np.ndarray: Prices of shape (bars, paths)
+    """
+    shocks = standard_normals(n_paths, n_bars, seed)
+    log_returns = (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * shocks
+    log_returns[0] = 0.0
+    return S0 * np.exp(np.cumsum(log_returns, axis=0))
+
+
+def generate_ou_paths(n_paths, n_bars, S0=1.0, theta=0.8, mu=1.0, sigma=0.15, dt=1 / 365, seed=None):
+    """Ornstein-Uhlenbeck paths of the price itself, dS = theta (mu - S) dt + sigma dW
+
+    Uses the exact discretization
+        S[i] = mu + (S[i-1] - mu) e^(-theta dt) + sigma sqrt((1 - e^(-2 theta dt)) / (2 theta)) Z
+    instead of data_random.py's Euler step, so the transition is exact for
+    any bar length. The recursion runs once over time, vectorized across
+    paths. Like the original, prices are not bounded below by zero, keep
+    sigma small relative to mu.
+
+    Args:
+        theta (float): Speed of reversion, must be positive
+
+    Returns:
+        np.ndarray: Prices of shape (bars, paths)
+    """
+    if theta <= 0:
+        raise ValueError(f"theta must be positive for a mean reverting process, got {theta}")
+    decay = np.exp(-theta * dt)
+    shock_scale = sigma * np.sqrt((1 - decay ** 2) / (2 * theta))
+
+    shocks = standard_normals(n_paths, n_bars, seed)
+    prices = np.empty_like(shocks)
+    prices[0] = S0
+    for i in range(1, n_bars):
+        prices[i] = mu + (prices[i - 1] - mu) * decay + shock_scale * shocks[i]
+    return prices
+
+
+def generate_sine_paths(n_paths, n_bars, T=50, X=1.0, sigma=0.2, seed=None):
+    """Trend cycle plus Gaussian noise in log space, as generate_sine_series
+
+    The trend rises linearly from -X/2 to X/2 over T bars and falls back over
+    the next T bars, the noise has std sigma * X. All paths share the trend
+    and differ in noise.
+
+    Args:
+        T (int): Bars per half cycle of the trend
+        X (float): Amplitude of the trend
+        sigma (float): Noise scale relative to the amplitude
+
+    Returns:
+        np.ndarray: Prices of shape (bars, paths)
+    """
+    step = X / T
+    phase = np.arange(n_bars) % (2 * T)
+    trend = np.where(phase < T, -0.5 * X + phase * step, 0.5 * X - (phase - T) * step)
+
+    noise = standard_normals(n_paths, n_bars, seed) * (sigma * X)
+    return np.exp(trend[:, np.newaxis] + noise)
+
+
+MODELS = {
+    'gbm': generate_gbm_paths,
+    'ou': generate_ou_paths,
+    'sine': generate_sine_paths
+}
+
+
+def bars_per_year(frequency):
+    return pd.Timedelta('365D') / pd.Timedelta(frequency)
+
+
+def generate_universe(path_counts, n_bars, frequency='1D', start='2015-01-01', seed=42, model_params=None):
+    """Wide price frame of synthetic instruments, ready for Instrument or Universe
+
+    Args:
+        path_counts (dict): Model name -> number of paths, e.g. {'gbm': 900, 'ou': 100}
+        n_bars (int): Bars per path
+        frequency (str): Bar frequency of the DatetimeIndex, also sets dt of gbm and ou
+        start (str): First timestamp
+        seed (int): Root seed, each model and path gets its own stream from it
+        model_params (dict): Model name -> keyword arguments of its generator
+
+    Returns:
+        pd.DataFrame: One column per path named like 'GBM0', index 'time_close'
+
+    Raises:
+        ValueError: If a model is unknown
+    """
+    unknown = [model for model in path_counts if model not in MODELS]
+    if unknown:
+        raise ValueError(f"Unknown models {unknown}. Available models: {list(MODELS)}")
+    model_params = model_params or {}
+
+    # one child seed per model in MODELS order, adding paths of one model never shifts another's
+    model_seeds = dict(zip(MODELS, np.random.SeedSequence(seed).spawn(len(MODELS))))
+    blocks, columns = [], []
+    for model, n_paths in path_counts.items():
+        params = dict(model_params.get(model, {}))
+        if model in ('gbm', 'ou'):
+            params.setdefault('dt', 1 / bars_per_year(frequency))
+        blocks.append(MODELS[model](n_paths, n_bars, seed=model_seeds[model], **params))
+        columns += [f'{model.upper()}{i}' for i in range(n_paths)]
+
+    index = pd.date_range(start, periods=n_bars, freq=frequency, name='time_close')
+    return pd.DataFrame(np.hstack(blocks), index=index, columns=columns)
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    price_frame = generate_universe({'gbm': 2_000, 'ou': 500, 'sine': 500}, n_bars=3 * 365)
+    print(f"{price_frame.shape[1]} paths x {price_frame.shape[0]} bars in {time.perf_counter() - start:.2f}s")
+    print(price_frame.iloc[[0, -1], [0, 2_000, 2_500]])
@@ -1,4 +1,7 @@
-from backtest_refactored import zero_safe_divide
+from rebalancing import available_backends, rebalance_array, rebalance_positions
+from regression import assert_matches_golden, assert_rebalance_rule, load_golden
+from trading_rules import EMAC
+import os
 import pandas as pd
 import numpy as np
 
@@ -55,31 +58,292 @@ def test_scaled_forecast_properties(signal_series, expected_abs_avg, dev_thresho
     Found: {signal_abs_avg}"""
 
 
+def test_feature_cache(instrument, feature_name, lookback):
+    """Validate cached EWMs against direct computation and the LRU bookkeeping"""
+    from feature_cache import FeatureCache
+
+    feature_series = instrument.get_feature(feature_name)
+    expected_vol = feature_series.diff().ewm(span=lookback, min_periods=10).std()
+
+    cache = FeatureCache(max_entries=2)
+    instrument.feature_cache, original_cache = cache, instrument.feature_cache
+    try:
+        first = instrument.get_ewm(feature_name, 'std', lookback, 10, transform='diff')
+        second = instrument.get_ewm(feature_name, 'std', lookback, 10, transform='diff')
+        assert first.equals(expected_vol), "Cached EWM std differs from direct computation"
+        assert second is first, "Second lookup should be served from the cache"
+        assert cache.hits == 1 and cache.misses == 1, f"Unexpected cache stats {cache.stats()}"
+
+        instrument.get_ewm(feature_name, 'mean', lookback, lookback)
+        instrument.get_ewm(feature_name, 'mean', lookback * 2, lookback * 2)
+        assert len(cache) == 2, "Cache should evict beyond max_entries"
+        assert (instrument.name, feature_name, 'diff', 'std', lookback, 10) not in cache, "Least recently used entry should be evicted"
+    finally:
+        instrument.feature_cache = original_cache
+
+
+def test_streaming_matches_batch(instrument, feature_name, fast_lookback, slow_lookback, vol_lookback):
+    """Validate the streaming EMAC and vol state against the batch ewm values, across a checkpoint restore"""
+    import json
+    from streaming import StreamingEMAC, StreamingVol
+
+    feature_series = instrument.get_feature(feature_name)
+    expected_forecast = EMAC(fast_lookback, slow_lookback).get_raw_forecast(feature_series).to_numpy()
+    expected_vol = feature_series.diff().ewm(span=vol_lookback, min_periods=10).std().to_numpy()
+
+    rule = StreamingEMAC(fast_lookback, slow_lookback)
+    vol = StreamingVol(vol_lookback)
+    forecasts, vols = [], []
+    halfway = len(feature_series) // 2
+    for i, value in enumerate(feature_series.to_numpy(dtype=float)):
+        if i == halfway:
+            # round trip the live state as if the process restarted
+            rule = StreamingEMAC.from_checkpoint(json.loads(json.dumps(rule.to_checkpoint())))
+            vol = StreamingVol.from_checkpoint(json.loads(json.dumps(vol.to_checkpoint())))
+        forecasts.append(rule.update(value))
+        vols.append(vol.update(value))
+
+    assert np.array_equal(np.array(forecasts), expected_forecast, equal_nan=True), "Streaming EMAC differs from batch ewm"
+    assert np.array_equal(np.array(vols), expected_vol, equal_nan=True), "Streaming vol differs from batch ewm"
+
+
+def test_forecast_scaler(forecast, target_avg_forecast, min_periods):
+    """Validate the running median scaler against pandas' expanding median"""
+    from forecast_scaling import ForecastScaler
+
+    expected = (target_avg_forecast / forecast.abs().expanding(min_periods=min_periods).median()).bfill()
+
+    exact = ForecastScaler(target_avg_forecast, min_periods=min_periods).get_scaling_factor(forecast)
+    assert np.array_equal(exact.to_numpy(), expected.to_numpy(), equal_nan=True), "Exact scaling factors differ from expanding median"
+
+    approx = ForecastScaler(target_avg_forecast, min_periods=min_periods, method='approx').get_scaling_factor(forecast)
+    assert np.isclose(approx.iloc[-1], expected.iloc[-1], rtol=0.05), "Approximate scaling factor deviates more than 5%"
+
+
+def test_cached_store(tmp_path):
+    """Validate the columnar cache on a miss, a hit, an incremental top-up and a bulk top-up"""
+    from data_sources import CachedStore, CSVStore
+    from synthetic_universe import generate_universe
+
+    # BTC_funding_rates.csv, read as symbol 'BTC' and frequency 'funding_rates'
+    store, symbol, frequency, index_column = CSVStore('.'), 'BTC', 'funding_rates', 'time_close'
+    expected = store.fetch_raw_data(symbol, frequency)
+
+    for file_format in CachedStore.FILE_FORMATS:
+        cached_store = CachedStore(store, tmp_path / file_format, index_column, file_format)
+
+        miss = cached_store.fetch_raw_data(symbol, frequency)
+        hit = cached_store.fetch_raw_data(symbol, frequency)
+        pd.testing.assert_frame_equal(miss, expected, check_dtype=False)
+        pd.testing.assert_frame_equal(hit, expected, check_dtype=False)
+
+        # pretend the cache is stale and only holds the first half of the history
+        cached_store.write_cache(symbol, frequency, expected.iloc[:len(expected) // 2])
+        topped_up = cached_store.fetch_raw_data(symbol, frequency)
+        pd.testing.assert_frame_equal(topped_up, expected, check_dtype=False)
+        assert len(cached_store.read_cache(symbol, frequency)) == len(expected), f"{file_format} cache was not topped up"
+
+    class CountingStore(CSVStore):
+        def __init__(self, base_path):
+            super().__init__(base_path)
+            self.since_calls = []
+
+        def fetch_many_since(self, symbols, frequency, since, index_column=0):
+            self.since_calls.append(list(symbols))
+            return super().fetch_many_since(symbols, frequency, since, index_column)
+
+    price_frame = generate_universe({'gbm': 4}, 200)
+    for column in price_frame.columns:
+        price_frame[column].reset_index().to_csv(tmp_path / f"{column}_1D.csv", index=False)
+    symbols = list(price_frame.columns)
+    counting_store = CountingStore(tmp_path)
+    cached_store = CachedStore(counting_store, tmp_path / 'bulk', index_column='time_close')
+    expected = counting_store.fetch_many(symbols, '1D')
+
+    cached_store.fetch_many(symbols[:2], '1D')
+    for symbol in symbols[:2]:
+        cached_store.write_cache(symbol, '1D', expected[symbol].iloc[:150])
+    raw_frames = cached_store.fetch_many(symbols, '1D')
+    assert counting_store.since_calls == [symbols[:2]], "Hits sharing their newest bar should be topped up in one fetch"
+    for symbol in symbols:
+        pd.testing.assert_frame_equal(raw_frames[symbol], expected[symbol], check_dtype=False)
+        assert len(cached_store.read_cache(symbol, '1D')) == 200, f"{symbol} cache was not filled"
+
+
+def test_fetch_many_matches_single(store, symbols, frequency):
+    """Validate a store's bulk fetch against one fetch_raw_data call per symbol"""
+    raw_frames = store.fetch_many(symbols, frequency)
+    assert list(raw_frames) == list(symbols), "fetch_many should return every requested symbol in order"
+
+    for symbol in symbols:
+        expected = store.fetch_raw_data(symbol, frequency)
+        pd.testing.assert_frame_equal(
+            raw_frames[symbol].reset_index(drop=True),
+            expected.reset_index(drop=True),
+            check_dtype=False
+        )
+
+
+def test_ingestion_against_fake_source():
+    """Validate incremental, idempotent ingestion without network or database"""
+    from ingestion import FakeOHLCVSource, MemoryOHLCVSink, OHLCVIngestor
+
+    coins = pd.DataFrame({'id': [1, 2, 3], 'symbol': ['AAA', 'BBB', 'CCC']})
+    source = FakeOHLCVSource(listing_dates={2: pd.Timestamp('2020-01-01'), 3: pd.Timestamp('2023-06-01')})
+    sink = MemoryOHLCVSink()
+    ingestor = OHLCVIngestor(source, sink, interval='1d', group_size=2, max_workers=2,
+                             default_start=pd.Timestamp('2019-01-01'))
+
+    first_end = pd.Timestamp('2024-01-01')
+    inserted = ingestor.run(coins, end=first_end)
+    expected_rows = sum(len(pd.date_range(start, first_end, inclusive='left')) for start in
+                        ['2019-01-01', '2020-01-01', '2023-06-01'])
+    assert inserted == expected_rows == len(sink.bars), f"Expected {expected_rows} bars, inserted {inserted}"
+
+    assert ingestor.run(coins, end=first_end) == 0, "Rerun should not insert anything"
+
+    requests_before = len(source.requests)
+    assert ingestor.run(coins, end=first_end + pd.Timedelta(days=5)) == 15, "Top-up should insert 5 bars per coin"
+    top_up_starts = {start for _, start, _ in source.requests[requests_before:]}
+    assert top_up_starts == {first_end}, f"Top-up should start at the high-water mark, got {top_up_starts}"
+
+    # overlapping bars written directly are skipped by the unique bar key
+    assert sink.write_bars(sink.bars.head(10)) == 0, "Duplicate bars should be ignored"
+    assert not sink.bars.duplicated(['coin_id', 'interval', 'time_open']).any(), "Sink holds duplicate bars"
+
+
+def test_funding_fetcher_against_stub():
+    """Validate the concurrent funding fetcher against a local stub of /v5/market/funding/history"""
+    import asyncio
+    import socket
+    from aiohttp import web
+    from funding_fetcher import FUNDING_HISTORY_PATH, fetch_funding_rates_async, funding_windows
+
+    eight_hours = 8 * 60 * 60 * 1000
+    start_time = 1_585_152_000_000
+    end_time = start_time + 400 * 3 * eight_hours
+    max_concurrency = 4
+    state = {'requests': 0, 'in_flight': 0, 'max_in_flight': 0, 'failed_once': set()}
+
+    async def funding_history(request):
+        state['requests'] += 1
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        try:
+            await asyncio.sleep(0.01)
+            symbol = request.query['symbol']
+            window_start, window_end = int(request.query['startTime']), int(request.query['endTime'])
+
+            # every window fails once to exercise the retry path
+            if (symbol, window_start) not in state['failed_once']:
+                state['failed_once'].add((symbol, window_start))
+                return web.Response(status=503)
+
+            first = -(-window_start // eight_hours) * eight_hours
+            rates = [
+                {'symbol': symbol, 'fundingRate': '0.0001', 'fundingRateTimestamp': str(timestamp)}
+                for timestamp in range(first, window_end + 1, eight_hours)
+            ]
+            return web.json_response({
+                'retCode': 0,
+                'retMsg': 'OK',
+                'result': {'category': request.query['category'], 'list': rates[::-1]}
+            })
+        finally:
+            state['in_flight'] -= 1
+
+    async def fetch_from_stub():
+        app = web.Application()
+        app.router.add_get(FUNDING_HISTORY_PATH, funding_history)
+        runner = web.AppRunner(app)
+        await runner.setup()
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        await web.SockSite(runner, sock).start()
+        try:
+            return await fetch_funding_rates_async(
+                ['BTCUSDT', 'ETHUSDT'], start_time, end_time,
+                base_url=f"http://127.0.0.1:{sock.getsockname()[1]}",
+                max_concurrency=max_concurrency, requests_per_second=1_000, retries=2, backoff=0.01
+            )
+        finally:
+            await runner.cleanup()
+
+    funding_rates = asyncio.run(fetch_from_stub())
+
+    expected_timestamps = list(range(start_time, end_time + 1, eight_hours))
+    for symbol, rates in funding_rates.items():
+        timestamps = [int(rate['fundingRateTimestamp']) for rate in rates]
+        assert timestamps == expected_timestamps, f"{symbol} funding history incomplete or unsorted"
+
+    n_windows = len(funding_windows(start_time, end_time))
+    assert state['requests'] == 2 * 2 * n_windows, f"Expected one retry per window, got {state['requests']} requests"
+    assert 1 < state['max_in_flight'] <= max_concurrency, f"In-flight requests {state['max_in_flight']} outside bounds"
+
+
+def test_funding_store_resumes(tmp_path):
+    """Validate the cached funding store only downloads settlements after the newest stored one"""
+    from data_sources import FundingReader
+    from funding_fetcher import funding_store
+
+    eight_hours = 8 * 60 * 60 * 1000
+    first_settlement = 1_585_152_000_000
+    clock = {'now': first_settlement + 90 * 3 * eight_hours}
+    requested_starts = []
+
+    def fake_fetcher(symbols, start_time, end_time=None):
+        requested_starts.append(start_time)
+        first = max(-(-start_time // eight_hours) * eight_hours, first_settlement)
+        return {
+            symbol: [
+                {'symbol': symbol, 'fundingRate': '0.0001', 'fundingRateTimestamp': str(timestamp)}
+                for timestamp in range(first, clock['now'] + 1, eight_hours)
+            ]
+            for symbol in symbols
+        }
+
+    store = funding_store(tmp_path, fetcher=fake_fetcher)
+    reader = FundingReader(store, index_column='time_close', rate_column='fundingRate')
+
+    funding = reader.fetch_funding_series('BTCUSDT', '1D')
+    assert len(requested_starts) == 1, "First read should download the full history once"
+
+    clock['now'] += 2 * 3 * eight_hours
+    funding = reader.fetch_funding_series('BTCUSDT', '1D')
+    assert requested_starts[-1] == first_settlement + 90 * 3 * eight_hours + 1, "Second read should resume after the last stored rate"
+
+    raw = store.read_cache('BTCUSDT', FundingReader.RAW_FREQUENCY)
+    assert not raw['fundingRateTimestamp'].duplicated().any(), "Stored funding history holds duplicates"
+    assert len(raw) == 92 * 3 + 1, f"Expected {92 * 3 + 1} stored settlements, got {len(raw)}"
+    assert np.isclose(funding.sum(), len(raw) * 0.0001), "Daily funding should sum every settlement exactly once"
+
+
+def test_funding_reader_matches_csv_resample():
+    """Validate FundingReader against the resample backtest.py does on BTC_funding_rates.csv"""
+    from data_sources import CSVStore, FundingReader
+
+    funding = pd.read_csv('BTC_funding_rates.csv')
+    funding['time_close'] = pd.to_datetime(funding['time_close'])
+    funding.set_index('time_close', inplace=True)
+
+    reader = FundingReader(CSVStore('.'), index_column='time_close', rate_column='fundingRate')
+    for frequency in ('8h', '1D', '1W'):
+        expected = funding.sort_index()['fundingRate'].resample(frequency).sum()
+        actual = reader.fetch_funding_series('BTC', frequency)
+        pd.testing.assert_series_equal(actual, expected, check_names=False, check_freq=False)
+
+
 def check_positions_against_expected(actual_positions, expected_positions, position_type):
-    """Compare actual positions against expected values from CSV
+    """Compare actual positions against golden values
 
     Args:
-        actual_positions (pd.Series): Positions to validate
-        expected_filename (str): CSV file containing expected positions
+        actual_positions (pd.Series | pd.DataFrame): Positions to validate, one column per instrument
+        expected_positions (pd.Series | pd.DataFrame): Golden positions, see regression.load_golden
         position_type (str): Type of positions being checked ('ideal' or 'rebalanced')
     """
-    positions_array = np.array(actual_positions)
-    expected_array = expected_positions[f'{position_type}_pos_contracts'].to_numpy()
-
-    rel_diff = zero_safe_divide(np.abs(positions_array - expected_array), np.abs(expected_array))
     rtol = 0.0001
-
-    if (rel_diff > rtol).any():
-        print(f"\n{position_type.title()} positions deviating more than {rtol:.2%} relative tolerance:")
-        print("Index  Expected    Actual      Rel.Diff")
-        print("-" * 45)
-
-        deviant_indices = np.where(rel_diff > rtol)[0]
-        for idx in deviant_indices:
-            print(f"{idx:5d}  {expected_array[idx]:9.4f}  {positions_array[idx]:9.4f}  {rel_diff[idx]:9.2%}")
-
-        raise AssertionError(f"{position_type.title()} positions do not match expected values")
-
+    assert_matches_golden(actual_positions, expected_positions, f"{position_type.title()} positions", rtol)
     print(f"All {position_type} positions within {rtol:.2%} relative tolerance")
 
 
@@ -94,46 +358,413 @@ def test_position_rebalancing(positions, price_series, threshold):
     assert positions.isnull().sum() < len(positions), "Rebalanced positions should have valid values"
 
     # Check new implementation against old implementation
-    expected_positions = pd.read_csv('rebalanced_pos_contracts.csv')
-
     check_positions_against_expected(
         positions,
-        expected_positions,
+        load_golden('rebalanced_pos_contracts'),
         'rebalanced'
     )
 
     # Check if we really rebalanced only when exceeding the threshold
-    for i in range(1, len(positions)):
-        prev_pos = positions.iloc[i - 1]
-        curr_pos = positions.iloc[i]
-        contract_diff = abs(curr_pos - prev_pos)
-        deviation = contract_diff / abs(curr_pos) * 100 if abs(curr_pos) > 0 else 0
-
-        if deviation > threshold:
-            assert abs(curr_pos) != abs(prev_pos), "Rebalance should increase position size"
-        else:
-            assert abs(curr_pos) == abs(prev_pos), "Position should not change if within threshold"
-
-
-def test_strategy_metrics(price_series):
-    """Validate strategy performance metrics"""
-    strat_pre_cost_sr = calculate_strat_pre_cost_sr(price_series)
-    assert strat_pre_cost_sr == 1.6785643249186135, "Pre-cost Sharpe ratio mismatch"
-
-    strat_post_cost_sr = calculate_strat_post_cost_sr(strat_pre_cost_sr)
-    assert strat_post_cost_sr == 1.597177306126823, "Post-cost Sharpe ratio mismatch"
-
-    assert calculate_strat_total_perc_returns() == 958.3412684422372, "Total returns mismatch"
-    assert calculate_strat_mean_ann_perc_return() == 65.7261486248434, "Mean annual return mismatch"
-    assert calculate_strat_std_dev() == 1.597177306126823, "Standard deviation mismatch"
+    assert_rebalance_rule(positions, threshold)
+
+
+def test_rebalancing_backends(ideal_positions, threshold):
+    """Validate every rebalancing backend bit-for-bit against the expected positions"""
+    expected_positions = load_golden('rebalanced_pos_contracts')
+    expected_array = expected_positions.to_numpy()
+    valid = ~np.isnan(expected_array)
+
+    for backend in available_backends():
+        positions = rebalance_positions(ideal_positions, threshold, backend=backend)
+        check_positions_against_expected(positions, expected_positions, 'rebalanced')
+        assert_rebalance_rule(positions, threshold, ideal_positions)
+        assert np.array_equal(positions.to_numpy()[valid], expected_array[valid]), f"{backend} positions not bit-for-bit equal"
+
+        # many instruments at once must match running them one by one
+        stacked = np.column_stack([ideal_positions, -ideal_positions, ideal_positions * 2])
+        rebalanced = rebalance_array(stacked, threshold, backend=backend)
+        for col in range(stacked.shape[1]):
+            single = rebalance_array(stacked[:, col], threshold, backend=backend)
+            assert np.array_equal(rebalanced[:, col], single, equal_nan=True), f"{backend} column {col} mismatch"
+
+
+def test_universe_matches_single_instruments():
+    """Validate the column-wise universe run against one backtest per instrument"""
+    from instrument import Instrument
+    from synthetic_universe import generate_universe
+    from universe import Universe, run_universe_backtest
+
+    trading_rule, feature_name = EMAC(8, 32), 'close'
+    account_balance, ann_perc_risk_target, rebalance_threshold = 10_000, 0.20, 0.10
+    price_frame = generate_universe({'gbm': 3, 'ou': 1}, 1_200)
+    # a later listing leaves leading NaNs in the universe
+    instruments = [
+        Instrument(symbol, price_frame[[symbol]].iloc[300 * i:].rename(columns={symbol: feature_name}),
+                   trading_days_in_year=365, contract_unit=1)
+        for i, symbol in enumerate(price_frame.columns)
+    ]
+
+    universe = Universe.from_instruments('test_universe', instruments, feature_names=(feature_name,))
+    result = run_universe_backtest(
+        trading_rule, universe, feature_name, account_balance, ann_perc_risk_target, rebalance_threshold
+    )
+    assert result['rebalanced_position'].shape[1] == len(instruments), "Universe should have one column per instrument"
+
+    for instrument in instruments:
+        single = Universe.from_instruments(instrument.name, [instrument], feature_names=(feature_name,))
+        expected = run_universe_backtest(
+            trading_rule, single, feature_name, account_balance, ann_perc_risk_target, rebalance_threshold
+        ).dropna(how='all')
+
+        for quantity in ['signal', 'ideal_position', 'rebalanced_position', 'pre_cost_sr']:
+            actual = result[quantity][instrument.name].reindex(expected.index)
+            assert np.allclose(
+                actual, expected[quantity][instrument.name], rtol=1e-9, equal_nan=True
+            ), f"Universe {quantity} mismatch for {instrument.name}"
+
+
+def test_sweep_matches_universe():
+    """Validate the process pool sweep against an in-process universe run per lookback pair"""
+    from sweep import emac_lookback_grid, run_sweep
+    from synthetic_universe import generate_universe
+    from universe import Universe, run_universe_backtest, summarize_universe
+
+    price_frame = generate_universe({'gbm': 4, 'ou': 2}, 1_000)
+    lookback_pairs = emac_lookback_grid([4, 8, 16])
+    account_balance, ann_perc_risk_target, rebalance_threshold = 10_000, 0.20, 0.10
+
+    sweep_results = run_sweep(
+        price_frame, lookback_pairs, account_balance, ann_perc_risk_target, rebalance_threshold,
+        symbols_per_task=max(1, price_frame.shape[1] // 2), max_workers=2
+    )
+    assert len(sweep_results) == len(lookback_pairs) * price_frame.shape[1], "Sweep should have one row per pair and symbol"
+
+    universe = Universe('sweep_check', {'close': price_frame}, trading_days_in_year=365, contract_unit=1)
+    for fast_lookback, slow_lookback in lookback_pairs:
+        expected = summarize_universe(run_universe_backtest(
+            EMAC(fast_lookback, slow_lookback), universe, 'close',
+            account_balance, ann_perc_risk_target, rebalance_threshold
+        ))
+        is_pair = (sweep_results['fast_lookback'] == fast_lookback) & (sweep_results['slow_lookback'] == slow_lookback)
+        actual = sweep_results[is_pair].set_index('symbol')['pre_cost_sr']
+        assert np.allclose(
+            actual, expected['pre_cost_sr'].reindex(actual.index), equal_nan=True
+        ), f"Sweep SR mismatch for EMAC({fast_lookback}, {slow_lookback})"
+
+
+def test_strategy_metrics(strat_metrics, pre_cost_sr):
+    """Validate the performance sheet against the values asserted in backtest.py"""
+    assert np.isclose(strat_metrics.pre_cost_sr, pre_cost_sr), "Metrics engine disagrees with calculate_strat_pre_cost_sr"
+
+    # refactored positions start at 0 instead of NaN, so means differ slightly from backtest.py
+    expected = {
+        'total_return': 958.3412684422372,
+        'mean_ann_return': 65.7261486248434,
+        'std_dev': 2.1539648978227586,
+        'sharpe_ratio': 1.597177306126823,
+        'pre_cost_sr': 1.6785643249186135,
+        'post_cost_sr': 1.597177306126823,
+        'ann_turnover': 37.672650094739545,
+    }
+    for metric, expected_value in expected.items():
+        actual = getattr(strat_metrics, metric)
+        assert np.isclose(actual, expected_value, rtol=0.01), f"{metric} {actual} differs by more than 1% from {expected_value}"
+
+
+def test_trading_costs(trading_costs):
+    """Validate trading cost calculations against the totals of backtest.py"""
+    assert np.isclose(trading_costs['fees_paid'].sum(), 1038.6238698915147), "Fee calculation mismatch"
+    assert np.isclose(trading_costs['slippage_paid'].sum(), 944.2035180831953), "Slippage calculation mismatch"
+    assert np.isclose(trading_costs['funding_paid'].sum(), 3130.3644113437113), "Holding costs calculation mismatch"
+
+
+def test_costs_match_row_loop(prices, ideal_positions, funding_rates, rebalance_threshold, trading_costs):
+    """Validate the vectorized costs bar by bar against the iterrows cost loop of backtest.py"""
+    from costs import FEE_PERC, SLIPPAGE_PERC
+
+    ideal = ideal_positions.to_numpy(dtype=float)
+    close = prices.to_numpy(dtype=float)
+    fees_paid = np.zeros(len(close))
+    slippage_paid = np.zeros(len(close))
+
+    current_position = 0.0
+    for i in range(1, len(close)):
+        contract_diff = ideal[i] - current_position
+        with np.errstate(divide='ignore', invalid='ignore'):
+            contract_deviation = abs(contract_diff) / abs(ideal[i]) * 100
+        if contract_deviation > rebalance_threshold * 100:
+            slippage_paid[i] = abs(contract_diff) * close[i] * SLIPPAGE_PERC / 100
+            fees_paid[i] = abs(contract_diff * close[i]) * FEE_PERC / 100
+            current_position = ideal[i]
+
+    funding = funding_rates.reindex(prices.index).fillna(0)
+    funding_paid = (ideal_positions * prices).shift(1) * funding
+
+    assert np.allclose(trading_costs['fees_paid'], fees_paid, equal_nan=True), "Fees differ from the row loop"
+    assert np.allclose(trading_costs['slippage_paid'], slippage_paid, equal_nan=True), "Slippage differs from the row loop"
+    assert np.allclose(trading_costs['funding_paid'], funding_paid, equal_nan=True), "Funding differs from the row loop"
+
+
+def test_backtest_state_matches_universe():
+    """Validate the array-backed state against the DataFrame universe path in both storage types"""
+    from backtest_state import FLOAT32_RTOL, BacktestState, run_state_backtest
+    from synthetic_universe import generate_universe
+    from universe import Universe, run_universe_backtest
+
+    price_frame = generate_universe({'gbm': 5, 'ou': 2}, 1_000)
+    price_frame.iloc[:200, 1] = np.nan
+    account_balance, ann_perc_risk_target, rebalance_threshold = 10_000, 0.20, 0.10
+
+    universe = Universe('test_universe', {'close': price_frame}, trading_days_in_year=365, contract_unit=1)
+    expected = run_universe_backtest(
+        EMAC(8, 32), universe, 'close', account_balance, ann_perc_risk_target, rebalance_threshold
+    )
 
-    ann_turnover = 37.672650094739545
-    assert ann_turnover == 37.672650094739545, "Annual turnover mismatch"
+    # chunks of 3 columns leave a shorter last chunk
+    float64_state = BacktestState.from_price_frame('test_state', price_frame, 365, 1, dtype='float64')
+    run_state_backtest(
+        EMAC(8, 32), float64_state, 'close', account_balance, ann_perc_risk_target, rebalance_threshold,
+        symbols_per_chunk=3
+    )
+    for quantity in ('signal', 'ideal_position', 'rebalanced_position'):
+        pd.testing.assert_frame_equal(
+            float64_state.to_frame(quantity), expected[quantity], check_names=False, check_freq=False
+        )
+
+    float32_state = BacktestState.from_price_frame('test_state', price_frame, 365, 1, dtype='float32')
+    run_state_backtest(EMAC(8, 32), float32_state, 'close', account_balance, ann_perc_risk_target, rebalance_threshold)
+    assert float32_state.get_block('pnl').dtype == np.float32, "float32 state should store float32 blocks"
+    for quantity in ('signal', 'ideal_position'):
+        error = (float32_state.to_frame(quantity) - float64_state.to_frame(quantity)).abs()
+        scale = float64_state.to_frame(quantity).abs().mean()
+        assert (error.max() <= FLOAT32_RTOL * scale).all(), f"float32 {quantity} outside the documented tolerance"
+
+
+def test_sweep_result_store(tmp_path):
+    """Validate the per-bar arrays a sweep appends to the result store and its crash recovery"""
+    from backtest_refactored import calculate_pnl
+    from result_store import ResultStore
+    from sweep import emac_lookback_grid, run_sweep_to_store
+    from synthetic_universe import generate_universe
+    from universe import Universe, run_universe_backtest
+
+    price_frame = generate_universe({'gbm': 3, 'ou': 1}, 800)
+    lookback_pairs, rebalance_thresholds = emac_lookback_grid([4, 16]), [0.05, 0.20]
+    account_balance, ann_perc_risk_target = 10_000, 0.20
+    store_dir = str(tmp_path / 'sweep_store')
+    run_sweep_to_store(
+        price_frame, lookback_pairs, rebalance_thresholds, account_balance, ann_perc_risk_target, store_dir,
+        symbols_per_task=max(1, price_frame.shape[1] // 2), max_workers=2
+    )
 
+    # reopen from disk, as an analysis session would
+    store = ResultStore(store_dir)
+    assert len(store) == len(lookback_pairs) * len(rebalance_thresholds), "Expected one run per parameter set"
+
+    universe = Universe('store_check', {'close': price_frame}, trading_days_in_year=365, contract_unit=1)
+    for fast_lookback, slow_lookback in lookback_pairs:
+        for rebalance_threshold in rebalance_thresholds:
+            expected = run_universe_backtest(
+                EMAC(fast_lookback, slow_lookback), universe, 'close',
+                account_balance, ann_perc_risk_target, rebalance_threshold
+            )['rebalanced_position']
+            [run_id] = store.select(
+                fast_lookback=fast_lookback, slow_lookback=slow_lookback, rebalance_threshold=rebalance_threshold
+            )
+            pd.testing.assert_frame_equal(
+                store.get_run(run_id, 'rebalanced_position'), expected, check_names=False, check_freq=False
+            )
+            pd.testing.assert_frame_equal(
+                store.get_run(run_id, 'pnl'), calculate_pnl(universe, expected), check_names=False, check_freq=False
+            )
+
+    # a parameter line still being written, or left by an interrupted append, is not a run
+    runs_path = os.path.join(store_dir, ResultStore.RUNS_FILE)
+    with open(runs_path, 'a') as f:
+        f.write('{"run_id": 99, "fast_')
+    reader = ResultStore(store_dir)
+    assert len(reader) == len(store), "Partial parameter line should be skipped"
+    with open(runs_path) as f:
+        assert f.read().endswith('"fast_'), "Opening a store must not rewrite runs.jsonl"
+
+    # the writer repairs the file and picks up the run ids of its open
+    run_id = store.append({'fast_lookback': 0}, {q: np.zeros(store.block_shape) for q in store.quantities})
+    assert run_id == len(reader), "Append should continue after the last committed run"
+    assert len(ResultStore(store_dir)) == run_id + 1, "Append after recovery should be readable"
+
+
+def test_profiling_records_stages(tmp_path):
+    """Validate spans of a profiled fetch and pipeline run and their JSON and Chrome trace exports"""
+    import json
+    from backtest_refactored import calculate_ideal_positions, generate_rebalanced_positions, generate_signals
+    from data_sources import CSVStore, PriceReader
+    from instrument import Instrument
+    from instrumentation import get_profiler, profiling
+    from synthetic_universe import generate_universe
+
+    symbol, frequency, index_column, price_column = 'GBM0', '1D', 'time_close', 'GBM0'
+    generate_universe({'gbm': 1}, 1_000).reset_index().to_csv(tmp_path / f"{symbol}_{frequency}.csv", index=False)
+    store, trace_prefix = CSVStore(tmp_path), tmp_path / 'profile'
+
+    def run():
+        price_series = PriceReader(store, index_column, price_column).fetch_price_series(symbol, frequency)
+        instrument = Instrument(symbol, price_series, trading_days_in_year=365, contract_unit=1)
+        signals = generate_signals(EMAC(8, 32), instrument, 'close')
+        return generate_rebalanced_positions(calculate_ideal_positions(instrument, 100, signals), 0.10)
+
+    with profiling(trace_memory=True) as profiler:
+        positions = run()
+    assert get_profiler() is None, "Profiling should be disabled after the block"
+
+    spans = profiler.to_frame().set_index('name')
+    expected = [
+        f"{type(store).__name__}.fetch_raw_data",
+        'PriceReader.prepare_price_series',
+        'generate_signals',
+        'calculate_ideal_positions',
+        'generate_rebalanced_positions'
+    ]
+    assert set(expected) <= set(spans.index), f"Missing spans: {set(expected) - set(spans.index)}"
+    assert spans.loc['generate_rebalanced_positions', 'rows'] == len(positions), "Span should count result rows"
+    assert spans.loc[expected[0], 'symbol'] == symbol, "Fetch span should record its symbol"
+    assert (spans['wall_seconds'] >= 0).all() and (spans['peak_bytes'] >= 0).all()
+
+    profiler.to_json(f"{trace_prefix}.json")
+    profiler.to_chrome_trace(f"{trace_prefix}.trace.json")
+    with open(f"{trace_prefix}.trace.json") as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == len(spans) and all(event['ph'] == 'X' for event in events)
+
+    # disabled, nothing is recorded and the results are unchanged
+    pd.testing.assert_series_equal(run(), positions)
+    assert len(profiler.spans) == len(spans), "Disabled profiling should not record spans"
+
+
+def test_synthetic_universe():
+    """Validate reproducibility and the distribution of the synthetic universe generators"""
+    from synthetic_universe import generate_gbm_paths, generate_ou_paths, generate_universe
+
+    # a path only depends on the seed and its position, not on how many paths are drawn
+    assert np.array_equal(generate_gbm_paths(3, 100, seed=7), generate_gbm_paths(10, 100, seed=7)[:, :3])
+    small = generate_universe({'gbm': 3, 'ou': 2}, 200)
+    large = generate_universe({'ou': 5, 'gbm': 10, 'sine': 4}, 200)
+    pd.testing.assert_frame_equal(small, large[small.columns])
+    assert small.index.name == 'time_close' and small.index.freq == 'D', "Expected a daily time_close index"
+
+    # one year of GBM log returns: mean (mu - sigma^2 / 2), std sigma
+    gbm = generate_gbm_paths(4_000, 366, mu=0.1, sigma=0.2, dt=1 / 365, seed=1)
+    log_returns = np.log(gbm[-1] / gbm[0])
+    assert abs(log_returns.mean() - 0.08) < 0.01 and abs(log_returns.std() - 0.2) < 0.01
+
+    # OU started at its mean stays stationary: mean mu, std sigma / sqrt(2 theta) whatever the bar length
+    for dt in (1 / 365, 1 / 4):
+        ou = generate_ou_paths(4_000, 2_000, S0=1.0, theta=0.8, mu=1.0, sigma=0.15, dt=dt, seed=2)[-1]
+        assert abs(ou.mean() - 1.0) < 0.01 and abs(ou.std() - 0.15 / np.sqrt(1.6)) < 0.005
+
+
+def test_bootstrap_sharpe():
+    """Validate the block-sum bootstrap against resamples built bar by bar"""
+    from bootstrap import bootstrap_sharpe
+
+    trading_days_in_year, block_length, n_resamples, seed = 365, 7, 1_500, 11
+    # 1000 bars leave a shorter last block, the second strategy lists later
+    frame = pd.DataFrame(np.random.default_rng(3).normal(0.05, 1, (1_000, 2)), columns=['early', 'late'])
+    frame.iloc[:150, 1] = np.nan
+    summary, samples = bootstrap_sharpe(
+        frame, trading_days_in_year, n_resamples, block_length, seed=seed, return_samples=True
+    )
+    expected_sr = frame.mean() / frame.std() * np.sqrt(trading_days_in_year)
+    assert np.allclose(summary['sharpe_ratio'], expected_sr), "Point estimate should be the sample SR"
+    assert (summary['ci_lower'] <= summary['ci_upper']).all()
+
+    # replay the first task's block starts and rebuild its resamples from the bars
+    values = frame.to_numpy(dtype=float)
+    n_bars = len(values)
+    n_full_blocks, last_length = divmod(n_bars, block_length)
+    rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(1)[0])
+    starts = rng.integers(0, n_bars, (n_full_blocks, min(n_resamples, 1_000)))
+    last_starts = rng.integers(0, n_bars, starts.shape[1])
+    for k in (0, starts.shape[1] - 1):
+        index = np.concatenate(
+            [(start + np.arange(block_length)) % n_bars for start in starts[:, k]]
+            + [(last_starts[k] + np.arange(last_length)) % n_bars]
+        )
+        resample = values[index]
+        expected = np.nanmean(resample, 0) / np.nanstd(resample, 0, ddof=1) * np.sqrt(trading_days_in_year)
+        assert np.allclose(samples.iloc[k], expected), f"Resample {k} differs from the bar by bar resample"
+
+    # the resamples only depend on the seed, not on how they are spread over processes
+    parallel = bootstrap_sharpe(frame, trading_days_in_year, n_resamples, block_length, seed=seed, max_workers=2)
+    pd.testing.assert_frame_equal(summary, parallel)
+
+
+def test_walk_forward(tmp_path):
+    """Validate walk-forward choices and out-of-sample pnl against per parameter set full history backtests"""
+    from backtest_refactored import calculate_pnl
+    from sweep import emac_lookback_grid
+    from synthetic_universe import generate_universe
+    from universe import Universe, run_universe_backtest
+    from walk_forward import walk_forward
+
+    price_frame = generate_universe({'gbm': 3, 'sine': 1}, 1_500)
+    lookback_pairs, rebalance_thresholds = emac_lookback_grid([4, 16]), [0.05, 0.20]
+    account_balance, ann_perc_risk_target = 10_000, 0.20
+    # the last test window is cut at the end of the history
+    train_bars, test_bars, start_bar = 365, 200, 100
+    store_dir = str(tmp_path / 'walk_forward_store')
+    result = walk_forward(
+        price_frame, lookback_pairs, rebalance_thresholds, account_balance, ann_perc_risk_target,
+        train_bars, test_bars, store_dir, start_bar=start_bar, max_workers=2
+    )
 
-def test_trading_costs():
-    """Validate trading cost calculations"""
-    assert calculate_fees_paid() == 1038.6238698915147, "Fee calculation mismatch"
-    assert calculate_holding_costs_paid() == 3130.3644113437113, "Holding costs calculation mismatch"
-    assert calulcate_slippage_paid() == 944.2035180831953, "Slippage calculation mismatch"
-    assert calculate_holding_costs_paid() == 3130.3644113437113, "Holding costs mismatch"
+    universe = Universe('walk_forward_check', {'close': price_frame}, trading_days_in_year=365, contract_unit=1)
+    pnl = {}
+    for run_id, params in result.runs.iterrows():
+        rebalanced_positions = run_universe_backtest(
+            EMAC(params['fast_lookback'], params['slow_lookback']), universe, 'close',
+            account_balance, ann_perc_risk_target, params['rebalance_threshold']
+        )['rebalanced_position']
+        pnl[run_id] = calculate_pnl(universe, rebalanced_positions)
+
+    expected_pnl = pd.DataFrame(np.nan, index=price_frame.index, columns=price_frame.columns)
+    for window, bounds in result.windows.iterrows():
+        train_sr = pd.DataFrame({
+            run_id: run_pnl.loc[bounds['train_start']:bounds['train_end']].agg(lambda x: x.mean() / x.std())
+            for run_id, run_pnl in pnl.items()
+        })
+        best = train_sr.idxmax(axis=1)
+        assert (result.choices.loc[window] == best).all(), f"Window {window} chose different parameters"
+        for symbol, run_id in best.items():
+            test_period = slice(bounds['test_start'], bounds['test_end'])
+            expected_pnl.loc[test_period, symbol] = pnl[run_id].loc[test_period, symbol]
+
+    pd.testing.assert_frame_equal(result.oos_pnl, expected_pnl, check_names=False, check_freq=False)
+
+
+def test_forecast_combiner(instrument, feature_name, fast_lookbacks=(2, 4, 8, 16, 32, 64)):
+    """Validate the combined forecast against single rule signals and a per bar FDM"""
+    from backtest_refactored import generate_signals
+    from forecast_combination import ForecastCombiner
+
+    # one rule: FDM 1, exactly generate_signals
+    single = ForecastCombiner([EMAC(8, 32)]).combine(instrument, feature_name)
+    pd.testing.assert_series_equal(single, generate_signals(EMAC(8, 32), instrument, feature_name), check_names=False)
+
+    rules = [EMAC(fast, fast * 4) for fast in fast_lookbacks]
+    combiner = ForecastCombiner(rules)
+    forecasts = combiner.get_capped_forecasts(instrument, feature_name)
+    for column, rule in enumerate(rules):
+        pd.testing.assert_series_equal(
+            forecasts[column], generate_signals(rule, instrument, feature_name), check_names=False
+        )
+
+    fdm = combiner.get_fdm(forecasts)
+    correlation = forecasts.ewm(span=combiner.corr_span, min_periods=combiner.corr_min_periods).corr()
+    last_correlation = correlation.loc[forecasts.index[-1]].clip(lower=0).to_numpy()
+    expected_fdm = 1 / np.sqrt(combiner.weights @ last_correlation @ combiner.weights)
+    assert np.isclose(fdm.iloc[-1], expected_fdm), f"FDM {fdm.iloc[-1]} differs from {expected_fdm}"
+    assert ((fdm >= 1) & (fdm <= combiner.max_fdm)).all(), "Floored correlations keep the FDM between 1 and max_fdm"
+
+    combined = combiner.combine(instrument, feature_name)
+    expected = (forecasts.mean(axis=1, skipna=False) * fdm).clip(lower=-20, upper=20)
+    pd.testing.assert_series_equal(combined, expected, check_names=False)
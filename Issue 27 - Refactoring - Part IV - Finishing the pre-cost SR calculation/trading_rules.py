@@ -7,6 +7,10 @@ class TradingRule(ABC):
         """Generate raw (unscaled) forecast from price series"""
         pass
 
+    def get_raw_forecast_for(self, instrument, feature_name):
+        """Raw forecast for an instrument's feature, rules override this to use its feature cache"""
+        return self.get_raw_forecast(instrument.get_feature(feature_name))
+
 
 class EMAC(TradingRule):
     def __init__(self, fast_lookback=2, slow_lookback=None):
@@ -25,3 +29,9 @@ class EMAC(TradingRule):
         ).mean()
 
         return emac_fast - emac_slow
+
+    def get_raw_forecast_for(self, instrument, feature_name):
+        # EWM means are shared with every other rule using the same span
+        emac_fast = instrument.get_ewm(feature_name, 'mean', self.fast_lookback, self.fast_lookback)
+        emac_slow = instrument.get_ewm(feature_name, 'mean', self.slow_lookback, self.slow_lookback)
+        return emac_fast - emac_slow
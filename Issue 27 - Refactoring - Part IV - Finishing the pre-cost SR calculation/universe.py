@@ -0,0 +1,153 @@
+from backtest_refactored import (
+    calculate_annual_risk_target,
+    calculate_daily_risk_target,
+    calculate_ideal_positions,
+    calculate_strat_pre_cost_sr,
+    generate_rebalanced_positions,
+    generate_signals
+)
+
+from data_sources import DBStore
+from data_sources import PriceReader
+
+from feature_cache import FeatureCache, cached_ewm
+
+from trading_rules import EMAC
+
+import pandas as pd
+
+
+class Universe:
+    """Many instruments on one shared time axis
+
+    Mirrors the Instrument interface, but every feature is a wide frame with
+    one column per symbol, so each pipeline stage runs column-wise in one pass.
+    """
+    CLOSE_COLUMN = 'close'
+
+    def __init__(self, name, price_frames, trading_days_in_year, contract_unit, feature_cache=None):
+        """
+        Args:
+            name (str): Name of the universe
+            price_frames (dict): Feature name -> wide DataFrame (columns are symbols)
+            trading_days_in_year (int): Shared by all instruments
+            contract_unit (float | pd.Series): Scalar or one value per symbol
+            feature_cache (FeatureCache): Optional cache shared with other universes
+        """
+        self.__price_frames = price_frames
+        self.name = name
+        self.trading_days_in_year = trading_days_in_year
+        self.contract_unit = contract_unit
+        self.feature_cache = feature_cache if feature_cache is not None else FeatureCache()
+
+    @classmethod
+    def from_instruments(cls, name, instruments, feature_names=(CLOSE_COLUMN,)):
+        trading_days = {instrument.trading_days_in_year for instrument in instruments}
+        if len(trading_days) != 1:
+            raise ValueError(f"Instruments must share trading_days_in_year, found {sorted(trading_days)}")
+
+        price_frames = {
+            feature_name: pd.DataFrame({
+                instrument.name: instrument.get_feature(feature_name) for instrument in instruments
+            })
+            for feature_name in feature_names
+        }
+        contract_unit = pd.Series({instrument.name: instrument.contract_unit for instrument in instruments})
+        return cls(name, price_frames, trading_days.pop(), contract_unit)
+
+    @property
+    def symbols(self):
+        return list(self.get_feature(self.CLOSE_COLUMN).columns)
+
+    def get_notional_value(self, contracts):
+        return contracts * self.get_feature(self.CLOSE_COLUMN) * self.contract_unit
+
+    def get_raw_returns(self):
+        return self.get_feature(self.CLOSE_COLUMN).diff()
+
+    def get_perc_returns(self):
+        # instruments list at different dates, only drop rows without any return
+        return self.get_feature(self.CLOSE_COLUMN).pct_change().dropna(how='all')
+
+    def get_feature(self, feature_name):
+        """Get a specific feature for all instruments, e.g. close prices
+
+        Raises:
+            ValueError: If feature doesn't exist
+        """
+        if feature_name not in self.__price_frames:
+            raise ValueError(f"Feature '{feature_name}' not available for {self.name}")
+        return self.__price_frames[feature_name]
+
+    def get_ewm(self, feature_name, statistic, span, min_periods, transform=None):
+        """Exponentially weighted statistic of a feature for all instruments, see Instrument.get_ewm"""
+        return cached_ewm(
+            self.feature_cache, self.name, self.get_feature,
+            feature_name, statistic, span, min_periods, transform
+        )
+
+    def available_features(self):
+        """List all available features for this universe"""
+        return list(self.__price_frames)
+
+
+def run_universe_backtest(trading_rule, universe, feature_name, account_balance,
+                          ann_perc_risk_target, rebalance_threshold):
+    """Run the full pipeline for every instrument of the universe at once
+
+    Returns:
+        pd.DataFrame: Columns are a (quantity, symbol) MultiIndex with the
+            quantities 'signal', 'ideal_position', 'rebalanced_position'
+            and 'pre_cost_sr'
+    """
+    ann_cash_risk_target = calculate_annual_risk_target(account_balance, ann_perc_risk_target)
+    daily_cash_risk_target = calculate_daily_risk_target(ann_cash_risk_target, universe.trading_days_in_year)
+
+    signals = generate_signals(trading_rule, universe, feature_name)
+    ideal_positions = calculate_ideal_positions(universe, daily_cash_risk_target, signals)
+    rebalanced_positions = generate_rebalanced_positions(ideal_positions, rebalance_threshold)
+    pre_cost_sr = calculate_strat_pre_cost_sr(universe, account_balance, rebalanced_positions)
+
+    return pd.concat({
+        'signal': signals,
+        'ideal_position': ideal_positions,
+        'rebalanced_position': rebalanced_positions,
+        'pre_cost_sr': pre_cost_sr
+    }, axis=1)
+
+
+def summarize_universe(result):
+    """Latest SR and position per instrument, best SR first"""
+    summary = pd.DataFrame({
+        'pre_cost_sr': result['pre_cost_sr'].ffill().iloc[-1],
+        'rebalanced_position': result['rebalanced_position'].iloc[-1]
+    })
+    return summary.sort_values('pre_cost_sr', ascending=False)
+
+
+if __name__ == "__main__":
+    trading_frequency = '1D'
+    feature_name = 'close'
+
+    db_store = DBStore()
+    db_reader = PriceReader(db_store, index_column=0, price_column=1)
+    symbols = db_store.fetch_symbols()
+    price_frame = db_reader.fetch_price_frame(symbols, trading_frequency)
+
+    universe = Universe(
+        'coins',
+        {feature_name: price_frame},
+        trading_days_in_year=365,
+        contract_unit=1
+    )
+
+    emac = EMAC(8, 32)
+    result = run_universe_backtest(
+        emac,
+        universe,
+        feature_name,
+        account_balance=10_000,
+        ann_perc_risk_target=0.20,
+        rebalance_threshold=0.10
+    )
+    print(summarize_universe(result))
@@ -0,0 +1,200 @@
+from bootstrap import sharpe_from_moments
+from result_store import ResultStore
+from sweep import emac_lookback_grid, run_sweep_to_store
+
+import numpy as np
+import pandas as pd
+
+
+WINDOW_COLUMNS = ['train_start', 'train_end', 'test_start', 'test_end']
+
+
+def walk_forward_windows(n_bars, train_bars, test_bars, step=None, anchored=False, start_bar=0):
+    """(train_start, train_end, test_start, test_end) bar positions, ends exclusive
+
+    Rolling windows move by step (default test_bars) so the test windows tile
+    the history, anchored windows keep training from start_bar. The last
+    test window is cut at the end of the history.
+    """
+    step = step or test_bars
+    windows = []
+    train_start = start_bar
+    while train_start + train_bars < n_bars:
+        train_end = train_start + train_bars
+        windows.append((start_bar if anchored else train_start, train_end, train_end, min(train_end + test_bars, n_bars)))
+        train_start += step
+    return windows
+
+
+def window_moments(pnl, bounds):
+    """Count, sum and sum of squares of pnl (bars, symbols) within each [start, end) of bounds
+
+    Returns:
+        np.ndarray: (windows, 3, symbols)
+    """
+    is_observation = ~np.isnan(pnl)
+    values = np.where(is_observation, pnl, 0.0)
+    moments = np.stack([is_observation.astype(float), values, values ** 2], axis=1)
+    cumulative = np.concatenate([np.zeros((1,) + moments.shape[1:]), np.cumsum(moments, axis=0)])
+    starts, ends = np.asarray(bounds).T
+    return cumulative[ends] - cumulative[starts]
+
+
+class WalkForwardResult:
+    """Parameters chosen in every train window and the stitched out-of-sample pnl
+
+    Attributes:
+        windows (pd.DataFrame): Train and test bounds (timestamps) per window
+        choices (pd.DataFrame): Run id chosen per window (rows) and symbol, -1 if
+            no run had a finite SR in the train window
+        train_sr (np.ndarray): (windows, runs, symbols) train SR of every candidate run
+        runs (pd.DataFrame): Parameters of every candidate run id
+        oos_pnl (pd.DataFrame): Pnl of the chosen run within each test window
+    """
+
+    def __init__(self, windows, choices, train_sr, runs, oos_pnl):
+        self.windows = windows
+        self.choices = choices
+        self.train_sr = train_sr
+        self.runs = runs
+        self.oos_pnl = oos_pnl
+
+    def chosen_parameters(self, parameter):
+        """Value of one run parameter chosen per window and symbol, e.g. 'fast_lookback'"""
+        if parameter not in self.runs.columns:
+            raise ValueError(f"Unknown run parameter '{parameter}'. Available parameters: {list(self.runs.columns)}")
+        values = self.runs[parameter].reindex(self.choices.to_numpy().ravel()).to_numpy()
+        return pd.DataFrame(values.reshape(self.choices.shape), index=self.choices.index, columns=self.choices.columns)
+
+    def sharpe_ratio(self, trading_days_in_year):
+        """Out-of-sample SR per symbol over all test windows"""
+        return self.oos_pnl.mean() / self.oos_pnl.std() * np.sqrt(trading_days_in_year)
+
+
+def walk_forward_from_store(store, train_bars, test_bars, trading_days_in_year=365, step=None,
+                            anchored=False, start_bar=0, run_ids=None):
+    """Pick the best train window run per symbol and stitch its test window pnl
+
+    Every run in the store is a full history backtest. Its EWMs, forecast
+    scaling and rebalancing are causal, so the pnl of a window is a slice of
+    it and no window is backtested on its own. Train SRs (mean / std of the
+    window's pnl) of all windows come from one cumulative sum per run. A
+    test window starts from the position the chosen run holds at that bar.
+
+    Args:
+        store (ResultStore): Sweep with a 'pnl' quantity, see run_sweep_to_store
+        train_bars (int): Bars a parameter set is selected on
+        test_bars (int): Bars it is then applied to out-of-sample
+        start_bar (int): First bar of the first window, e.g. after the forecast scaler warm up
+        run_ids (list): Runs to choose from, defaults to every run in the store
+
+    Returns:
+        WalkForwardResult
+    """
+    run_ids = list(range(len(store))) if run_ids is None else list(run_ids)
+    if not run_ids:
+        raise ValueError(f"No runs to choose from in result store '{store.directory}'")
+    windows = walk_forward_windows(len(store.index), train_bars, test_bars, step, anchored, start_bar)
+    if not windows:
+        raise ValueError(f"No window fits {train_bars} train bars into {len(store.index) - start_bar} bars")
+
+    pnl = store.read('pnl')
+    train_bounds = [(train_start, train_end) for train_start, train_end, _, _ in windows]
+    train_sr = np.stack([
+        sharpe_from_moments(window_moments(np.asarray(pnl[run_id]), train_bounds), trading_days_in_year)
+        for run_id in run_ids
+    ], axis=1)
+
+    finite_sr = np.where(np.isfinite(train_sr), train_sr, -np.inf)
+    choices = np.where(np.isfinite(train_sr).any(axis=1), np.asarray(run_ids)[finite_sr.argmax(axis=1)], -1)
+
+    oos_pnl = np.full(store.block_shape, np.nan)
+    for (_, _, test_start, test_end), window_choices in zip(windows, choices):
+        for run_id in np.unique(window_choices[window_choices >= 0]):
+            columns = np.flatnonzero(window_choices == run_id)
+            oos_pnl[test_start:test_end, columns] = pnl[run_id, test_start:test_end][:, columns]
+
+    index = store.index
+    window_frame = pd.DataFrame([
+        (index[train_start], index[train_end - 1], index[test_start], index[test_end - 1])
+        for train_start, train_end, test_start, test_end in windows
+    ], columns=WINDOW_COLUMNS)
+    return WalkForwardResult(
+        window_frame,
+        pd.DataFrame(choices, columns=store.symbols),
+        train_sr,
+        store.runs().loc[run_ids],
+        pd.DataFrame(oos_pnl, index=index, columns=store.symbols)
+    )
+
+
+def walk_forward(price_frame, lookback_pairs, rebalance_thresholds, account_balance, ann_perc_risk_target,
+                 train_bars, test_bars, store_dir, trading_days_in_year=365, step=None, anchored=False,
+                 start_bar=0, **sweep_kwargs):
+    """Walk-forward optimization of the EMAC lookbacks and rebalance threshold
+
+    The sweep runs once over the full history on a process pool, each
+    worker reuses a symbol chunk's EWMs for every parameter set, then all
+    windows are evaluated on the stored pnl. An existing store holding
+    every parameter set is reused, so trying other window lengths costs no
+    backtests at all.
+
+    Args:
+        store_dir (str): ResultStore of the sweep
+        sweep_kwargs: Passed to run_sweep_to_store, e.g. max_workers
+
+    Returns:
+        WalkForwardResult
+
+    Raises:
+        ValueError: If the store holds only part of the parameter sets
+    """
+    store = ResultStore(store_dir, index=price_frame.index, symbols=price_frame.columns)
+    if store.symbols != list(price_frame.columns) or not store.index.equals(price_frame.index):
+        raise ValueError(f"Result store '{store_dir}' holds runs of a different universe")
+
+    parameter_sets = [
+        {'fast_lookback': fast_lookback, 'slow_lookback': slow_lookback, 'rebalance_threshold': threshold}
+        for fast_lookback, slow_lookback in lookback_pairs for threshold in rebalance_thresholds
+    ]
+    stored = [params for params in parameter_sets if len(store) and store.select(**params)]
+    if not stored:
+        store = run_sweep_to_store(
+            price_frame, lookback_pairs, rebalance_thresholds, account_balance, ann_perc_risk_target, store_dir,
+            trading_days_in_year=trading_days_in_year, **sweep_kwargs
+        )
+    elif len(stored) != len(parameter_sets):
+        raise ValueError(
+            f"Result store '{store_dir}' holds {len(stored)} of {len(parameter_sets)} parameter sets, "
+            f"use an empty store directory"
+        )
+    # the store may hold other sweeps too, only choose among this grid
+    run_ids = [store.select(**params)[0] for params in parameter_sets]
+
+    return walk_forward_from_store(
+        store, train_bars, test_bars, trading_days_in_year, step, anchored, start_bar, run_ids
+    )
+
+
+if __name__ == "__main__":
+    from data_sources import DBStore
+    from data_sources import PriceReader
+
+    trading_frequency = '1D'
+    db_store = DBStore()
+    db_reader = PriceReader(db_store, index_column=0, price_column=1)
+    price_frame = db_reader.fetch_price_frame(db_store.fetch_symbols(), trading_frequency)
+
+    result = walk_forward(
+        price_frame,
+        emac_lookback_grid([4, 8, 16, 32, 64], slow_multipliers=(4,)),
+        rebalance_thresholds=[0.05, 0.10, 0.20],
+        account_balance=10_000,
+        ann_perc_risk_target=0.20,
+        train_bars=3 * 365,
+        test_bars=365,
+        store_dir='.walk_forward_store',
+        start_bar=2 * 365  # forecast scaler warm up
+    )
+    print(result.chosen_parameters('fast_lookback'))
+    print(result.sharpe_ratio(trading_days_in_year=365).sort_values(ascending=False))